@@ -16,11 +16,12 @@ from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.interval import IntervalTrigger
 
-from .schemas import ScrapeTriggerRequest, ScrapeTriggerResponse, ScrapeJob
+from .schemas import ScrapeTriggerRequest, ScrapeTriggerResponse, ScrapeJob, SOURCES
 from core.runner import run_scrape_job
 from core.database import init_db_manager, get_db_manager
 from core.geocoding import bulk_geocode, geocode_address
-from core.ruian_service import lookup_ruian_address, bulk_ruian_lookup
+from core.ruian_service import lookup_ruian_address, bulk_ruian_lookup, close_http_client as close_ruian_client
+from core.utils import shutdown_parse_pool
 from core import notifications
 
 logger = logging.getLogger(__name__)
@@ -43,7 +44,9 @@ async def _scheduled_scrape_all(full_rescan: bool = False) -> None:
             rows = await conn.fetch(
                 "SELECT code FROM re_realestate.sources WHERE is_active = true ORDER BY code"
             )
-        source_codes = [r["code"] for r in rows]
+        # Jen zdroje, pro které existuje scraper – jinak by neznámý kód z DB
+        # shodil validaci ScrapeTriggerRequest a celý naplánovaný job
+        source_codes = [r["code"] for r in rows if r["code"] in SOURCES]
 
         if not source_codes:
             logger.warning("[Scheduler] Žádné aktivní zdroje k scrapování")
@@ -172,6 +175,8 @@ async def lifespan(app: FastAPI):
         if _scheduler and _scheduler.running:
             _scheduler.shutdown(wait=False)
             logger.info("✓ Scheduler zastaven")
+        await close_ruian_client()
+        shutdown_parse_pool()
         db_manager = get_db_manager()
         await db_manager.disconnect()
         logger.info("✓ Database disconnected")
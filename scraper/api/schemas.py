@@ -1,15 +1,37 @@
 """
 Pydantic schemas for scraper API.
 """
+from enum import StrEnum
 from typing import List, Optional
 from pydantic import BaseModel
 from uuid import UUID
 from datetime import datetime
 
 
+class Source(StrEnum):
+    """Kódy podporovaných zdrojů (odpovídají re_realestate.sources.code)."""
+    REMAX = "REMAX"
+    MMR = "MMR"
+    PRODEJMETO = "PRODEJMETO"
+    ZNOJMOREALITY = "ZNOJMOREALITY"
+    SREALITY = "SREALITY"
+    IDNES = "IDNES"
+    NEMZNOJMO = "NEMZNOJMO"
+    HVREALITY = "HVREALITY"
+    PREMIAREALITY = "PREMIAREALITY"
+    DELUXREALITY = "DELUXREALITY"
+    LEXAMO = "LEXAMO"
+    CENTURY21 = "CENTURY21"
+    REAS = "REAS"
+    BAZOS = "BAZOS"
+
+
+SOURCES: frozenset[Source] = frozenset(Source)
+
+
 class ScrapeTriggerRequest(BaseModel):
     """Request to trigger a scraping job."""
-    source_codes: Optional[List[str]] = None  # ["REMAX", "MMR"]
+    source_codes: Optional[List[Source]] = None  # ["REMAX", "MMR"] – neznámý kód → 422
     full_rescan: bool = False
 
 
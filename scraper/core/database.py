@@ -8,9 +8,9 @@ import asyncpg
 import httpx
 import logging
 from pathlib import Path
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Set, Tuple
 from uuid import UUID, uuid4
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, UTC
 from contextlib import asynccontextmanager
 
 # Cesta k lokálnímu úložišti fotek (sdílený volume s .NET API)
@@ -89,6 +89,100 @@ def _enrich_listing_fields(data: Dict[str, Any]) -> None:
 
 logger = logging.getLogger(__name__)
 
+# Mapování českých hodnot na enum hodnoty v DB
+_PROPERTY_TYPE_DB_MAP = {
+    # České hodnoty (většina scraperů)
+    "Dům": "House",
+    "Byt": "Apartment",
+    "Pozemek": "Land",
+    "Chata": "Cottage",
+    "Komerční": "Commercial",
+    "Průmyslový": "Industrial",
+    "Garáž": "Garage",
+    "Ostatní": "Other",
+    # Anglické passthrough (REAS a budoucí scrapery)
+    "House": "House",
+    "Apartment": "Apartment",
+    "Land": "Land",
+    "Cottage": "Cottage",
+    "Commercial": "Commercial",
+    "Industrial": "Industrial",
+    "Garage": "Garage",
+    "Other": "Other",
+}
+
+_OFFER_TYPE_DB_MAP = {
+    # České hodnoty
+    "Prodej": "Sale",
+    "Pronájem": "Rent",
+    "Dražba": "Auction",
+    # Anglické passthrough (REAS a budoucí scrapery)
+    "Sale": "Sale",
+    "Rent": "Rent",
+    "Auction": "Auction",
+}
+
+_UPSERT_LISTING_SQL = """
+    INSERT INTO re_realestate.listings (
+        id, source_id, source_code, source_name, external_id, url,
+        title, description, property_type, offer_type, price,
+        location_text, area_built_up, area_land,
+        disposition, rooms, condition, construction_type,
+        latitude, longitude, geocoded_at, geocode_source,
+        view_count, date_created_source,
+        first_seen_at, last_seen_at, is_active,
+        etag, last_modified
+    )
+    VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14,
+            $15, $16, $17, $18, $19, $20, $21, $22, $23, $24, $25, $26, true,
+            $27, $28)
+    ON CONFLICT (source_id, external_id) DO UPDATE
+    SET
+        url               = EXCLUDED.url,
+        title             = EXCLUDED.title,
+        description       = EXCLUDED.description,
+        property_type     = EXCLUDED.property_type,
+        offer_type        = EXCLUDED.offer_type,
+        price             = EXCLUDED.price,
+        location_text     = EXCLUDED.location_text,
+        area_built_up     = EXCLUDED.area_built_up,
+        area_land         = EXCLUDED.area_land,
+        disposition       = COALESCE(EXCLUDED.disposition, re_realestate.listings.disposition),
+        rooms             = COALESCE(EXCLUDED.rooms,       re_realestate.listings.rooms),
+        condition         = COALESCE(EXCLUDED.condition,   re_realestate.listings.condition),
+        construction_type = COALESCE(EXCLUDED.construction_type, re_realestate.listings.construction_type),
+        latitude = COALESCE(EXCLUDED.latitude, re_realestate.listings.latitude),
+        longitude = COALESCE(EXCLUDED.longitude, re_realestate.listings.longitude),
+        geocoded_at = CASE
+            WHEN EXCLUDED.latitude IS NOT NULL THEN EXCLUDED.geocoded_at
+            ELSE re_realestate.listings.geocoded_at
+        END,
+        geocode_source = CASE
+            WHEN EXCLUDED.latitude IS NOT NULL THEN EXCLUDED.geocode_source
+            ELSE re_realestate.listings.geocode_source
+        END,
+        view_count          = COALESCE(EXCLUDED.view_count, re_realestate.listings.view_count),
+        date_created_source = COALESCE(re_realestate.listings.date_created_source, EXCLUDED.date_created_source),
+        last_seen_at = EXCLUDED.last_seen_at,
+        is_active    = true,
+        etag          = COALESCE(EXCLUDED.etag, re_realestate.listings.etag),
+        last_modified = COALESCE(EXCLUDED.last_modified, re_realestate.listings.last_modified)
+    RETURNING id
+"""
+
+_INSERT_PRICE_HISTORY_SQL = """
+    INSERT INTO re_realestate.listing_price_history (listing_id, price, recorded_at, source)
+    VALUES ($1, $2, $3, 'scraper')
+"""
+
+# Klíče (source_id, external_id) dávky → id + aktuální cena
+_SELECT_LISTING_KEYS_SQL = """
+    SELECT l.id, l.source_id, l.external_id, l.price
+    FROM re_realestate.listings l
+    JOIN unnest($1::uuid[], $2::text[]) AS k(source_id, external_id)
+      ON l.source_id = k.source_id AND l.external_id = k.external_id
+"""
+
 
 class DatabaseManager:
     """Manages PostgreSQL connection pool for scraper."""
@@ -163,7 +257,7 @@ class DatabaseManager:
         # 🔥 Kontrola cache
         if source_code in self._source_cache:
             cached_data, cached_at = self._source_cache[source_code]
-            if datetime.utcnow() - cached_at < self._cache_ttl:
+            if datetime.now(UTC) - cached_at < self._cache_ttl:
                 logger.debug(f"Cache HIT for source {source_code}")
                 return cached_data
             else:
@@ -184,29 +278,17 @@ class DatabaseManager:
             if row:
                 data = dict(row)
                 # 🔥 Ulož do cache
-                self._source_cache[source_code] = (data, datetime.utcnow())
+                self._source_cache[source_code] = (data, datetime.now(UTC))
                 logger.debug(f"Cache STORE for source {source_code}")
                 return data
             return None
     
-    async def upsert_listing(self, listing_data: Dict[str, Any]) -> Optional[UUID]:
+    async def _prepare_listing_row(self, listing_data: Dict[str, Any], now: datetime) -> Optional[tuple]:
         """
-        Upsert listing do databáze (atomicky bez race condition).
-        
-        Pokud listing s daným (source_id, external_id) již existuje, aktualizuje ho.
-        Pokud neexistuje, vytvoří nový.
-        
-        Používá PostgreSQL ON CONFLICT DO UPDATE pattern - je atomická a bezpečná
-        i při souběžných insertů se stejným external_id.
-        
-        Kontroluje searchovací filtry - pokud inzerát nedodpovídá kritériím,
-        nebude vložen do DB.
-        
-        Args:
-            listing_data: Dictionary s daty listingu
-            
+        Obohatí listing, aplikuje filtry a sestaví argumenty pro _UPSERT_LISTING_SQL.
+
         Returns:
-            UUID listingu (nového nebo existujícího) nebo None pokud je vyloučen filtry
+            Tuple argumentů ($1..$28) nebo None pokud je listing vyloučen filtry
         """
         # Doplň chybějící sémantická pole regex extrakcí
         _enrich_listing_fields(listing_data)
@@ -214,60 +296,102 @@ class DatabaseManager:
         # 🔥 Kontrola filtrů
         filter_mgr = get_filter_manager()
         should_include, exclusion_reason = filter_mgr.should_include_listing(listing_data)
-        
+
         if not should_include:
             filter_mgr.log_listing_decision(listing_data, False, exclusion_reason)
             logger.debug(f"Skipped listing due to filter: {exclusion_reason}")
             return None
-        
+
         # Získej source_id podle source_code
         source = await self.get_source_by_code(listing_data["source_code"])
         if not source:
             raise ValueError(f"Source '{listing_data['source_code']}' not found in database")
+
+        property_type_db = _PROPERTY_TYPE_DB_MAP.get(listing_data.get("property_type", "Ostatní"), "Other")
+        offer_type_db = _OFFER_TYPE_DB_MAP.get(listing_data.get("offer_type", "Prodej"), "Sale")
+        geocoded = listing_data.get("latitude") is not None
+
+        return (
+            uuid4(),
+            source["id"],
+            listing_data["source_code"],
+            source["name"],
+            listing_data.get("external_id"),
+            listing_data.get("url", ""),
+            listing_data.get("title", "")[:200],
+            listing_data.get("description", "")[:5000],
+            property_type_db,
+            offer_type_db,
+            listing_data.get("price"),
+            listing_data.get("location_text", "")[:200],
+            listing_data.get("area_built_up"),
+            listing_data.get("area_land"),
+            listing_data.get("disposition"),
+            listing_data.get("rooms"),
+            listing_data.get("condition"),
+            listing_data.get("construction_type"),
+            listing_data.get("latitude"),
+            listing_data.get("longitude"),
+            now if geocoded else None,
+            listing_data.get("geocode_source", "scraper") if geocoded else None,
+            listing_data.get("view_count"),
+            listing_data.get("date_created_source"),
+            now,
+            now,
+            listing_data.get("etag"),
+            listing_data.get("last_modified"),
+        )
+
+    @staticmethod
+    def _price_history_row(
+        listing_id: UUID,
+        listing_data: Dict[str, Any],
+        old_price: Any,
+        now: datetime,
+    ) -> Optional[tuple]:
+        """
+        Vrátí řádek pro listing_price_history (listing_id, price, recorded_at),
+        pokud jde o první cenu nebo změnu ceny; jinak None. Změnu ceny zaloguje.
+        """
+        new_price = listing_data.get("price")
+        # Log při první ceně (nový listing) NEBO při změně ceny
+        if new_price is None or (old_price is not None and old_price == new_price):
+            return None
+        if old_price is not None:
+            diff_pct = round((float(new_price) - float(old_price)) / float(old_price) * 100, 1)
+            direction = "⬇" if new_price < old_price else "⬆"
+            logger.info(
+                f"Price change {direction} {direction}: {listing_data.get('source_code')} "
+                f"{listing_data.get('external_id')}: {old_price:,.0f} → {new_price:,.0f} Kč ({diff_pct:+.1f}%)"
+            )
+        return (listing_id, new_price, now)
+
+    async def upsert_listing(self, listing_data: Dict[str, Any]) -> Optional[UUID]:
+        """
+        Upsert listing do databáze (atomicky bez race condition).
         
-        source_id = source["id"]
-        source_name = source["name"]
-        external_id = listing_data.get("external_id")
-        listing_id = uuid4()
-        
-        # Mapování českých hodnot na enum hodnoty v DB
-        property_type_map = {
-            # České hodnoty (většina scraperů)
-            "Dům": "House",
-            "Byt": "Apartment",
-            "Pozemek": "Land",
-            "Chata": "Cottage",
-            "Komerční": "Commercial",
-            "Průmyslový": "Industrial",
-            "Garáž": "Garage",
-            "Ostatní": "Other",
-            # Anglické passthrough (REAS a budoucí scrapery)
-            "House": "House",
-            "Apartment": "Apartment",
-            "Land": "Land",
-            "Cottage": "Cottage",
-            "Commercial": "Commercial",
-            "Industrial": "Industrial",
-            "Garage": "Garage",
-            "Other": "Other",
-        }
-        
-        offer_type_map = {
-            # České hodnoty
-            "Prodej": "Sale",
-            "Pronájem": "Rent",
-            "Dražba": "Auction",
-            # Anglické passthrough (REAS a budoucí scrapery)
-            "Sale": "Sale",
-            "Rent": "Rent",
-            "Auction": "Auction",
-        }
+        Pokud listing s daným (source_id, external_id) již existuje, aktualizuje ho.
+        Pokud neexistuje, vytvoří nový.
         
-        property_type_db = property_type_map.get(listing_data.get("property_type", "Ostatní"), "Other")
-        offer_type_db = offer_type_map.get(listing_data.get("offer_type", "Prodej"), "Sale")
+        Používá PostgreSQL ON CONFLICT DO UPDATE pattern - je atomická a bezpečná
+        i při souběžných insertů se stejným external_id.
         
-        now = datetime.utcnow()
+        Kontroluje searchovací filtry - pokud inzerát nedodpovídá kritériím,
+        nebude vložen do DB.
         
+        Args:
+            listing_data: Dictionary s daty listingu
+            
+        Returns:
+            UUID listingu (nového nebo existujícího) nebo None pokud je vyloučen filtry
+        """
+        now = datetime.now(UTC)
+        row = await self._prepare_listing_row(listing_data, now)
+        if row is None:
+            return None
+
+        listing_id, source_id, external_id = row[0], row[1], row[4]
+
         async with self.acquire() as conn:
             # 🔥 Načti stávající cenu před upsertem – pro detekci změny ceny
             old_price = await conn.fetchval(
@@ -277,100 +401,15 @@ class DatabaseManager:
 
             # 🔥 ATOMIC UPSERT s ON CONFLICT DO UPDATE
             # Žádné race conditions - DB se postará o atomicitu
-            result = await conn.fetchval(
-                """
-                INSERT INTO re_realestate.listings (
-                    id, source_id, source_code, source_name, external_id, url,
-                    title, description, property_type, offer_type, price,
-                    location_text, area_built_up, area_land,
-                    disposition, rooms, condition, construction_type,
-                    latitude, longitude, geocoded_at, geocode_source,
-                    view_count, date_created_source,
-                    first_seen_at, last_seen_at, is_active
-                )
-                VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14,
-                        $15, $16, $17, $18, $19, $20, $21, $22, $23, $24, $25, $26, true)
-                ON CONFLICT (source_id, external_id) DO UPDATE
-                SET
-                    url               = EXCLUDED.url,
-                    title             = EXCLUDED.title,
-                    description       = EXCLUDED.description,
-                    property_type     = EXCLUDED.property_type,
-                    offer_type        = EXCLUDED.offer_type,
-                    price             = EXCLUDED.price,
-                    location_text     = EXCLUDED.location_text,
-                    area_built_up     = EXCLUDED.area_built_up,
-                    area_land         = EXCLUDED.area_land,
-                    disposition       = COALESCE(EXCLUDED.disposition, re_realestate.listings.disposition),
-                    rooms             = COALESCE(EXCLUDED.rooms,       re_realestate.listings.rooms),
-                    condition         = COALESCE(EXCLUDED.condition,   re_realestate.listings.condition),
-                    construction_type = COALESCE(EXCLUDED.construction_type, re_realestate.listings.construction_type),
-                    latitude = COALESCE(EXCLUDED.latitude, re_realestate.listings.latitude),
-                    longitude = COALESCE(EXCLUDED.longitude, re_realestate.listings.longitude),
-                    geocoded_at = CASE
-                        WHEN EXCLUDED.latitude IS NOT NULL THEN EXCLUDED.geocoded_at
-                        ELSE re_realestate.listings.geocoded_at
-                    END,
-                    geocode_source = CASE
-                        WHEN EXCLUDED.latitude IS NOT NULL THEN EXCLUDED.geocode_source
-                        ELSE re_realestate.listings.geocode_source
-                    END,
-                    view_count          = COALESCE(EXCLUDED.view_count, re_realestate.listings.view_count),
-                    date_created_source = COALESCE(re_realestate.listings.date_created_source, EXCLUDED.date_created_source),
-                    last_seen_at = EXCLUDED.last_seen_at,
-                    is_active    = true
-                RETURNING id
-                """,
-                listing_id,
-                source_id,
-                listing_data["source_code"],
-                source_name,
-                external_id,
-                listing_data.get("url", ""),
-                listing_data.get("title", "")[:200],
-                listing_data.get("description", "")[:5000],
-                property_type_db,
-                offer_type_db,
-                listing_data.get("price"),
-                listing_data.get("location_text", "")[:200],
-                listing_data.get("area_built_up"),
-                listing_data.get("area_land"),
-                listing_data.get("disposition"),
-                listing_data.get("rooms"),
-                listing_data.get("condition"),
-                listing_data.get("construction_type"),
-                listing_data.get("latitude"),
-                listing_data.get("longitude"),
-                now if listing_data.get("latitude") is not None else None,
-                listing_data.get("geocode_source", "scraper") if listing_data.get("latitude") is not None else None,
-                listing_data.get("view_count"),
-                listing_data.get("date_created_source"),
-                now,
-                now
-            )
+            result = await conn.fetchval(_UPSERT_LISTING_SQL, *row)
             
             # Pokud UPDATE navrátil existující ID, použij to
             final_listing_id = result if result else listing_id
 
             # 🔥 Zaloguj změnu ceny do price_history
-            new_price = listing_data.get("price")
-            if new_price is not None:
-                # Log při první ceně (nový listing) NEBO při změně ceny
-                if old_price is None or old_price != new_price:
-                    await conn.execute(
-                        """
-                        INSERT INTO re_realestate.listing_price_history (listing_id, price, recorded_at, source)
-                        VALUES ($1, $2, $3, 'scraper')
-                        """,
-                        final_listing_id, new_price, now
-                    )
-                    if old_price is not None and old_price != new_price:
-                        diff_pct = round((float(new_price) - float(old_price)) / float(old_price) * 100, 1)
-                        direction = "⬇" if new_price < old_price else "⬆"
-                        logger.info(
-                            f"Price change {direction} {direction}: {listing_data.get('source_code')} "
-                            f"{external_id}: {old_price:,.0f} → {new_price:,.0f} Kč ({diff_pct:+.1f}%)"
-                        )
+            history_row = self._price_history_row(final_listing_id, listing_data, old_price, now)
+            if history_row:
+                await conn.execute(_INSERT_PRICE_HISTORY_SQL, *history_row)
 
             # Synchronizuj fotky v transakci
             if "photos" in listing_data and listing_data["photos"]:
@@ -379,6 +418,91 @@ class DatabaseManager:
             logger.debug(f"Upserted listing {final_listing_id} (external_id={external_id})")
             return final_listing_id
 
+    async def upsert_listings_bulk(self, listings: List[Dict[str, Any]]) -> int:
+        """
+        Dávkový upsert listingů – stejná sémantika jako upsert_listing(), ale
+        s konstantním počtem round-tripů na dávku místo tří na každý listing:
+        jeden SELECT starých cen, jeden executemany upsertu, jeden SELECT id
+        a jeden executemany do price_history. Fotky se synchronizují per listing.
+
+        Duplicitní (source_code, external_id) v dávce – vyhrává poslední výskyt.
+        Vadný listing neshodí celou dávku: chyba při sestavení řádku se zaloguje
+        a listing přeskočí; selže-li executemany, upsert se zopakuje po řádcích.
+
+        Args:
+            listings: Seznam dictů s daty listingů
+
+        Returns:
+            Počet upsertovaných listingů (bez vyloučených filtry a vadných řádků)
+        """
+        now = datetime.now(UTC)
+        prepared: Dict[tuple, tuple] = {}
+        for listing_data in listings:
+            try:
+                row = await self._prepare_listing_row(listing_data, now)
+            except Exception as e:
+                logger.error(
+                    f"Skipping listing {listing_data.get('source_code')} "
+                    f"{listing_data.get('external_id')}: {e}"
+                )
+                continue
+            if row is not None:
+                prepared[(row[1], row[4])] = (row, listing_data)
+
+        if not prepared:
+            return 0
+
+        source_ids = [key[0] for key in prepared]
+        external_ids = [key[1] for key in prepared]
+
+        async with self.acquire() as conn:
+            # 🔥 Ceny + id existujících listingů jedním dotazem (pro detekci změny ceny)
+            old_prices = {
+                (r["source_id"], r["external_id"]): r["price"]
+                for r in await conn.fetch(_SELECT_LISTING_KEYS_SQL, source_ids, external_ids)
+            }
+
+            try:
+                async with conn.transaction():
+                    await conn.executemany(_UPSERT_LISTING_SQL, [row for row, _ in prepared.values()])
+            except (asyncpg.PostgresError, ValueError) as e:
+                # Jeden vadný řádek by jinak zahodil celou dávku – zopakuj upsert po řádcích
+                logger.warning(f"Bulk upsert of {len(prepared)} listings failed ({e}), retrying row by row")
+                for key, (row, listing_data) in list(prepared.items()):
+                    try:
+                        await conn.execute(_UPSERT_LISTING_SQL, *row)
+                    except (asyncpg.PostgresError, ValueError) as row_error:
+                        logger.error(
+                            f"Upsert failed for {listing_data.get('source_code')} {key[1]}: {row_error}"
+                        )
+                        del prepared[key]
+                if not prepared:
+                    return 0
+
+            # executemany nevrací RETURNING – finální id (nové i existující) dočteme jedním dotazem
+            listing_ids = {
+                (r["source_id"], r["external_id"]): r["id"]
+                for r in await conn.fetch(_SELECT_LISTING_KEYS_SQL, source_ids, external_ids)
+            }
+
+            history_rows = []
+            for key, (row, listing_data) in prepared.items():
+                history_row = self._price_history_row(
+                    listing_ids.get(key, row[0]), listing_data, old_prices.get(key), now
+                )
+                if history_row:
+                    history_rows.append(history_row)
+            if history_rows:
+                await conn.executemany(_INSERT_PRICE_HISTORY_SQL, history_rows)
+
+            # Synchronizuj fotky (vlastní transakce + inline download per listing)
+            for key, (row, listing_data) in prepared.items():
+                if listing_data.get("photos"):
+                    await self._upsert_photos(conn, listing_ids.get(key, row[0]), listing_data["photos"])
+
+        logger.debug(f"Bulk upserted {len(prepared)} listings")
+        return len(prepared)
+
     async def deactivate_listing(self, source_code: str, external_id: str) -> bool:
         """
         Okamžitě deaktivuje konkrétní inzerát (source_code + external_id).
@@ -428,6 +552,69 @@ class DatabaseManager:
                 logger.info(f"Deactivated {deactivated} expired listings for source {source_code} (not seen since {seen_since})")
             return deactivated
 
+    async def get_known_external_ids(self, source_code: str) -> Set[str]:
+        """
+        Vrátí external_id aktivních inzerátů zdroje.
+        Inkrementální scrape podle nich přeskočí detaily, které už v DB jsou.
+        """
+        async with self.acquire() as conn:
+            rows = await conn.fetch(
+                """
+                SELECT external_id
+                FROM re_realestate.listings
+                WHERE source_code = $1
+                  AND is_active = true
+                """,
+                source_code
+            )
+        return {row["external_id"] for row in rows}
+
+    async def get_http_validators(self, source_code: str) -> Dict[str, Tuple[Optional[str], Optional[str]]]:
+        """
+        Vrátí ETag / Last-Modified uložené u aktivních inzerátů zdroje.
+        Scraper je posílá jako If-None-Match / If-Modified-Since – nezměněný
+        detail pak server vrátí jako 304 bez těla.
+
+        Returns: {external_id: (etag, last_modified)}
+        """
+        async with self.acquire() as conn:
+            rows = await conn.fetch(
+                """
+                SELECT external_id, etag, last_modified
+                FROM re_realestate.listings
+                WHERE source_code = $1
+                  AND is_active = true
+                  AND (etag IS NOT NULL OR last_modified IS NOT NULL)
+                """,
+                source_code
+            )
+        return {row["external_id"]: (row["etag"], row["last_modified"]) for row in rows}
+
+    async def touch_listings_seen(self, source_code: str, external_ids: List[str]) -> int:
+        """
+        Posune last_seen_at u inzerátů, které scraper viděl, ale neupsertoval
+        (např. detail vrátil 304 Not Modified). Bez toho by je
+        deactivate_unseen_listings() po full_rescan deaktivoval.
+
+        Returns: počet aktualizovaných inzerátů
+        """
+        if not external_ids:
+            return 0
+        async with self.acquire() as conn:
+            status = await conn.execute(
+                """
+                UPDATE re_realestate.listings
+                SET last_seen_at = $3,
+                    is_active = true
+                WHERE source_code = $1
+                  AND external_id = ANY($2::text[])
+                """,
+                source_code,
+                external_ids,
+                datetime.now(UTC)
+            )
+        return int(status.split()[-1]) if status else 0
+
     async def _download_photo_to_storage(
         self,
         photo_url: str,
@@ -576,7 +763,7 @@ class DatabaseManager:
                         photo_url,
                         idx,
                         stored_url,
-                        datetime.utcnow(),
+                        datetime.now(UTC),
                     )
 
             # 3. DELETE fotek, které zmizely (ale JEN ty bez klasifikace)
@@ -620,7 +807,7 @@ class DatabaseManager:
                 full_rescan,
                 'Queued',
                 0,
-                datetime.utcnow()
+                datetime.now(UTC)
             )
             logger.info(f"Created scrape job {job_id} for sources: {source_codes}")
     
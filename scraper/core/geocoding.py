@@ -104,7 +104,7 @@ async def bulk_geocode(db_manager, batch_size: int = 50) -> int:
     Returns:
         Počet úspěšně geokódovaných inzerátů.
     """
-    from datetime import datetime
+    from datetime import datetime, UTC
 
     logger.info(f"Spouštím bulk geocoding (batch_size={batch_size})")
     success_count = 0
@@ -148,7 +148,7 @@ async def bulk_geocode(db_manager, batch_size: int = 50) -> int:
                         geocode_source = 'nominatim'
                     WHERE id = $4
                     """,
-                    lat, lon, datetime.utcnow(), row["id"]
+                    lat, lon, datetime.now(UTC), row["id"]
                 )
             success_count += 1
             logger.debug(f"Geokódován inzerát {row['id']}: ({lat}, {lon})")
@@ -10,7 +10,11 @@ Použití v scraperech:
         response.raise_for_status()
         return response.text
 """
+import asyncio
 import logging
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Optional
 
 import httpx
 from tenacity import (
@@ -44,3 +48,81 @@ http_retry = retry(
     before_sleep=before_sleep_log(logger, logging.WARNING),
     reraise=True,  # po 3 neúspěšných pokusech opětovně vyvolá výjimku
 )
+
+
+# ─── Rate limit ───────────────────────────────────────────────────────────────
+# Rovnoměrně rozestupuje requesty (max N za sekundu) napříč souběžnými tasky –
+# nahrazuje pevné asyncio.sleep() mezi requesty, souběžnost hlídá semafor.
+# Použití v scraperech:
+#     self._rate_limiter = RateLimiter(max_per_second=4)
+#     async with self._rate_limiter:
+#         response = await client.get(url)
+
+class RateLimiter:
+    """Async rate limiter – každý acquire dostane vlastní časový slot (1 / max_per_second)."""
+
+    def __init__(self, max_per_second: float) -> None:
+        self._interval = 1.0 / max_per_second
+        self._next_slot = 0.0
+
+    async def acquire(self) -> None:
+        # Slot se rezervuje synchronně (bez await) – žádný lock není potřeba
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self._interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def __aenter__(self) -> "RateLimiter":
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        pass
+
+
+# ─── Sdílený connection pool pro scrape job ──────────────────────────────────
+# Scrapery si dál tvoří vlastní AsyncClient (vlastní hlavičky, timeouty), ale
+# během jobu sdílí jeden transport = jeden HTTP/2 connection pool. Scrapery
+# mířící na stejné CDN (igluu, cloudinary…) tak recyklují spojení.
+# Použití v scraperech:
+#     httpx.AsyncClient(headers=HEADERS, transport=get_shared_transport())
+
+class _SharedTransport(httpx.AsyncBaseTransport):
+    """Transport, jehož zavření klientem nic nedělá – pool zavírá až shared_http_transport()."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport) -> None:
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._transport.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        pass
+
+
+_shared_transport: ContextVar[Optional[_SharedTransport]] = ContextVar("shared_transport", default=None)
+
+
+def get_shared_transport() -> Optional[httpx.AsyncBaseTransport]:
+    """Vrátí sdílený transport aktuálního jobu, nebo None (klient si vytvoří vlastní pool)."""
+    return _shared_transport.get()
+
+
+@asynccontextmanager
+async def shared_http_transport() -> AsyncIterator[httpx.AsyncBaseTransport]:
+    """
+    Otevře sdílený HTTP/2 connection pool pro všechny scrapery spuštěné uvnitř bloku.
+    Tasky vytvořené uvnitř bloku dědí transport přes contextvars.
+    """
+    transport = httpx.AsyncHTTPTransport(
+        http2=True,
+        limits=httpx.Limits(max_connections=200, max_keepalive_connections=100),
+    )
+    shared = _SharedTransport(transport)
+    token = _shared_transport.set(shared)
+    try:
+        yield shared
+    finally:
+        _shared_transport.reset(token)
+        await transport.aclose()
@@ -11,8 +11,10 @@ Rate limit: není explicitní, doporučuje se max 1 req/s.
 import asyncio
 import logging
 import re
+from collections import OrderedDict
 from typing import Optional
 import httpx
+import orjson
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +24,50 @@ RUIAN_FIND_URL = (
 )
 NAHLIZENIDOKN_BASE = "https://nahlizenidokn.cuzk.cz"
 
+# Odstraní přebytečné části adresy jako "okres XY", "kraj XY"
+_ADDR_STRIP_RE = re.compile(r",?\s*(okres|kraj|okr\.)\s+\S+", re.IGNORECASE)
+
+# Neměnné parametry find dotazu – per request se doplní jen searchText
+_FIND_PARAMS = {
+    "contains": "true",
+    "layers": "2",          # Layer 2 = Adresní místa v RUIAN MapServeru
+    "returnGeometry": "false",
+    "f": "json",
+}
+
+# LRU cache výsledků dle normalizovaného searchText – desítky inzerátů sdílí
+# stejnou obec (např. "Znojmo"), opakovaný dotaz tak nestojí HTTP ani 1s pauzu.
+# Chyby se necachují. Přístup bez await → v asyncio není potřeba zámek.
+_RUIAN_CACHE_MAX_SIZE = 1024
+_ruian_cache: "OrderedDict[str, dict]" = OrderedDict()
+
+# Sdílený klient: keep-alive + HTTP/2 multiplexing na jednom TCP spojení
+# místo nového handshake pro každý dotaz; gzip zmenšuje JSON odpovědi.
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    """Vrátí (a při prvním volání vytvoří) sdílený HTTP klient pro RUIAN."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            http2=True,
+            timeout=10.0,
+            headers={
+                "User-Agent": "RealEstateAggregator/1.0 (educational project)",
+                "Accept-Encoding": "gzip",
+            },
+        )
+    return _http_client
+
+
+async def close_http_client() -> None:
+    """Zavře sdílený HTTP klient (volá se při shutdownu API)."""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
 
 def build_cadastre_url(ruian_kod: Optional[int]) -> str:
     """Sestaví přímý odkaz na nahlížení.cuzk.cz pro dané adresní místo."""
@@ -53,20 +99,45 @@ async def lookup_ruian_address(
           raw_ruian       – surová odpověď RUIAN (dict)
           parcel_number   – None (dostupné jen přes placené API)
     """
+    result, _ = await _lookup_ruian_cached(address_text, municipality)
+    return result
+
+
+def _normalize_search_text(address_text: str, municipality: Optional[str]) -> str:
+    """Sestaví searchText pro RUIAN find – zároveň klíč cache."""
     # Preferuj obec jako vstup (kratší, přesnější)
     search_text = municipality.strip() if municipality else address_text.strip()
-    # Odstraň přebytečné části jako "okres XY", "kraj XY"
-    search_text = re.sub(r",?\s*(okres|kraj|okr\.)\s+\S+", "", search_text).strip()
-    # Zkrať na max 100 znaků
-    search_text = search_text[:100]
-
-    params = {
-        "searchText": search_text,
-        "contains": "true",
-        "layers": "2",          # Layer 2 = Adresní místa v RUIAN MapServeru
-        "returnGeometry": "false",
-        "f": "json",
-    }
+    # Odstraň přebytečné části jako "okres XY", "kraj XY" a zkrať na max 100 znaků
+    return _ADDR_STRIP_RE.sub("", search_text).strip()[:100]
+
+
+async def _lookup_ruian_cached(
+    address_text: str,
+    municipality: Optional[str] = None,
+) -> tuple[dict, bool]:
+    """
+    Jako lookup_ruian_address, navíc vrací příznak, zda výsledek pochází z cache
+    (bulk lookup pak nemusí čekat na rate limit).
+    """
+    search_text = _normalize_search_text(address_text, municipality)
+
+    cached = _ruian_cache.get(search_text)
+    if cached is not None:
+        _ruian_cache.move_to_end(search_text)
+        logger.debug("RUIAN lookup '%s' → cache hit", search_text)
+        return dict(cached), True
+
+    result = await _fetch_ruian(search_text)
+    if result["fetch_status"] != "error":
+        _ruian_cache[search_text] = result
+        if len(_ruian_cache) > _RUIAN_CACHE_MAX_SIZE:
+            _ruian_cache.popitem(last=False)
+    return dict(result), False
+
+
+async def _fetch_ruian(search_text: str) -> dict:
+    """Zavolá RUIAN find endpoint a vyhodnotí první výsledek."""
+    params = {**_FIND_PARAMS, "searchText": search_text}
 
     result = {
         "ruian_kod": None,
@@ -78,15 +149,12 @@ async def lookup_ruian_address(
     }
 
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(
-                RUIAN_FIND_URL,
-                params=params,
-                headers={"User-Agent": "RealEstateAggregator/1.0 (educational project)"},
-            )
-            response.raise_for_status()
-            data = response.json()
-            result["raw_ruian"] = data
+        response = await _get_http_client().get(RUIAN_FIND_URL, params=params)
+        logger.debug("RUIAN find '%s' přes %s", search_text, response.http_version)
+        response.raise_for_status()
+        # orjson dekóduje přímo bytes v C – bez mezikroku přes str a stdlib json
+        data = orjson.loads(response.content)
+        result["raw_ruian"] = data
 
         results_list = data.get("results", [])
         if not results_list:
@@ -124,6 +192,57 @@ async def lookup_ruian_address(
     return result
 
 
+_UPSERT_CHUNK_SIZE = 50
+_WRITER_IDLE_FLUSH_SECONDS = 5.0
+
+_UPSERT_CADASTRE_SQL = """
+    INSERT INTO re_realestate.listing_cadastre_data
+        (listing_id, address_searched, ruian_kod, cadastre_url,
+         fetch_status, raw_ruian, fetched_at)
+    VALUES ($1, $2, $3, $4, $5, $6::jsonb, NOW())
+    ON CONFLICT (listing_id) DO UPDATE SET
+        address_searched = EXCLUDED.address_searched,
+        ruian_kod        = EXCLUDED.ruian_kod,
+        cadastre_url     = EXCLUDED.cadastre_url,
+        fetch_status     = EXCLUDED.fetch_status,
+        raw_ruian        = EXCLUDED.raw_ruian,
+        fetched_at       = NOW()
+"""
+
+
+async def _cadastre_writer(db_manager, queue: "asyncio.Queue[Optional[tuple]]") -> None:
+    """
+    Jediný writer pro listing_cadastre_data.
+
+    Odebírá výsledky z fronty a zapisuje je po dávkách (executemany v transakci)
+    na jednom drženém spojení, zatímco producent dál volá RUIAN API – HTTP a DB
+    I/O se tak překrývají. Upsert je připraven (prepare) jednou pro celý běh,
+    každý řádek je pak jen bind + execute. Konec signalizuje None ve frontě.
+    """
+    batch: list[tuple] = []
+    finished = False
+
+    async with db_manager.acquire() as conn:
+        upsert_stmt = await conn.prepare(_UPSERT_CADASTRE_SQL)
+        while not finished:
+            idle = False
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout=_WRITER_IDLE_FLUSH_SECONDS)
+            except asyncio.TimeoutError:
+                idle = True
+            else:
+                if item is None:
+                    finished = True
+                else:
+                    batch.append(item)
+
+            # Flush při plné dávce, na konci nebo když producent delší dobu nic nedodal
+            if batch and (finished or idle or len(batch) >= _UPSERT_CHUNK_SIZE):
+                async with conn.transaction():
+                    await upsert_stmt.executemany(batch)
+                batch.clear()
+
+
 async def bulk_ruian_lookup(
     db_manager,
     batch_size: int = 50,
@@ -142,66 +261,65 @@ async def bulk_ruian_lookup(
     """
     stats = {"total": 0, "found": 0, "not_found": 0, "error": 0, "skipped": 0}
 
-    # Načti seznam inzerátů přes pool
+    # Načti seznam inzerátů přes pool – stavy, které se smí (znovu) zpracovat
     if overwrite_not_found:
-        status_filter = "('pending', 'not_found', 'error')"
+        retry_statuses = ["pending", "not_found", "error"]
     else:
-        status_filter = "('pending', 'error')"
+        retry_statuses = ["pending", "error"]
 
+    # LEFT JOIN anti-join: inzerát bez katastrálního záznamu, nebo se záznamem
+    # ve stavu k opakování. Stavy jako parametr pole → jeden SQL text (a plán)
+    # pro obě varianty místo f-stringu.
     async with db_manager.acquire() as conn:
         rows = await conn.fetch(
-            f"""
+            """
             SELECT l.id, l.location_text, l.municipality, l.district
             FROM re_realestate.listings l
+            LEFT JOIN re_realestate.listing_cadastre_data lcd
+                   ON lcd.listing_id = l.id
+                  AND lcd.fetch_status <> ALL($2::text[])
             WHERE l.is_active = true
-              AND NOT EXISTS (
-                  SELECT 1 FROM re_realestate.listing_cadastre_data lcd
-                  WHERE lcd.listing_id = l.id
-                    AND lcd.fetch_status NOT IN {status_filter}
-              )
+              AND lcd.listing_id IS NULL
             LIMIT $1
             """,
             batch_size,
+            retry_statuses,
         )
 
     logger.info("RUIAN bulk: %d inzerátů ke zpracování", len(rows))
     stats["total"] = len(rows)
 
-    for row in rows:
-        listing_id = row["id"]
-        location_text = row["location_text"] or ""
-        municipality = row["municipality"]
-
-        lookup = await lookup_ruian_address(location_text, municipality)
-
-        # Upsert do listing_cadastre_data – každý záznam samostatná transakce
-        async with db_manager.acquire() as conn:
-            await conn.execute(
-                """
-                INSERT INTO re_realestate.listing_cadastre_data
-                    (listing_id, address_searched, ruian_kod, cadastre_url,
-                     fetch_status, raw_ruian, fetched_at)
-                VALUES ($1, $2, $3, $4, $5, $6::jsonb, NOW())
-                ON CONFLICT (listing_id) DO UPDATE SET
-                    address_searched = EXCLUDED.address_searched,
-                    ruian_kod        = EXCLUDED.ruian_kod,
-                    cadastre_url     = EXCLUDED.cadastre_url,
-                    fetch_status     = EXCLUDED.fetch_status,
-                    raw_ruian        = EXCLUDED.raw_ruian,
-                    fetched_at       = NOW()
-                """,
-                listing_id,
+    # Producent (RUIAN HTTP) a writer (DB) běží souběžně – celkový čas je
+    # ≈ max(HTTP, DB) místo jejich součtu
+    queue: asyncio.Queue[Optional[tuple]] = asyncio.Queue(maxsize=_UPSERT_CHUNK_SIZE * 4)
+
+    async def _producer() -> None:
+        for row in rows:
+            location_text = row["location_text"] or ""
+            lookup, from_cache = await _lookup_ruian_cached(location_text, row["municipality"])
+
+            await queue.put((
+                row["id"],
                 lookup["address_used"],
                 lookup["ruian_kod"],
                 lookup["cadastre_url"],
                 lookup["fetch_status"],
-                str(lookup["raw_ruian"]) if lookup["raw_ruian"] else None,
-            )
-
-        stats[lookup["fetch_status"]] += 1
-
-        # Rate limiting – 1 req/s
-        await asyncio.sleep(1.0)
+                # str(dict) dává Python repr (apostrofy, None), ne validní JSON pro ::jsonb
+                orjson.dumps(lookup["raw_ruian"]).decode() if lookup["raw_ruian"] else None,
+            ))
+            stats[lookup["fetch_status"]] += 1
+
+            # Rate limiting – 1 req/s (jen pokud šel dotaz skutečně na RUIAN)
+            if not from_cache:
+                await asyncio.sleep(1.0)
+
+        await queue.put(None)
+
+    # TaskGroup zruší producenta, pokud writer selže (a naopak) – plná fronta
+    # tak nemůže producenta zablokovat navždy
+    async with asyncio.TaskGroup() as tg:
+        tg.create_task(_producer())
+        tg.create_task(_cadastre_writer(db_manager, queue))
 
     logger.info("RUIAN bulk hotovo: %s", stats)
     return stats
@@ -3,15 +3,21 @@ Job runner for scraping tasks.
 Orchestrates individual scrapers and manages job lifecycle.
 """
 import asyncio
+import functools
 import logging
+import os
+import time
 import yaml
 from pathlib import Path
-from typing import Optional, List, Dict, Any, Awaitable
+from collections import Counter
+from typing import Optional, List, Dict, Any, Awaitable, Callable, Tuple, Union
 from uuid import UUID
-from datetime import datetime
+from datetime import datetime, UTC
 
-from api.schemas import ScrapeTriggerRequest
+from api.schemas import ScrapeTriggerRequest, Source
 from core.database import get_db_manager
+from core.http_utils import shared_http_transport
+from core.scrapers import get_scraper
 from core import notifications
 
 logger = logging.getLogger(__name__)
@@ -19,22 +25,148 @@ logger = logging.getLogger(__name__)
 # Max runtime per scraper task – prevents one hung source from blocking the whole job.
 SCRAPER_TASK_TIMEOUT_SECONDS = 45 * 60
 
+# Max počet souběžně běžících scraperů v jednom jobu. Každý scraper má vlastní
+# HTTP klienta a sdílí asyncpg pool – bez limitu se pool i sockety vyčerpají.
+SCRAPER_CONCURRENCY = int(os.getenv("SCRAPER_CONCURRENCY", "4"))
+
+# factory(scraper_config) → instance scraperů pro daný zdroj (SREALITY jich vrací víc)
+ScraperFactory = Callable[[Dict[str, Any]], List[Any]]
+
+
+try:
+    # libyaml C parser – výrazně rychlejší než čistě Pythonový SafeLoader
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:  # PyYAML bez libyaml
+    from yaml import SafeLoader as _YamlLoader
+
+
+_SCRAPER_CONFIG_PATH = Path(__file__).parent.parent / "config" / "settings.yaml"
+
+
+@functools.lru_cache(maxsize=1)
+def _read_scraper_config() -> Dict[str, Any]:
+    """
+    Načte a naparsuje sekci scrapers ze settings.yaml.
+
+    Výsledek je cachován na úrovni procesu – settings.yaml se nečte a neparsuje
+    při každém jobu. Po změně configu zavolej _read_scraper_config.cache_clear().
+    Chyby propaguje: lru_cache výjimku necachuje, další job čtení zopakuje.
+    """
+    with open(_SCRAPER_CONFIG_PATH, "r") as f:
+        config = yaml.load(f, Loader=_YamlLoader)
+    return config.get("scrapers", {})
+
 
 def _load_scraper_config() -> Dict[str, Any]:
-    """Load scraper configuration from settings.yaml."""
-    config_path = Path(__file__).parent.parent / "config" / "settings.yaml"
-    
-    if not config_path.exists():
-        logger.warning(f"Config file not found: {config_path}, using defaults")
-        return {}
-    
+    """Load scraper configuration from settings.yaml; při chybě defaulty ({}), které se necachují."""
     try:
-        with open(config_path, "r") as f:
-            config = yaml.safe_load(f)
-        return config.get("scrapers", {})
+        return _read_scraper_config()
+    except FileNotFoundError:
+        logger.warning(f"Config file not found: {_SCRAPER_CONFIG_PATH}, using defaults")
     except Exception as exc:
         logger.error(f"Failed to load scraper config: {exc}")
-        return {}
+    return {}
+
+
+def _simple_factory(code: str, **kwargs: Any) -> ScraperFactory:
+    """Factory pro scrapery bez konfigurace ze settings.yaml."""
+    def factory(scraper_config: Dict[str, Any]) -> List[Any]:
+        return [get_scraper(code)(**kwargs)]
+    return factory
+
+
+def _mmreality_factory(scraper_config: Dict[str, Any]) -> List[Any]:
+    # 🔥 Get MMReality config from settings.yaml
+    mmreality_config = scraper_config.get("mmreality", {})
+    search_configs = mmreality_config.get("search_configs")
+    scraper_cls = get_scraper(Source.MMR)
+    return [scraper_cls(search_configs=search_configs)]
+
+
+def _sreality_factory(scraper_config: Dict[str, Any]) -> List[Any]:
+    # 🔥 Get SREALITY config from settings.yaml
+    sreality_config = scraper_config.get("sreality", {})
+    detail_fetch_concurrency = sreality_config.get("detail_fetch_concurrency", 5)
+    fetch_details = sreality_config.get("fetch_details", True)
+    locality_region_id = sreality_config.get("locality_region_id")
+    max_pages_incremental = sreality_config.get("max_pages_incremental", 5)
+
+    # Podpora více district IDs (locality_district_ids: [77, 79])
+    # s fallbackem na starý skalární locality_district_id: 77
+    district_ids: list = sreality_config.get("locality_district_ids") or []
+    if not district_ids:
+        single_id = sreality_config.get("locality_district_id")
+        if single_id is not None:
+            district_ids = [single_id]
+
+    # 🔥 Per-category scraping: každá kombinace district × category_main_cb
+    # má vlastní scraper instanci. Bez toho by jeden query na celý okres
+    # (všechny kategorie) vrátil 700+ výsledků a incremental (5 str. × 60 = 300)
+    # by domy na stránkách 6+ vynechal.
+    category_main_cbs: list = sreality_config.get("category_main_cbs") or [None]
+
+    # Bez filtru okresu – celá republika (fallback)
+    if not district_ids:
+        district_ids = [None]
+
+    scraper_cls = get_scraper(Source.SREALITY)
+    scrapers = []
+    for district_id in district_ids:
+        for cat_main in category_main_cbs:
+            logger.info(
+                f"Scheduling Sreality scraper "
+                f"district_id={district_id} category_main_cb={cat_main}"
+            )
+            scrapers.append(scraper_cls(
+                category_main_cb=cat_main,
+                fetch_details=fetch_details,
+                detail_fetch_concurrency=detail_fetch_concurrency,
+                locality_region_id=locality_region_id,
+                locality_district_id=district_id,
+                max_pages_incremental=max_pages_incremental,
+            ))
+    return scrapers
+
+
+# Registr zdrojů: kód → factory(scraper_config) vracející seznam instancí scraperu.
+# Pořadí odpovídá výchozímu pořadí scrapování, pokud request nespecifikuje zdroje.
+SCRAPER_REGISTRY: Dict[Source, ScraperFactory] = {
+    Source.REMAX: _simple_factory(Source.REMAX),
+    Source.MMR: _mmreality_factory,
+    Source.PRODEJMETO: _simple_factory(Source.PRODEJMETO),
+    Source.ZNOJMOREALITY: _simple_factory(Source.ZNOJMOREALITY),
+    Source.SREALITY: _sreality_factory,
+    Source.IDNES: _simple_factory(Source.IDNES),
+    Source.NEMZNOJMO: _simple_factory(Source.NEMZNOJMO),
+    Source.HVREALITY: _simple_factory(Source.HVREALITY),
+    Source.PREMIAREALITY: _simple_factory(Source.PREMIAREALITY),
+    Source.DELUXREALITY: _simple_factory(Source.DELUXREALITY),
+    Source.LEXAMO: _simple_factory(Source.LEXAMO),
+    Source.CENTURY21: _simple_factory(Source.CENTURY21),
+    Source.REAS: _simple_factory(Source.REAS, fetch_details=True, detail_concurrency=5),
+    Source.BAZOS: _simple_factory(Source.BAZOS),
+}
+
+
+async def _deactivate_unseen(
+    job_id: UUID,
+    source_name: str,
+    result: Union[int, Exception],
+    scrape_started_at: datetime,
+) -> None:
+    """Po full_rescan deaktivuje inzeráty zdroje, které scraper neviděl."""
+    db_manager = get_db_manager()
+    # ⚠️ OCHRANA: deaktivuj POUZE pokud scraper vrátil alespoň 1 inzerát.
+    # Pokud vrátí 0 nebo selže (síťová chyba, timeout), NESMÍME deaktivovat stávající
+    # inzeráty – způsobilo by to falešnou masovou deaktivaci celé DB.
+    if isinstance(result, Exception):
+        logger.warning(f"Job {job_id}: {source_name} failed during full_rescan – skipping deactivation")
+    elif result > 0:
+        deactivated = await db_manager.deactivate_unseen_listings(source_name, scrape_started_at)
+        if deactivated > 0:
+            logger.info(f"Job {job_id}: {source_name} deactivated {deactivated} expired listings")
+    else:
+        logger.warning(f"Job {job_id}: {source_name} returned 0 listings during full_rescan – skipping deactivation to prevent false mass-deactivation")
 
 
 async def run_scrape_job(job_id: UUID, request: ScrapeTriggerRequest) -> None:
@@ -53,238 +185,121 @@ async def run_scrape_job(job_id: UUID, request: ScrapeTriggerRequest) -> None:
     scraper_config = _load_scraper_config()
     
     try:
+        # Čas startu jobu – zároveň hranice pro deaktivaci neviděných inzerátů.
+        # Délka běhu se měří monotonic hodinami (imunní vůči NTP skokům).
+        scrape_started_at = datetime.now(UTC)
+        started_mono = time.monotonic()
+
         # Update status na Running
         await db_manager.update_scrape_job(
             job_id=job_id,
             status="Running",
-            started_at=datetime.utcnow(),
+            started_at=scrape_started_at,
             progress=0
         )
         
-        # Určit, které zdroje scrapovat
-        source_codes: List[str] = request.source_codes or [
-            "REMAX",
-            "MMR",
-            "PRODEJMETO",
-            "ZNOJMOREALITY",
-            "SREALITY",
-            "IDNES",
-            "NEMZNOJMO",
-            "HVREALITY",
-            "PREMIAREALITY",
-            "DELUXREALITY",
-            "LEXAMO",
-            "CENTURY21",
-            "REAS",
-            "BAZOS",
-        ]
-        
-        # Import scraperů až tady, aby byly lazy loaded
-        from core.scrapers.remax_scraper import RemaxScraper
-        from core.scrapers.mmreality_scraper import MmRealityScraper
-        from core.scrapers.prodejmeto_scraper import ProdejmeToScraper
-        from core.scrapers.sreality_scraper import SrealityScraper
-        from core.scrapers.znojmoreality_scraper import ZnojmoRealityScraper
-        from core.scrapers.idnes_reality_scraper import IdnesRealityScraper
-        from core.scrapers.nemovitostiznojmo_scraper import NemovitostiZnojmoScraper
-        from core.scrapers.hvreality_scraper import HvRealityScraper
-        from core.scrapers.premiareality_scraper import PremiaRealityScraper
-        from core.scrapers.deluxreality_scraper import DeluxRealityScraper
-        from core.scrapers.lexamo_scraper import LexamoScraper
-        from core.scrapers.century21_scraper import Century21Scraper
-        from core.scrapers.reas_scraper import ReasScraper
-        from core.scrapers.bazos_scraper import BazosScraper
+        # Určit, které zdroje scrapovat (pořadí zachováno, duplicity odstraněny).
+        # Kódy jsou validované už v ScrapeTriggerRequest (Source enum).
+        source_codes: List[Source] = list(dict.fromkeys(request.source_codes or SCRAPER_REGISTRY))
 
         # Vybuduj tasku pro paralelní scraping
         tasks = []
-        
-        if "REMAX" in source_codes:
-            logger.info(f"Job {job_id}: Scheduling REMAX scraper...")
-            scraper = RemaxScraper()
-            tasks.append(("REMAX", scraper.run(full_rescan=request.full_rescan)))
-
-        if "MMR" in source_codes:
-            logger.info(f"Job {job_id}: Scheduling MM Reality scraper...")
-            # 🔥 Get MMReality config from settings.yaml
-            mmreality_config = scraper_config.get("mmreality", {})
-            search_configs = mmreality_config.get("search_configs")
-            scraper = MmRealityScraper(search_configs=search_configs)
-            tasks.append(("MMR", scraper.run(full_rescan=request.full_rescan)))
-
-        if "PRODEJMETO" in source_codes:
-            logger.info(f"Job {job_id}: Scheduling Prodejme.to scraper...")
-            scraper = ProdejmeToScraper()
-            tasks.append(("PRODEJMETO", scraper.run(full_rescan=request.full_rescan)))
-
-        if "ZNOJMOREALITY" in source_codes:
-            logger.info(f"Job {job_id}: Scheduling Znojmo Reality scraper...")
-            scraper = ZnojmoRealityScraper()
-            tasks.append(("ZNOJMOREALITY", scraper.run(full_rescan=request.full_rescan)))
-
-        if "SREALITY" in source_codes:
-            logger.info(f"Job {job_id}: Scheduling Sreality scraper...")
-            # 🔥 Get SREALITY config from settings.yaml
-            sreality_config = scraper_config.get("sreality", {})
-            detail_fetch_concurrency = sreality_config.get("detail_fetch_concurrency", 5)
-            fetch_details = sreality_config.get("fetch_details", True)
-            locality_region_id = sreality_config.get("locality_region_id")
-            max_pages_incremental = sreality_config.get("max_pages_incremental", 5)
-
-            # Podpora více district IDs (locality_district_ids: [77, 79])
-            # s fallbackem na starý skalární locality_district_id: 77
-            district_ids: list = sreality_config.get("locality_district_ids") or []
-            if not district_ids:
-                single_id = sreality_config.get("locality_district_id")
-                if single_id is not None:
-                    district_ids = [single_id]
-
-            # 🔥 Per-category scraping: každá kombinace district × category_main_cb
-            # má vlastní scraper instanci. Bez toho by jeden query na celý okres
-            # (všechny kategorie) vrátil 700+ výsledků a incremental (5 str. × 60 = 300)
-            # by domy na stránkách 6+ vynechal.
-            category_main_cbs: list = sreality_config.get("category_main_cbs") or [None]
-
-            if district_ids:
-                for district_id in district_ids:
-                    for cat_main in category_main_cbs:
-                        logger.info(
-                            f"Job {job_id}: Scheduling Sreality scraper "
-                            f"district_id={district_id} category_main_cb={cat_main}"
-                        )
-                        scraper = SrealityScraper(
-                            category_main_cb=cat_main,
-                            fetch_details=fetch_details,
-                            detail_fetch_concurrency=detail_fetch_concurrency,
-                            locality_region_id=locality_region_id,
-                            locality_district_id=district_id,
-                            max_pages_incremental=max_pages_incremental,
-                        )
-                        tasks.append(("SREALITY", scraper.run(full_rescan=request.full_rescan)))
-            else:
-                # Bez filtru okresu – celá republika (fallback)
-                for cat_main in category_main_cbs:
-                    scraper = SrealityScraper(
-                        category_main_cb=cat_main,
-                        fetch_details=fetch_details,
-                        detail_fetch_concurrency=detail_fetch_concurrency,
-                        locality_region_id=locality_region_id,
-                        locality_district_id=None,
-                        max_pages_incremental=max_pages_incremental,
-                    )
-                    tasks.append(("SREALITY", scraper.run(full_rescan=request.full_rescan)))
-
-        if "IDNES" in source_codes:
-            logger.info(f"Job {job_id}: Scheduling Idnes Reality scraper...")
-            scraper = IdnesRealityScraper()
-            tasks.append(("IDNES", scraper.run(full_rescan=request.full_rescan)))
-
-        if "NEMZNOJMO" in source_codes:
-            logger.info(f"Job {job_id}: Scheduling Nemovitosti Znojmo scraper...")
-            scraper = NemovitostiZnojmoScraper()
-            tasks.append(("NEMZNOJMO", scraper.run(full_rescan=request.full_rescan)))
-
-        if "HVREALITY" in source_codes:
-            logger.info(f"Job {job_id}: Scheduling HV Reality scraper...")
-            scraper = HvRealityScraper()
-            tasks.append(("HVREALITY", scraper.run(full_rescan=request.full_rescan)))
-
-        if "PREMIAREALITY" in source_codes:
-            logger.info(f"Job {job_id}: Scheduling PREMIA Reality scraper...")
-            scraper = PremiaRealityScraper()
-            tasks.append(("PREMIAREALITY", scraper.run(full_rescan=request.full_rescan)))
-
-        if "DELUXREALITY" in source_codes:
-            logger.info(f"Job {job_id}: Scheduling DeluXreality scraper...")
-            scraper = DeluxRealityScraper()
-            tasks.append(("DELUXREALITY", scraper.run(full_rescan=request.full_rescan)))
-
-        if "LEXAMO" in source_codes:
-            logger.info(f"Job {job_id}: Scheduling Lexamo scraper...")
-            scraper = LexamoScraper()
-            tasks.append(("LEXAMO", scraper.run(full_rescan=request.full_rescan)))
-
-        if "CENTURY21" in source_codes:
-            logger.info(f"Job {job_id}: Scheduling CENTURY 21 scraper...")
-            scraper = Century21Scraper()
-            tasks.append(("CENTURY21", scraper.run(full_rescan=request.full_rescan)))
-
-        if "REAS" in source_codes:
-            logger.info(f"Job {job_id}: Scheduling Reas.cz scraper...")
-            scraper = ReasScraper(fetch_details=True, detail_concurrency=5)
-            tasks.append(("REAS", scraper.run(full_rescan=request.full_rescan)))
-
-        if "BAZOS" in source_codes:
-            logger.info(f"Job {job_id}: Scheduling Bazos.cz scraper...")
-            scraper = BazosScraper()
-            tasks.append(("BAZOS", scraper.run(full_rescan=request.full_rescan)))
-
-        # Čas před spuštěním scrapingu – slouží pro deaktivaci neviděných inzerátů
-        scrape_started_at = datetime.utcnow()
+
+        for code in source_codes:
+            logger.info(f"Job {job_id}: Scheduling {code} scraper...")
+            for scraper in SCRAPER_REGISTRY[code](scraper_config):
+                tasks.append((code, scraper.run(full_rescan=request.full_rescan)))
 
         # Spusť všechny scrapers paralelně (každý s timeoutem)
         if tasks:
-            source_names = [name for name, _ in tasks]
+            semaphore = asyncio.Semaphore(SCRAPER_CONCURRENCY)
 
-            async def _run_with_timeout(name: str, coro: Awaitable[int]) -> int:
+            async def _run_with_timeout(name: str, coro: Awaitable[int]) -> Tuple[str, Union[int, Exception]]:
                 try:
-                    return await asyncio.wait_for(coro, timeout=SCRAPER_TASK_TIMEOUT_SECONDS)
-                except asyncio.TimeoutError:
+                    # Timeout běží až od získání slotu, ne od zařazení do fronty
+                    async with semaphore:
+                        return name, await asyncio.wait_for(coro, timeout=SCRAPER_TASK_TIMEOUT_SECONDS)
+                except asyncio.TimeoutError as exc:
                     logger.error(
                         "Job %s: %s scraper timed out after %ss",
                         job_id,
                         name,
                         SCRAPER_TASK_TIMEOUT_SECONDS,
                     )
-                    raise
-
-            coroutines = [_run_with_timeout(name, coro) for name, coro in tasks]
-
-            # asyncio.gather spustí všechny tasks paralelně; chyba jednoho nezastaví ostatní
-            results = await asyncio.gather(*coroutines, return_exceptions=True)
-            
+                    return name, exc
+                except Exception as exc:
+                    return name, exc
+
+            # Počet ještě běžících tasků per zdroj – SREALITY má víc instancí
+            # (district × kategorie) a deaktivovat smí až po doběhnutí všech.
+            remaining = Counter(name for name, _ in tasks)
+            job_results: Dict[str, Union[int, Exception]] = {}
             total_scraped = 0
-            for (source_name, _), result in zip(tasks, results):
-                if isinstance(result, Exception):
-                    logger.error(f"Job {job_id}: {source_name} scraper failed: {result}")
-                else:
-                    total_scraped += result
-                    logger.info(f"Job {job_id}: {source_name} scraped {result} listings")
-                    # Po úspěšném full_rescan deaktivuj inzeráty které scraper neviděl
-                    # ⚠️ OCHRANA: deaktivuj POUZE pokud scraper vrátil alespoň 1 inzerát.
-                    # Pokud vrátí 0 (síťová chyba, timeout), NESMÍME deaktivovat stávající
-                    # inzeráty – způsobilo by to falešnou masovou deaktivaci celé DB.
-                    if request.full_rescan and result > 0:
-                        deactivated = await db_manager.deactivate_unseen_listings(source_name, scrape_started_at)
-                        if deactivated > 0:
-                            logger.info(f"Job {job_id}: {source_name} deactivated {deactivated} expired listings")
-                    elif request.full_rescan and result == 0:
-                        logger.warning(f"Job {job_id}: {source_name} returned 0 listings during full_rescan – skipping deactivation to prevent false mass-deactivation")
-
-            logger.info(f"Job {job_id}: All scrapers completed. Total listings: {total_scraped}")
+            failed_tasks = 0
+
+            # Sdílený HTTP/2 connection pool pro všechny scrapery jobu – tasky
+            # z as_completed ho dědí přes contextvars
+            async with shared_http_transport():
+                # as_completed: post-processing rychlých zdrojů (deaktivace) běží,
+                # zatímco pomalé scrapers ještě pracují; chyba jednoho nezastaví ostatní
+                for next_done in asyncio.as_completed(
+                    [_run_with_timeout(name, coro) for name, coro in tasks]
+                ):
+                    source_name, result = await next_done
+                    remaining[source_name] -= 1
+
+                    if isinstance(result, Exception):
+                        logger.error(f"Job {job_id}: {source_name} scraper failed: {result}")
+                        job_results[source_name] = result
+                        failed_tasks += 1
+                    else:
+                        total_scraped += result
+                        logger.info(f"Job {job_id}: {source_name} scraped {result} listings")
+                        previous = job_results.get(source_name, 0)
+                        if not isinstance(previous, Exception):
+                            job_results[source_name] = previous + result
+
+                    if remaining[source_name] == 0 and request.full_rescan:
+                        await _deactivate_unseen(job_id, source_name, job_results[source_name], scrape_started_at)
+
+            logger.info(
+                f"Job {job_id}: All scrapers completed in {time.monotonic() - started_mono:.1f}s. "
+                f"Total listings: {total_scraped}"
+            )
 
             # Slack notifikace – pošle jen pokud něco selhalo nebo vrátilo 0
-            job_results = {name: res for (name, _), res in zip(tasks, results)}
             await notifications.notify_job_summary(
                 job_id=str(job_id),
                 results=job_results,
                 full_rescan=request.full_rescan,
             )
 
-            # Update status na Succeeded
-            await db_manager.update_scrape_job(
-                job_id=job_id,
-                status="Succeeded",
-                progress=100,
-                finished_at=datetime.utcnow(),
-                listings_found=total_scraped
-            )
+            # Job selhal, jen pokud selhaly všechny tasky; jinak Succeeded
+            # (jednotlivé chyby jsou v logu a ve Slack notifikaci)
+            if failed_tasks == len(tasks):
+                await db_manager.update_scrape_job(
+                    job_id=job_id,
+                    status="Failed",
+                    progress=100,
+                    finished_at=datetime.now(UTC),
+                    listings_found=total_scraped,
+                    error_message=f"All {failed_tasks} scraper tasks failed",
+                )
+            else:
+                await db_manager.update_scrape_job(
+                    job_id=job_id,
+                    status="Succeeded",
+                    progress=100,
+                    finished_at=datetime.now(UTC),
+                    listings_found=total_scraped
+                )
         else:
             logger.warning(f"Job {job_id}: No scrapers scheduled")
             await db_manager.update_scrape_job(
                 job_id=job_id,
                 status="Succeeded",
                 progress=100,
-                finished_at=datetime.utcnow(),
+                finished_at=datetime.now(UTC),
                 error_message="No scrapers scheduled"
             )
         
@@ -294,5 +309,5 @@ async def run_scrape_job(job_id: UUID, request: ScrapeTriggerRequest) -> None:
             job_id=job_id,
             status="Failed",
             error_message=str(exc),
-            finished_at=datetime.utcnow()
+            finished_at=datetime.now(UTC)
         )
@@ -1,12 +1,45 @@
 """
 Real estate scrapers package.
 """
+import functools
+import importlib
+from typing import Dict, Tuple
+
 from .remax_scraper import RemaxScraper
 from .mmreality_scraper import MmRealityScraper
 from .prodejmeto_scraper import ProdejmeToScraper
 
+# Registr scraperů: kód zdroje → (modul v tomto balíčku, název třídy).
+# Nový scraper = jeden řádek zde + factory v core.runner.SCRAPER_REGISTRY.
+SCRAPERS: Dict[str, Tuple[str, str]] = {
+    "REMAX":         ("remax_scraper", "RemaxScraper"),
+    "MMR":           ("mmreality_scraper", "MmRealityScraper"),
+    "PRODEJMETO":    ("prodejmeto_scraper", "ProdejmeToScraper"),
+    "ZNOJMOREALITY": ("znojmoreality_scraper", "ZnojmoRealityScraper"),
+    "SREALITY":      ("sreality_scraper", "SrealityScraper"),
+    "IDNES":         ("idnes_reality_scraper", "IdnesRealityScraper"),
+    "NEMZNOJMO":     ("nemovitostiznojmo_scraper", "NemovitostiZnojmoScraper"),
+    "HVREALITY":     ("hvreality_scraper", "HvRealityScraper"),
+    "PREMIAREALITY": ("premiareality_scraper", "PremiaRealityScraper"),
+    "DELUXREALITY":  ("deluxreality_scraper", "DeluxRealityScraper"),
+    "LEXAMO":        ("lexamo_scraper", "LexamoScraper"),
+    "CENTURY21":     ("century21_scraper", "Century21Scraper"),
+    "REAS":          ("reas_scraper", "ReasScraper"),
+    "BAZOS":         ("bazos_scraper", "BazosScraper"),
+}
+
+
+@functools.lru_cache(maxsize=None)
+def get_scraper(code: str) -> type:
+    """Lazy import třídy scraperu podle kódu zdroje – import a lookup proběhne jen jednou."""
+    module_name, class_name = SCRAPERS[code]
+    return getattr(importlib.import_module(f".{module_name}", __name__), class_name)
+
+
 __all__ = [
     "RemaxScraper",
     "MmRealityScraper",
     "ProdejmeToScraper",
+    "SCRAPERS",
+    "get_scraper",
 ]
@@ -1,21 +1,25 @@
 """
 CENTURY 21 Czech Republic scraper – century21.cz
 Největší realitní síť v ČR, region: Jihomoravský kraj / Znojemsko
-SSR (server-side rendered) – httpx + BeautifulSoup
+SSR (server-side rendered) – httpx + lxml (výpis přes XPath) / BeautifulSoup (detail)
 
 Scrapuje všechny typy nemovitostí (domy, byty, pozemky, ostatní)
 pro region okresu Znojmo s podporou dalších okresů přes konfiguraci.
 """
-import json
+import asyncio
 import logging
 import re
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 from urllib.parse import urljoin
 
 import httpx
-from bs4 import BeautifulSoup
+import lxml.html
+import orjson
+from bs4 import BeautifulSoup, NavigableString, Tag
 
 from ..database import get_db_manager
+from ..http_utils import get_shared_transport, http_retry
+from ..utils import get_parse_pool
 
 logger = logging.getLogger(__name__)
 
@@ -32,6 +36,9 @@ HEADERS = {
     "Accept": "text/html,application/xhtml+xml,*/*;q=0.8",
 }
 
+# Počet listingů na jeden bulk upsert do DB
+UPSERT_BATCH_SIZE = 50
+
 # Znojmo + Brno-venkov – pokrývá všechny typy nemovitostí a transakce
 SEARCH_CONFIGS = [
     {"regions": ["Jihomoravský"], "county": ["Znojmo", "Brno-venkov"], "propertyType": ["HOUSE"],      "listingType": "SALE"},
@@ -78,15 +85,48 @@ TABLE_PROPERTY_TYPE = {
 }
 
 
+# Všechny klíče TABLE_PROPERTY_TYPE v jedné alternaci – nejdelší první, aby na jedné
+# pozici "bytový dům" nepřekryl kratší "byt". Při více shodách vyhrává klíč dřívější
+# v mapě (pořadí dict = priorita, jako dřív smyčka).
+_PTYPE_RE = re.compile("|".join(
+    re.escape(k) for k in sorted(TABLE_PROPERTY_TYPE, key=len, reverse=True)
+))
+_PTYPE_RANK = {k: i for i, k in enumerate(TABLE_PROPERTY_TYPE)}
+
+# Předkompilované regexy (běží pro každý inzerát / stránku výpisu)
+_UUID_ID_RE = re.compile(r"id=([0-9a-f\-]{36})", re.I)
+_NUM_ID_RE = re.compile(r"^\s*ID:\s*\d+")
+_ID_EXTRACT_RE = re.compile(r"ID:\s*(\d+)")
+_HEADING_RE = re.compile(r"NEMOVITOSTÍ|NEMOVITOST", re.I)
+_COUNT_RE = re.compile(r"(\d+)\s+NEMOVITOST", re.I)
+_PRICE_RE = re.compile(r"\d[\d\s]+Kč")
+_NONDIGIT_RE = re.compile(r"[^\d]")
+_IGLUU_FILE_RE = re.compile(r"file/[0-9a-f\-]{36}", re.I)
+_SLUG_RE = re.compile(r"/(?:prodej|pronajem)-[^/]+-([^-]+(?:-u-znojma)?)-id=")
+_AREA_RE = re.compile(r"(\d+(?:[.,]\d+)?)")
+
+# Lokace, které už region obsahují – nedoplňujeme "okres Znojmo"
+_LOC_NEEDLES = ("znojmo", "jihomoravsk")
+
+# Odkazy na detail inzerátu ve výpisu – filtr běží v libxml2, ne v Pythonu
+_DETAIL_HREF_XPATH = "//a[contains(@href, '/nemovitosti/') and contains(@href, 'id=')]/@href"
+
+
 class Century21Scraper:
     SOURCE_CODE = "CENTURY21"
 
-    def __init__(self, search_configs: Optional[List[Dict[str, Any]]] = None):
+    def __init__(
+        self,
+        search_configs: Optional[List[Dict[str, Any]]] = None,
+        detail_concurrency: int = 10,
+    ):
         """
         Args:
             search_configs: Seznam search konfigurací. Defaultně SEARCH_CONFIGS (Znojmo).
+            detail_concurrency: Max počet souběžně stahovaných detail stránek.
         """
         self.search_configs = search_configs or SEARCH_CONFIGS
+        self.detail_concurrency = detail_concurrency
 
     async def run(self, full_rescan: bool = False) -> int:
         logger.info(f"[{self.SOURCE_CODE}] Starting scrape (full_rescan={full_rescan})")
@@ -98,37 +138,98 @@ class Century21Scraper:
 
     async def scrape(self, max_pages_per_config: int = 5) -> int:
         """Iteruje přes všechny search konfigurace a stránky."""
-        all_detail_urls: set = set()
-
-        async with httpx.AsyncClient(headers=HEADERS, follow_redirects=True, timeout=30) as client:
-            # Fáze 1: sběr všech URL inzerátů
-            for cfg in self.search_configs:
-                urls = await self._collect_urls_for_config(client, cfg, max_pages_per_config)
+        # UUID inzerátu → URL; stejný inzerát pod jiným slugem se stahuje jen jednou
+        detail_urls_by_uuid: Dict[str, str] = {}
+
+        # HTTP/2 multiplexuje souběžné requesty na century21.cz + igluu CDN přes
+        # málo spojení; pool je větší než detail_concurrency, aby semafor nečekal na spojení.
+        # Uvnitř scrape jobu se http2/limits ignorují – platí sdílený transport jobu.
+        limits = httpx.Limits(max_keepalive_connections=50, max_connections=100, keepalive_expiry=30)
+        async with httpx.AsyncClient(
+            headers=HEADERS,
+            follow_redirects=True,
+            timeout=30,
+            http2=True,
+            limits=limits,
+            transport=get_shared_transport(),
+        ) as client:
+            # Fáze 1: sběr všech URL inzerátů – configy jsou nezávislé, jdou paralelně
+            config_urls = await asyncio.gather(*(
+                self._collect_urls_for_config(client, cfg, max_pages_per_config)
+                for cfg in self.search_configs
+            ))
+            for cfg, urls in zip(self.search_configs, config_urls):
                 logger.info(f"[{self.SOURCE_CODE}] Config {cfg.get('propertyType','?')}/{cfg.get('listingType','?')}: {len(urls)} URLs")
-                all_detail_urls.update(urls)
+                for url in urls:
+                    m = _UUID_ID_RE.search(url)
+                    detail_urls_by_uuid.setdefault(m.group(1).lower() if m else url, url)
 
-            logger.info(f"[{self.SOURCE_CODE}] Total unique listings: {len(all_detail_urls)}")
+            logger.info(f"[{self.SOURCE_CODE}] Total unique listings: {len(detail_urls_by_uuid)}")
 
-            # Fáze 2: scraping každého detailu
+            # Fáze 2: scraping detailů souběžně (omezeno semaforem), ukládání
+            # průběžně po dávkách v pořadí dokončení
             count = 0
             db = get_db_manager()
-            for url in all_detail_urls:
-                try:
-                    # Infer offer/property type from URL for fallback
-                    inferred_offer = "Sale" if "/prodej-" in url else "Rent" if "/pronajem-" in url else "Sale"
-                    inferred_prop = self._property_type_from_url(url)
-
-                    item = await self._parse_detail(client, url, inferred_offer, inferred_prop)
-                    if item:
-                        await db.upsert_listing(item)
-                        count += 1
-                        logger.debug(f"[{self.SOURCE_CODE}] Saved: {item.get('title','?')}")
-                except Exception as e:
-                    logger.warning(f"[{self.SOURCE_CODE}] Error parsing {url}: {e}")
+            sem = asyncio.Semaphore(self.detail_concurrency)
+            tasks = [self._scrape_detail(client, url, sem) for url in detail_urls_by_uuid.values()]
+            batch: List[Dict[str, Any]] = []
+            for next_done in asyncio.as_completed(tasks):
+                item = await next_done
+                if not item:
+                    continue
+                batch.append(item)
+                if len(batch) >= UPSERT_BATCH_SIZE:
+                    count += await self._flush_batch(db, batch)
+                    batch.clear()
+            if batch:
+                count += await self._flush_batch(db, batch)
 
         logger.info(f"[{self.SOURCE_CODE}] Done – {count} listings saved")
         return count
 
+    async def _flush_batch(self, db, batch: List[Dict[str, Any]]) -> int:
+        """Uloží dávku listingů jedním bulk upsertem; chybu loguje a vrací 0.
+
+        Vrací velikost dávky (včetně listingů vyloučených filtry) – stejně jako
+        dřív per-listing upsert; runner podle nuly rozhoduje o deaktivaci.
+        """
+        try:
+            saved = await db.upsert_listings_bulk(batch)
+            logger.debug(f"[{self.SOURCE_CODE}] Saved batch: {saved}/{len(batch)} listings")
+            return len(batch)
+        except Exception as e:
+            logger.warning(f"[{self.SOURCE_CODE}] Error saving batch of {len(batch)} listings: {e}")
+            return 0
+
+    async def _scrape_detail(
+        self,
+        client: httpx.AsyncClient,
+        url: str,
+        sem: asyncio.Semaphore,
+    ) -> Optional[Dict[str, Any]]:
+        """Stáhne a naparsuje jeden detail pod semaforem; chyby loguje a vrací None."""
+        async with sem:
+            try:
+                # Infer offer/property type from URL for fallback
+                inferred_offer = "Sale" if "/prodej-" in url else "Rent" if "/pronajem-" in url else "Sale"
+                inferred_prop = self._property_type_from_url(url)
+                return await self._parse_detail(client, url, inferred_offer, inferred_prop)
+            except Exception as e:
+                logger.warning(f"[{self.SOURCE_CODE}] Error parsing {url}: {e}")
+                return None
+
+    @http_retry
+    async def _fetch(
+        self,
+        client: httpx.AsyncClient,
+        url: str,
+        params: Optional[Dict[str, str]] = None,
+    ) -> httpx.Response:
+        """Stáhne stránku, při 429/5xx a síťových chybách opakuje (max 3×); 404 neopakuje."""
+        resp = await client.get(url, params=params)
+        resp.raise_for_status()
+        return resp
+
     # ------------------------------------------------------------------
     # Kolektování URL ze stránkování
     # ------------------------------------------------------------------
@@ -181,44 +282,37 @@ class Century21Scraper:
             "ownershipType": [],
             "energy": [],
         }
-        filter_json = json.dumps(filter_data, ensure_ascii=False, separators=(",", ":"))
+        # orjson: kompaktní výstup bez escapování non-ASCII (= ensure_ascii=False + separators)
+        filter_json = orjson.dumps(filter_data).decode()
 
         params = {"filter": filter_json}
         if page > 1:
             params["page"] = str(page)
 
         try:
-            resp = await client.get(SEARCH_URL, params=params)
-            resp.raise_for_status()
+            resp = await self._fetch(client, SEARCH_URL, params=params)
         except httpx.HTTPError as e:
             logger.warning(f"[{self.SOURCE_CODE}] HTTP error listing page {page}: {e}")
             return []
 
-        soup = BeautifulSoup(resp.text, "html.parser")
+        # Výpis stačí projít přes lxml + XPath – bez BeautifulSoup stromu.
+        # Parser dostává přímo bytes – bez mezikopie dekódovaného resp.text
+        tree = lxml.html.document_fromstring(
+            resp.content, parser=lxml.html.HTMLParser(encoding=resp.encoding)
+        )
 
         # Detekce "žádné inzeráty" stránky
-        heading = soup.find(string=re.compile(r"NEMOVITOSTÍ|NEMOVITOST", re.I))
+        heading = next((t for t in tree.xpath("//text()") if _HEADING_RE.search(t)), None)
         if heading:
             # Pokud vrátí "0 NEMOVITOSTÍ", přeskočíme
-            m = re.search(r"(\d+)\s+NEMOVITOST", heading.strip(), re.I)
+            m = _COUNT_RE.search(heading.strip())
             if m and int(m.group(1)) == 0:
                 return []
 
-        urls = []
-        for a in soup.select("a[href*='/nemovitosti/']"):
-            href = a.get("href", "").strip()
-            if not href:
-                continue
-            # Detail URL musí obsahovat id= UUID
-            if "id=" not in href:
-                continue
-            # Přeskočit navigační linky
-            if href.rstrip("/") == "/nemovitosti":
-                continue
-            full_url = urljoin(BASE_URL, href)
-            # Odstraň duplicity z galerie/video odkazů
-            if full_url not in urls:
-                urls.append(full_url)
+        # Detail URL musí obsahovat id= UUID (navigační linky /nemovitosti ho nemají);
+        # dict.fromkeys odstraní duplicity z galerie/video odkazů a zachová pořadí
+        hrefs = tree.xpath(_DETAIL_HREF_XPATH)
+        urls = list(dict.fromkeys(urljoin(BASE_URL, href.strip()) for href in hrefs))
 
         return urls
 
@@ -233,32 +327,52 @@ class Century21Scraper:
         inferred_offer_type: str = "Sale",
         inferred_property_type: str = "House",
     ) -> Optional[Dict[str, Any]]:
-        """Stáhne a naparsuje detail stránky inzerátu."""
+        """Stáhne detail stránky inzerátu a naparsuje ho v process poolu."""
         try:
-            resp = await client.get(url)
-            resp.raise_for_status()
+            resp = await self._fetch(client, url)
         except httpx.HTTPError as e:
             logger.warning(f"[{self.SOURCE_CODE}] HTTP error detail {url}: {e}")
             return None
 
-        soup = BeautifulSoup(resp.text, "html.parser")
+        # Parsování je čistě CPU-bound – běží mimo event loop, fetch dalších detailů pokračuje
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            get_parse_pool(),
+            Century21Scraper._parse_detail_html,
+            resp.content,
+            resp.encoding,
+            url,
+            inferred_offer_type,
+            inferred_property_type,
+        )
+
+    @staticmethod
+    def _parse_detail_html(
+        body: bytes,
+        encoding: Optional[str],
+        url: str,
+        inferred_offer_type: str = "Sale",
+        inferred_property_type: str = "House",
+    ) -> Optional[Dict[str, Any]]:
+        """Naparsuje HTML detailu inzerátu (čistá funkce – spouští se v process poolu)."""
+        soup = BeautifulSoup(body, "lxml", from_encoding=encoding)
 
         # External ID – preferuj UUID z URL, fallback na číselné ID ze stránky
-        uuid_match = re.search(r"id=([0-9a-f\-]{36})", url, re.I)
+        uuid_match = _UUID_ID_RE.search(url)
         external_id = uuid_match.group(1) if uuid_match else url
 
-        # Číselné interní ID (ID: 971693)
-        numeric_id = None
-        for el in soup.find_all(string=re.compile(r"^\s*ID:\s*\d+")):
-            m = re.search(r"ID:\s*(\d+)", el.strip())
-            if m:
-                numeric_id = m.group(1)
-                break
+        # Cena, číselné interní ID (ID: 971693) a fotky – jeden průchod stromem
+        price, numeric_id, photos = Century21Scraper._scan_detail(soup)
 
         # Titulek
+        # Jeden průchod stromem pro všechny úrovně nadpisů; priorita h1 > h2 > h3
+        # zůstává – kandidátem je vždy první nadpis dané úrovně
         title = ""
-        for tag in ["h1", "h2", "h3"]:
-            h = soup.find(tag)
+        first_by_tag: Dict[str, Tag] = {}
+        for h in soup.find_all(["h1", "h2", "h3"]):
+            first_by_tag.setdefault(h.name, h)
+        for tag in ("h1", "h2", "h3"):
+            h = first_by_tag.get(tag)
             if h:
                 txt = h.get_text(strip=True)
                 if len(txt) > 5 and "cookie" not in txt.lower():
@@ -266,14 +380,11 @@ class Century21Scraper:
                     break
 
         if not title:
-            logger.warning(f"[{self.SOURCE_CODE}] No title at {url}")
+            logger.warning(f"[{Century21Scraper.SOURCE_CODE}] No title at {url}")
             return None
 
         # Parsování parametrové tabulky (| KATEGORIE | Rodinné domy | ...)
-        params = self._parse_detail_table(soup)
-
-        # Cena
-        price = self._extract_price(soup)
+        params = Century21Scraper._parse_detail_table(soup)
 
         # Offer type (z URL nebo tabulky)
         offer_type = inferred_offer_type
@@ -281,17 +392,15 @@ class Century21Scraper:
         # Property type (z tabulky KATEGORIE nebo URL)
         property_type = inferred_property_type
         if "KATEGORIE" in params:
-            cat = params["KATEGORIE"].lower()
-            for key, ptype in TABLE_PROPERTY_TYPE.items():
-                if key in cat:
-                    property_type = ptype
-                    break
+            found = _PTYPE_RE.findall(params["KATEGORIE"].lower())
+            if found:
+                property_type = TABLE_PROPERTY_TYPE[min(found, key=_PTYPE_RANK.__getitem__)]
 
         # Plocha
         area = None
         for key in ["PLOCHA UŽITNÁ", "PLOCHA", "VELIKOST BYTU"]:
             if key in params:
-                m = re.search(r"(\d+(?:[.,]\d+)?)", params[key].replace("\xa0", ""))
+                m = _AREA_RE.search(params[key].replace("\xa0", ""))
                 if m:
                     area = float(m.group(1).replace(",", "."))
                     break
@@ -303,25 +412,24 @@ class Century21Scraper:
         location = params.get("LOKALITA", "") or params.get("OBEC", "")
         if not location:
             # Fallback z URL slug
-            slug_match = re.search(r"/(?:prodej|pronajem)-[^/]+-([^-]+(?:-u-znojma)?)-id=", url)
+            slug_match = _SLUG_RE.search(url)
             if slug_match:
                 location = slug_match.group(1).replace("-", " ").title()
 
         # Zajistíme, aby location_text vždy obsahoval "Znojmo" – všechny C21 listingy
         # pocházejí ze Znojemského okresu (URL filter), ale LOKALITA vrací jen obec (např. "Dobšice").
-        if location and "znojmo" not in location.lower() and "jihomoravsk" not in location.lower():
-            location = f"{location}, okres Znojmo"
-        elif not location:
+        if not location:
             location = "okres Znojmo"
+        else:
+            location_lower = location.lower()
+            if not any(needle in location_lower for needle in _LOC_NEEDLES):
+                location = f"{location}, okres Znojmo"
 
         # Popis
-        description = self._extract_description(soup)
-
-        # Fotky
-        photos = self._extract_photos(soup)
+        description = Century21Scraper._extract_description(soup)
 
         result = {
-            "source_code": self.SOURCE_CODE,
+            "source_code": Century21Scraper.SOURCE_CODE,
             "external_id": external_id,
             "url": url,
             "title": title,
@@ -358,43 +466,84 @@ class Century21Scraper:
             return "Cottage"
         return "Other"
 
-    def _parse_detail_table(self, soup: BeautifulSoup) -> Dict[str, str]:
+    @staticmethod
+    def _parse_detail_table(soup: BeautifulSoup) -> Dict[str, str]:
         """Parsuje parametrovou tabulku na detailu."""
         params: Dict[str, str] = {}
-        for row in soup.select("table tr"):
-            cells = row.select("td")
-            if len(cells) >= 2:
-                key = cells[0].get_text(strip=True).upper()
-                val = cells[1].get_text(" ", strip=True)
-                if key and val:
-                    params[key] = val
+        # find_all obchází CSS selektor engine; limit=2 – potřebujeme jen klíč a hodnotu
+        for row in soup.find_all("tr"):
+            cells = row.find_all("td", limit=2)
+            if len(cells) < 2:
+                continue
+            key = cells[0].get_text(strip=True).upper()
+            if not key:
+                continue
+            val = cells[1].get_text(" ", strip=True)
+            if val:
+                params[key] = val
         return params
 
-    def _extract_price(self, soup: BeautifulSoup) -> Optional[float]:
-        """Extrahuje číselnou cenu v Kč."""
-        # Hledá vzor "X XXX XXX Kč" na stránce
-        for el in soup.find_all(string=re.compile(r"\d[\d\s]+Kč")):
-            txt = el.strip()
-            if len(txt) > 30:
-                continue
-            nums = re.sub(r"[^\d]", "", txt)
-            if nums and int(nums) > 10000:
-                return float(int(nums))
-        return None
+    @staticmethod
+    def _scan_detail(soup: BeautifulSoup) -> Tuple[Optional[float], Optional[str], List[str]]:
+        """
+        Jeden průchod stromem detailu místo tří samostatných find_all/select.
 
-    def _extract_description(self, soup: BeautifulSoup) -> str:
+        Returns:
+            (cena v Kč, číselné interní ID, URL fotek z igluu CDN)
+        """
+        price: Optional[float] = None
+        numeric_id: Optional[str] = None
+        photos: List[str] = []
+        gallery_links: List[str] = []  # fallback – odkazy galerie, pokud nejsou <img>
+        seen: set = set()
+
+        for el in soup.descendants:
+            if isinstance(el, NavigableString):
+                if price is not None and numeric_id is not None:
+                    continue
+                txt = el.strip()
+                # Cena: vzor "X XXX XXX Kč" v krátkém textovém uzlu
+                if price is None and len(txt) <= 30 and _PRICE_RE.search(txt):
+                    nums = _NONDIGIT_RE.sub("", txt)
+                    if nums and int(nums) > 10000:
+                        price = float(int(nums))
+                if numeric_id is None and _NUM_ID_RE.search(el):
+                    m = _ID_EXTRACT_RE.search(txt)
+                    if m:
+                        numeric_id = m.group(1)
+            elif isinstance(el, Tag):
+                # Fotky jsou na igluu CDN: live-file-api.igluu.cz; náhledy / thumbnails
+                # (cesta neobsahuje UUID formát) přeskočit
+                if el.name == "img":
+                    if len(photos) >= 50:
+                        continue
+                    src = (el.get("src") or "").strip()
+                    if "igluu.cz" in src and src not in seen and _IGLUU_FILE_RE.search(src):
+                        seen.add(src)
+                        photos.append(src)
+                elif el.name == "a" and len(gallery_links) < 50:
+                    href = (el.get("href") or "").strip()
+                    if "igluu.cz" in href and href not in gallery_links and _IGLUU_FILE_RE.search(href):
+                        gallery_links.append(href)
+
+        if not photos:
+            photos = gallery_links
+
+        return price, numeric_id, photos
+
+    @staticmethod
+    def _extract_description(soup: BeautifulSoup) -> str:
         """Extrahuje popis nemovitosti.
 
         Century21 používá Tailwind CSS – popis je v <div class="...whitespace-break-spaces...">
         ne v <p> tagech. Fallbacky: meta description, kratší paragrafy.
         """
-        # Primární: div s Tailwind třídou whitespace-break-spaces (hlavní popis)
-        for d in soup.select("div[class]"):
-            cls = " ".join(d.get("class", []))
-            if "whitespace-break-spaces" in cls or "whitespace-break" in cls:
-                txt = d.get_text(" ", strip=True)
-                if len(txt) > 50:
-                    return txt[:5000]
+        # Primární: div s Tailwind třídou whitespace-break-spaces (hlavní popis).
+        # Filtr třídy řeší selektor – žádné skládání class listu pro každý div v Pythonu.
+        for d in soup.select("div[class*='whitespace-break']"):
+            txt = d.get_text(" ", strip=True)
+            if len(txt) > 50:
+                return txt[:5000]
 
         # Sekundární: hledat <p> s textem (snížený práh na 50 znaků)
         paragraphs = []
@@ -414,32 +563,3 @@ class Century21Scraper:
                 return content
 
         return ""
-
-    def _extract_photos(self, soup: BeautifulSoup) -> List[str]:
-        """Extrahuje URL fotek ze CDN igluu."""
-        photos: List[str] = []
-        seen: set = set()
-        # Fotky jsou na igluu CDN: live-file-api.igluu.cz
-        for img in soup.select("img[src*='igluu.cz']"):
-            src = img.get("src", "").strip()
-            if not src or src in seen:
-                continue
-            # Přeskočit náhledy / thumbnails (cesta neobsahuje UUID formát)
-            if not re.search(r"file/[0-9a-f\-]{36}", src, re.I):
-                continue
-            seen.add(src)
-            photos.append(src)
-            if len(photos) >= 50:
-                break
-
-        # Fallback: hledej v href atributech (galerie)
-        if not photos:
-            for a in soup.select("a[href*='igluu.cz']"):
-                href = a.get("href", "").strip()
-                if href and href not in seen and re.search(r"file/[0-9a-f\-]{36}", href, re.I):
-                    seen.add(href)
-                    photos.append(href)
-                    if len(photos) >= 50:
-                        break
-
-        return photos
@@ -1,18 +1,21 @@
 """
 DeluXreality scraper – deluxreality.cz
 Realitní kancelář Znojmo (Delux services s.r.o.)
-WordPress / Elementor SSR – httpx + BeautifulSoup
+WordPress / Elementor SSR – httpx + BeautifulSoup (lxml parser)
 """
+import asyncio
 import logging
 import re
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Set
 from urllib.parse import urljoin
 
 import httpx
-from bs4 import BeautifulSoup
+import soupsieve as sv
+from bs4 import BeautifulSoup, SoupStrainer
 
 from ..database import get_db_manager
-from ..http_utils import http_retry
+from ..http_utils import get_shared_transport, http_retry
+from ..utils import get_parse_pool
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +24,12 @@ LISTING_PAGES = [
     f"{BASE_URL}/nemovitosti/?typ=prodej",
     f"{BASE_URL}/nemovitosti/?typ=pronajem",
 ]
+UPSERT_BATCH_SIZE = 50
+
+# Stránka výpisu – parsují se jen <a href>. Detail stránky se neořezávají:
+# extraktory hledají volné textové uzly (cena, plocha, lokalita) a selektory
+# přes třídy předků (.dx-ps-gallery img), které by strainer zahodil.
+LISTING_LINKS_STRAINER = SoupStrainer("a", href=True)
 
 HEADERS = {
     "User-Agent": (
@@ -32,6 +41,9 @@ HEADERS = {
     "Accept": "text/html,application/xhtml+xml,*/*;q=0.8",
 }
 
+# Pool ≥ detail_concurrency, aby semafor nečekal na volné spojení
+CLIENT_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=16, keepalive_expiry=30)
+
 OFFER_TYPE_MAP = {
     "prodej": "Sale",
     "pronájem": "Rent",
@@ -58,50 +70,173 @@ PROPERTY_TYPE_MAP = {
     "horský": "Cottage",
 }
 
+# Předkompilované regexy (běží pro každou stránku / textový uzel)
+_SKIP_HREF_RE = re.compile(r"/nemovitosti/\?|/nemovitosti/$|/feed/|/nemovitosti/page/")
+# Tvar URL detailu – jiné varianty (query, #kotva, vnořené cesty, cizí host) se vůbec nestahují
+_DETAIL_URL_RE = re.compile(r"https?://(?:www\.)?deluxreality\.cz/nemovitosti/[^/?#]+/?")
+_SLUG_RE = re.compile(r"/nemovitosti/([^/]+)/?$")
+_PRICE_RE = re.compile(r"\d[\d\s]+Kč")
+_NONDIGIT_RE = re.compile(r"[^\d]")
+_PLOCHA_RE = re.compile(r"Plocha", re.I)
+_AREA_VALUE_TEXT_RE = re.compile(r"\d+\s*m")
+_NUMBER_RE = re.compile(r"(\d+(?:[.,]\d+)?)")
+_AREA_LABEL_RE = re.compile(r"plocha\s+bytu|užitná\s+plocha|plocha\s+domu", re.I)
+_AREA_M_RE = re.compile(r"(\d+(?:[.,]\d+)?)\s*m", re.I)
+_AREA_STANDALONE_RE = re.compile(r"\b\d{2,4}\s*m[²2]")
+_AREA_SQM_RE = re.compile(r"(\d+(?:[.,]\d+)?)\s*m[²2]")
+_LOCATION_RE = re.compile(r"Znojmo|Hevlín|Šatov|Vrbovec|Mikulovice|Hnanice", re.I)
+_WP_SIZE_RE = re.compile(r"-\d+x\d+(\.\w+)$")
+
+# Oddělovače tisíců (mezera, nbsp, úzká nbsp, tečka, čárka, tab) – mazací tabulka pro str.translate
+_NUMBER_SEPARATORS = {ord(c): None for c in " \xa0\u202f.,\t"}
+
+# Klíče map v jedné alternaci – jeden průchod textem místo `in` testu pro každý klíč.
+# Při více shodách vyhrává klíč dřívější v mapě (pořadí dict = priorita, jako dřív smyčka).
+_OFFER_TYPE_RE = re.compile("|".join(re.escape(k) for k in OFFER_TYPE_MAP))
+_OFFER_TYPE_RANK = {k: i for i, k in enumerate(OFFER_TYPE_MAP)}
+_PROPERTY_TYPE_RE = re.compile("|".join(re.escape(k) for k in PROPERTY_TYPE_MAP))
+_PROPERTY_TYPE_RANK = {k: i for i, k in enumerate(PROPERTY_TYPE_MAP)}
+
+# Názvy nadpisů – BS je testuje prostým `in`, ne regexem pro každý element stromu
+_HEADING_TAGS = ("h1", "h2", "h3", "h4", "h5", "h6")
+
+# Předkompilované CSS selektory (soupsieve) – kompilace mimo hot path
+_LISTING_LINK_SEL = sv.compile("a[href*='/nemovitosti/']")
+_PARAGRAPH_SEL = sv.compile("p")
+_GALLERY_IMG_SEL = sv.compile(".dx-ps-gallery img")
+
+
+def _external_id(url: str) -> str:
+    """External ID = slug URL za /nemovitosti/ (fallback celá URL)."""
+    slug_match = _SLUG_RE.search(url)
+    return slug_match.group(1) if slug_match else url
+
+
+def _to_int(text: str) -> Optional[int]:
+    """Číslo s oddělovači tisíců ("3 490 000") -> int přes str.translate; jinak None."""
+    digits = text.translate(_NUMBER_SEPARATORS)
+    return int(digits) if digits.isdecimal() else None
+
 
 class DeluxRealityScraper:
     SOURCE_CODE = "DELUXREALITY"
 
+    def __init__(self, detail_concurrency: int = 8):
+        """
+        Args:
+            detail_concurrency: Max počet souběžně stahovaných detail stránek.
+        """
+        self.detail_concurrency = detail_concurrency
+
     async def run(self, full_rescan: bool = False) -> int:
         """Run the scraper and return count of processed listings."""
         logger.info(f"[{self.SOURCE_CODE}] Starting scrape (full_rescan={full_rescan})")
         try:
-            return await self.scrape()
+            return await self.scrape(full_rescan=full_rescan)
         except Exception as e:
             logger.error(f"[{self.SOURCE_CODE}] Fatal error: {e}", exc_info=True)
             return 0
 
-    async def scrape(self) -> int:
-        """Fetch listing page, then detail pages, persist to DB."""
-        async with httpx.AsyncClient(headers=HEADERS, follow_redirects=True, timeout=30) as client:
+    async def scrape(self, full_rescan: bool = False) -> int:
+        """
+        Fetch listing page, then detail pages (concurrently), persist to DB.
+
+        Args:
+            full_rescan: False = detaily inzerátů, které už jsou v DB aktivní, se přeskočí.
+        """
+        # HTTP/2 – souběžné detaily multiplexované přes jedno spojení. Uvnitř
+        # scrape jobu se http2/limits ignorují – platí sdílený transport jobu.
+        async with httpx.AsyncClient(
+            headers=HEADERS,
+            follow_redirects=True,
+            timeout=30,
+            http2=True,
+            limits=CLIENT_LIMITS,
+            transport=get_shared_transport(),
+        ) as client:
             detail_urls = await self._get_listing_urls(client)
             logger.info(f"[{self.SOURCE_CODE}] Found {len(detail_urls)} listings")
 
-            count = 0
-            db = get_db_manager()
+            # Inkrementálně stahuj jen nové inzeráty – známé jsou v DB (full_rescan je obnoví)
+            known_ids: Set[str] = set()
+            if not full_rescan:
+                try:
+                    known_ids = await get_db_manager().get_known_external_ids(self.SOURCE_CODE)
+                except Exception as e:
+                    logger.warning(f"[{self.SOURCE_CODE}] Could not load known listings, fetching all: {e}")
+            skipped_ids: List[str] = []
+            new_urls: List[str] = []
             for url in detail_urls:
+                external_id = _external_id(url)
+                if external_id in known_ids:
+                    skipped_ids.append(external_id)
+                else:
+                    new_urls.append(url)
+            detail_urls = new_urls
+            if skipped_ids:
+                logger.info(f"[{self.SOURCE_CODE}] Skipping {len(skipped_ids)} already known listings")
+
+            # Detaily paralelně, omezeno semaforem. _scrape_detail chyby zachytává
+            # sám, TaskGroup tak jen hlídá zrušení (cancel ukončí všechny fetche).
+            sem = asyncio.Semaphore(self.detail_concurrency)
+            async with asyncio.TaskGroup() as tg:
+                tasks = [
+                    tg.create_task(self._scrape_detail(client, url, sem))
+                    for url in detail_urls
+                ]
+            items = [t.result() for t in tasks if t.result() is not None]
+
+            # Ukládání po dávkách – bulk upsert místo round-tripu na každý inzerát
+            saved_count = 0
+            db = get_db_manager()
+            for start in range(0, len(items), UPSERT_BATCH_SIZE):
+                batch = items[start:start + UPSERT_BATCH_SIZE]
+                try:
+                    saved = await db.upsert_listings_bulk(batch)
+                    saved_count += len(batch)
+                    logger.debug(f"[{self.SOURCE_CODE}] Saved batch: {saved}/{len(batch)}")
+                except Exception as e:
+                    logger.warning(f"[{self.SOURCE_CODE}] Error saving batch of {len(batch)}: {e}")
+
+            # Přeskočené známé inzeráty jsou na webu dál – jen posuneme last_seen_at
+            seen_count = 0
+            if skipped_ids:
                 try:
-                    item = await self._parse_detail(client, url)
-                    if item:
-                        await db.upsert_listing(item)
-                        count += 1
-                        logger.debug(f"[{self.SOURCE_CODE}] Saved: {item.get('title','?')}")
+                    seen_count = await db.touch_listings_seen(self.SOURCE_CODE, skipped_ids)
                 except Exception as e:
-                    logger.warning(f"[{self.SOURCE_CODE}] Error parsing {url}: {e}")
+                    logger.warning(f"[{self.SOURCE_CODE}] Error touching {len(skipped_ids)} known listings: {e}")
+
+        logger.info(
+            f"[{self.SOURCE_CODE}] Done – {saved_count} listings saved, "
+            f"{len(skipped_ids)} known skipped ({seen_count} marked as seen)"
+        )
+        # Vrací viděné inzeráty (uložené + známé potvrzené v DB); 0 = alert rozbitého scraperu
+        return saved_count + seen_count
 
-        logger.info(f"[{self.SOURCE_CODE}] Done – {count} listings saved")
-        return count
+    async def _scrape_detail(
+        self, client: httpx.AsyncClient, url: str, sem: asyncio.Semaphore
+    ) -> Optional[Dict[str, Any]]:
+        """Stáhne a naparsuje jeden detail pod semaforem; chyby loguje a vrací None."""
+        async with sem:
+            try:
+                return await self._parse_detail(client, url)
+            except Exception as e:
+                logger.warning(f"[{self.SOURCE_CODE}] Error parsing {url}: {e}")
+                return None
 
     # ------------------------------------------------------------------
     # Private helpers
     # ------------------------------------------------------------------
 
     @http_retry
-    async def _fetch(self, client: httpx.AsyncClient, url: str) -> str:
-        """Stahne stránku, při 429/503 automaticky opakuje (max 3×)."""
+    async def _fetch(self, client: httpx.AsyncClient, url: str) -> bytes:
+        """Stahne stránku, při 429/503 automaticky opakuje (max 3×).
+
+        Vrací surové bajty – lxml si kódování vezme z <meta charset>, bez dekódování do str.
+        """
         resp = await client.get(url)
         resp.raise_for_status()
-        return resp.text
+        return resp.content
 
     async def _get_listing_urls(self, client: httpx.AsyncClient) -> List[str]:
         """Scrape prodej+pronajem filter pages (with pagination) and return unique detail URLs."""
@@ -118,17 +253,20 @@ class DeluxRealityScraper:
                     if e.response.status_code == 404:
                         break  # no more pages
                     raise
-                soup = BeautifulSoup(html, "html.parser")
+                # Z výpisu potřebujeme jen odkazy – ostatní DOM se vůbec nestaví
+                soup = BeautifulSoup(html, "lxml", parse_only=LISTING_LINKS_STRAINER)
 
                 new_urls = []
-                for a in soup.select("a[href*='/nemovitosti/']"):
+                for a in _LISTING_LINK_SEL.select(soup):
                     href = a.get("href", "").strip()
                     if not href:
                         continue
                     # Skip nav/filter links, pagination, feeds
-                    if re.search(r'/nemovitosti/\?|/nemovitosti/$|/feed/|/nemovitosti/page/', href):
+                    if _SKIP_HREF_RE.search(href):
                         continue
                     full_url = urljoin(BASE_URL, href)
+                    if not _DETAIL_URL_RE.fullmatch(full_url):
+                        continue
                     if full_url not in seen:
                         seen.add(full_url)
                         new_urls.append(full_url)
@@ -143,44 +281,60 @@ class DeluxRealityScraper:
     async def _parse_detail(
         self, client: httpx.AsyncClient, url: str
     ) -> Optional[Dict[str, Any]]:
-        """Fetch and parse a single property detail page."""
+        """Stáhne detail stránky inzerátu a naparsuje ho v process poolu."""
         html = await self._fetch(client, url)
-        soup = BeautifulSoup(html, "html.parser")
+
+        # Parsování je čistě CPU-bound – běží mimo event loop, fetch dalších detailů pokračuje
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            get_parse_pool(), DeluxRealityScraper._parse_detail_html, html, url
+        )
+
+    @staticmethod
+    def _parse_detail_html(html: bytes, url: str) -> Optional[Dict[str, Any]]:
+        """Naparsuje HTML detailu inzerátu (čistá funkce – spouští se v process poolu)."""
+        soup = BeautifulSoup(html, "lxml")
 
         # External ID = URL slug after /nemovitosti/
-        slug_match = re.search(r"/nemovitosti/([^/]+)/?$", url)
-        external_id = slug_match.group(1) if slug_match else url
+        external_id = _external_id(url)
 
         # Title
         h1 = soup.find("h1")
         title = h1.get_text(strip=True) if h1 else ""
         if not title:
-            logger.warning(f"[{self.SOURCE_CODE}] No title at {url}")
+            logger.warning(f"[{DeluxRealityScraper.SOURCE_CODE}] No title at {url}")
             return None
 
+        # Titulek + H2 podtitulek – jednou pro obě detekce
+        h2 = soup.find("h2")
+        header_text = (title + " " + (h2.get_text(" ", strip=True) if h2 else "")).lower()
+
         # Offer type (Prodej / Pronájem) – from H2 subtitle or H1
-        offer_type = self._detect_offer_type(soup, title)
+        offer_type = DeluxRealityScraper._detect_offer_type(header_text)
 
         # Property type – from H1 / H2
-        property_type = self._detect_property_type(soup, title)
+        property_type = DeluxRealityScraper._detect_property_type(header_text)
+
+        # Textové uzly stránky – jeden průchod stromem sdílený extraktory níže
+        texts = soup.find_all(string=True)
 
         # Price
-        price = self._extract_price(soup)
+        price = DeluxRealityScraper._extract_price(texts)
 
         # Area
-        area = self._extract_area(soup)
+        area = DeluxRealityScraper._extract_area(soup, texts)
 
         # Location
-        location = self._extract_location(soup)
+        location = DeluxRealityScraper._extract_location(texts)
 
         # Description
-        description = self._extract_description(soup)
+        description = DeluxRealityScraper._extract_description(soup)
 
         # Photos – empty <a> tags linking to full-size images in wp-content/uploads
-        photos = self._extract_photos(soup, url)
+        photos = DeluxRealityScraper._extract_photos(soup, url)
 
         return {
-            "source_code": self.SOURCE_CODE,
+            "source_code": DeluxRealityScraper.SOURCE_CODE,
             "external_id": external_id,
             "url": url,
             "title": title,
@@ -197,86 +351,102 @@ class DeluxRealityScraper:
     # Field extractors
     # ------------------------------------------------------------------
 
-    def _detect_offer_type(self, soup: BeautifulSoup, title: str) -> str:
-        text = (title + " " + (soup.find("h2").get_text(" ", strip=True) if soup.find("h2") else "")).lower()
-        for keyword, otype in OFFER_TYPE_MAP.items():
-            if keyword in text:
-                return otype
+    @staticmethod
+    def _detect_offer_type(header_text: str) -> str:
+        found = _OFFER_TYPE_RE.findall(header_text)
+        if found:
+            return OFFER_TYPE_MAP[min(found, key=_OFFER_TYPE_RANK.__getitem__)]
         return "Sale"
 
-    def _detect_property_type(self, soup: BeautifulSoup, title: str) -> str:
-        h2 = soup.find("h2")
-        text = (title + " " + (h2.get_text(" ", strip=True) if h2 else "")).lower()
-        for keyword, ptype in PROPERTY_TYPE_MAP.items():
-            if keyword in text:
-                return ptype
+    @staticmethod
+    def _detect_property_type(header_text: str) -> str:
+        found = _PROPERTY_TYPE_RE.findall(header_text)
+        if found:
+            return PROPERTY_TYPE_MAP[min(found, key=_PROPERTY_TYPE_RANK.__getitem__)]
         return "Other"
 
-    def _extract_price(self, soup: BeautifulSoup) -> Optional[float]:
+    @staticmethod
+    def _extract_price(texts: List[str]) -> Optional[float]:
         """Find the primary price (Kč amount) on the page."""
         # Look for the price element that contains Kč, prefer the main offer price
         # It appears near "MÁM ZÁJEM O NEMOVITOST" button or in "### Cena" section
-        for el in soup.find_all(string=re.compile(r"\d[\d\s]+Kč")):
+        for el in texts:
+            # Levný substring test před regexem
+            if "Kč" not in el or not _PRICE_RE.search(el):
+                continue
             raw = el.strip()
             # Skip long strings (descriptions), grab clean price strings
             if len(raw) > 60:
                 continue
-            # Parse digits
-            nums = re.sub(r"[^\d]", "", raw)
-            if nums and int(nums) > 10000:
-                return float(int(nums))
+            # Parse digits – čistá částka ("3 490 000 Kč") bez regexu, jinak všechny číslice
+            value = _to_int(raw.removesuffix("Kč"))
+            if value is None:
+                nums = _NONDIGIT_RE.sub("", raw)
+                value = int(nums) if nums else None
+            if value and value > 10000:
+                return float(value)
         return None
 
-    def _extract_area(self, soup: BeautifulSoup) -> Optional[float]:
+    @staticmethod
+    def _extract_area(soup: BeautifulSoup, texts: List[str]) -> Optional[float]:
         """Extract usable area in m²."""
         # Strategy 1: look for "Plocha" header followed by numeric value
-        for heading in soup.find_all(re.compile(r"^h\d$"), string=re.compile(r"Plocha", re.I)):
-            nxt = heading.find_next(string=re.compile(r"\d+\s*m"))
+        for heading in soup.find_all(_HEADING_TAGS, string=_PLOCHA_RE):
+            nxt = heading.find_next(string=_AREA_VALUE_TEXT_RE)
             if nxt:
-                m = re.search(r"(\d+(?:[.,]\d+)?)", nxt)
+                m = _NUMBER_RE.search(nxt)
                 if m:
                     return float(m.group(1).replace(",", "."))
 
         # Strategy 2: bullet list item "plocha bytu: XX m²"
-        for el in soup.find_all(string=re.compile(r"plocha\s+bytu|užitná\s+plocha|plocha\s+domu", re.I)):
-            m = re.search(r"(\d+(?:[.,]\d+)?)\s*m", el, re.I)
+        for el in texts:
+            if not _AREA_LABEL_RE.search(el):
+                continue
+            m = _AREA_M_RE.search(el)
             if m:
                 return float(m.group(1).replace(",", "."))
 
         # Strategy 3: any text matching standalone "XX m²" pattern
-        for el in soup.find_all(string=re.compile(r"\b\d{2,4}\s*m[²2]")):
-            m = re.search(r"(\d+(?:[.,]\d+)?)\s*m[²2]", el)
+        for el in texts:
+            if "m" not in el or not _AREA_STANDALONE_RE.search(el):
+                continue
+            m = _AREA_SQM_RE.search(el)
             if m:
                 val = float(m.group(1).replace(",", "."))
                 if 10 < val < 2000:
                     return val
         return None
 
-    def _extract_location(self, soup: BeautifulSoup) -> str:
+    @staticmethod
+    def _extract_location(texts: List[str]) -> str:
         """Extract location string from the page."""
         # Look for address-like text near broker/contact info
         # Pattern: "Tovární 16 Znojmo" appears in footer-style block
-        for el in soup.find_all(string=re.compile(r"Znojmo|Hevlín|Šatov|Vrbovec|Mikulovice|Hnanice", re.I)):
+        for el in texts:
+            if not _LOCATION_RE.search(el):
+                continue
             txt = el.strip()
             if 3 < len(txt) < 80:
                 return txt
         return "Znojmo"
 
-    def _extract_description(self, soup: BeautifulSoup) -> str:
+    @staticmethod
+    def _extract_description(soup: BeautifulSoup) -> str:
         """Get the main property description text."""
         # Find the article / main content paragraphs
         paragraphs = []
-        for p in soup.select("p"):
+        for p in _PARAGRAPH_SEL.select(soup):
             txt = p.get_text(" ", strip=True)
             if len(txt) > 80:
                 paragraphs.append(txt)
         return "\n\n".join(paragraphs[:6]) if paragraphs else ""
 
-    def _extract_photos(self, soup: BeautifulSoup, base_url: str) -> List[str]:
+    @staticmethod
+    def _extract_photos(soup: BeautifulSoup, base_url: str) -> List[str]:
         """Extract full-size photo URLs from .dx-ps-gallery imgs (srcset largest width)."""
         photos = []
         seen = set()
-        for img in soup.select(".dx-ps-gallery img"):
+        for img in _GALLERY_IMG_SEL.select(soup):
             full_url = None
             # Prefer srcset: parse and take the largest width entry
             srcset = img.get("srcset", "")
@@ -296,7 +466,7 @@ class DeluxRealityScraper:
             if not full_url:
                 src = img.get("src", "")
                 if src:
-                    full_url = re.sub(r"-\d+x\d+(\.\w+)$", r"\1", src)
+                    full_url = _WP_SIZE_RE.sub(r"\1", src)
             if not full_url:
                 continue
             if not full_url.startswith("http"):
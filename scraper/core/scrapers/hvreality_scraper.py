@@ -1,6 +1,6 @@
 """
 HV Reality scraper (hvreality.cz).
-Strategie: httpx + BeautifulSoup, WordPress/Elementor SSR stránky
+Strategie: httpx + BeautifulSoup (lxml parser), WordPress/Elementor SSR stránky
 """
 import asyncio
 import logging
@@ -10,11 +10,12 @@ from typing import Any, Dict, List, Optional, Tuple
 from urllib.parse import urljoin
 
 import httpx
+import soupsieve as sv
 from bs4 import BeautifulSoup
 
-from ..utils import timer, scraper_metrics_context
+from ..utils import get_parse_pool, timer, scraper_metrics_context
 from ..database import get_db_manager
-from ..http_utils import http_retry
+from ..http_utils import RateLimiter, get_shared_transport, http_retry
 
 logger = logging.getLogger(__name__)
 
@@ -34,6 +35,9 @@ DEFAULT_HEADERS = {
     "Accept-Language": "cs-CZ,cs;q=0.9",
 }
 
+# Pool ≥ detail_concurrency, aby semafor nečekal na volné spojení
+CLIENT_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=16, keepalive_expiry=30)
+
 PROPERTY_TYPE_MAP = {
     "byt": "Byt", "byty": "Byt",
     "dům": "Dům", "dom": "Dům", "rodinný": "Dům", "vila": "Dům",
@@ -43,13 +47,62 @@ PROPERTY_TYPE_MAP = {
     "sklep": "Ostatní", "vinný": "Ostatní", "chalupa": "Dům", "chata": "Dům"
 }
 
+MAX_PHOTOS = 50
+# Kontejnery galerie – <img> uvnitř nich je fotka inzerátu
+_GALLERY_CLASSES = ("gallery", "elementor-gallery-item", "swiper-slide")
+
+# Předkompilované regexy (běží pro každou stránku / řádek parametrů)
+_PRICE_DIGITS_RE = re.compile(r"(\d[\d\s]+)")
+_DIGIT_RE = re.compile(r"\d")
+_AREA_RE = re.compile(r"(\d+)\s*m[²2]")
+_LOC_PREFIX_RE = re.compile(r"^(lokalita|adresa|obec|město):?\s*", re.I)
+_ZNOJMO_RE = re.compile(r"Znojmo|okres Znojmo", re.I)
+_WP_SIZE_RE = re.compile(r"-\d+x\d+(\.[a-zA-Z]+)$")
+
+# Oddělovače tisíců (mezera, nbsp, úzká nbsp, tečka, čárka, tab) – mazací tabulka pro str.translate
+_NUMBER_SEPARATORS = {ord(c): None for c in " \xa0\u202f.,\t"}
+
+# Klíče PROPERTY_TYPE_MAP v jedné alternaci – jeden průchod titulkem;
+# při více shodách vyhrává klíč dřívější v mapě (jako dřív smyčka přes dict)
+_PROPERTY_TYPE_RE = re.compile("|".join(re.escape(k) for k in PROPERTY_TYPE_MAP))
+_PROPERTY_TYPE_RANK = {k: i for i, k in enumerate(PROPERTY_TYPE_MAP)}
+
+# Předkompilované CSS selektory (soupsieve) – kompilace mimo hot path
+_ARTICLE_SEL = sv.compile("article.hentry, .hentry")
+_ARTICLE_TITLE_LINK_SEL = sv.compile(".entry-title a, h1 a, h2 a, h3 a, h4 a, h5 a, h6 a")
+_LINK_SEL = sv.compile("a[href]")
+_HEADING_SEL = sv.compile("h1, h2, h3, h4, h5, h6")
+_LIST_LINK_SEL = sv.compile(
+    "a[href*='/property/'], a[href*='/nemovitost/'], "
+    ".elementor-post__title a, .elementor-post a"
+)
+_NEXT_LINK_SEL = sv.compile("a.next.page-numbers, a.elementor-pagination__next, .pagination a.next")
+_PAGE_LINK_SEL = sv.compile("a[href*='page']")
+_DESCRIPTION_SEL = sv.compile(".elementor-widget-text-editor p, .entry-content p, article p")
+_PARAM_ROW_SEL = sv.compile("tr, li, .elementor-icon-list-item")
+
+
+def _to_int(text: str) -> Optional[int]:
+    """Číslo s oddělovači tisíců ("3 490 000") -> int přes str.translate; jinak None."""
+    digits = text.translate(_NUMBER_SEPARATORS)
+    return int(digits) if digits.isdecimal() else None
+
+
+def _strip_wp_thumb(url: str) -> str:
+    """Odstraní WordPress rozlišení z URL fotky (-150x150.jpg -> .jpg); bez '-' regex nespouští."""
+    return _WP_SIZE_RE.sub(r"\1", url) if "-" in url else url
+
+
 class HvRealityScraper:
     """Scraper pro hvreality.cz."""
 
     SOURCE_CODE = "HVREALITY"
 
-    def __init__(self) -> None:
+    def __init__(self, detail_concurrency: int = 8, max_requests_per_second: float = 4.0) -> None:
         self.scraped_count = 0
+        self.detail_concurrency = detail_concurrency
+        # Zdvořilostní limit na hvreality.cz – místo sleep mezi položkami/stránkami
+        self._rate_limiter = RateLimiter(max_per_second=max_requests_per_second)
         self._http_client: Optional[httpx.AsyncClient] = None
 
     async def run(self, full_rescan: bool = False) -> int:
@@ -59,13 +112,19 @@ class HvRealityScraper:
     async def scrape(self, max_pages: int = 3) -> int:
         logger.info("Starting HV Reality scraper (max_pages=%s)", max_pages)
         with scraper_metrics_context() as metrics:
+            # HTTP/2 – souběžné detaily multiplexované přes jedno spojení. Uvnitř
+            # scrape jobu se http2/limits ignorují – platí sdílený transport jobu.
             async with httpx.AsyncClient(
                 timeout=30,
                 follow_redirects=True,
                 headers=DEFAULT_HEADERS,
+                http2=True,
+                limits=CLIENT_LIMITS,
+                transport=get_shared_transport(),
             ) as client:
                 self._http_client = client
-                
+                sem = asyncio.Semaphore(self.detail_concurrency)
+
                 for start_url in START_URLS:
                     page = 1
                     current_url = start_url
@@ -84,21 +143,20 @@ class HvRealityScraper:
 
                             logger.info("Page %s: found %s listings", page, len(items))
 
-                            for item in items:
-                                try:
-                                    detail_html = await self._fetch(item["url"])
-                                    normalized = self._parse_detail_page(detail_html, item)
-                                    await self._save_listing(normalized)
-                                    self.scraped_count += 1
-                                    metrics.increment_scraped()
-                                    await asyncio.sleep(0.5)
-                                except Exception as exc:
-                                    logger.error("Error processing %s: %s", item.get("url"), exc)
-                                    metrics.increment_failed()
+                            # Detaily paralelně, omezeno semaforem (místo sleep mezi položkami);
+                            # _process_item chyby zachytává, TaskGroup hlídá zrušení
+                            async with asyncio.TaskGroup() as tg:
+                                tasks = [
+                                    tg.create_task(self._process_item(item, sem, metrics))
+                                    for item in items
+                                ]
+                            # Celá stránka výpisu jedním bulk upsertem
+                            await self._save_listings(
+                                [t.result() for t in tasks if t.result() is not None], metrics
+                            )
 
                             current_url = next_url
                             page += 1
-                            await asyncio.sleep(1.0)
 
                         except httpx.HTTPStatusError as exc:
                             logger.error("HTTP error page %s: %s", page, exc)
@@ -112,16 +170,35 @@ class HvRealityScraper:
         logger.info("HV Reality scraper done. Scraped %s", self.scraped_count)
         return self.scraped_count
 
+    async def _process_item(
+        self, item: Dict[str, Any], sem: asyncio.Semaphore, metrics: Any
+    ) -> Optional[Dict[str, Any]]:
+        """Stáhne a naparsuje detail jedné položky výpisu pod semaforem."""
+        async with sem:
+            try:
+                detail_html = await self._fetch(item["url"])
+                # Parsování je CPU-bound – běží v process poolu, fetch dalších detailů pokračuje
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(
+                    get_parse_pool(), HvRealityScraper._parse_detail_page, detail_html, item
+                )
+            except Exception as exc:
+                logger.error("Error processing %s: %s", item.get("url"), exc)
+                metrics.increment_failed()
+                return None
+
     @http_retry
-    async def _fetch(self, url: str) -> str:
+    async def _fetch(self, url: str) -> bytes:
+        """Surové bajty stránky – lxml si kódování vezme z <meta charset>."""
         if self._http_client is None:
             raise RuntimeError("HTTP client not initialized")
-        response = await self._http_client.get(url)
+        async with self._rate_limiter:
+            response = await self._http_client.get(url)
         response.raise_for_status()
-        return response.text
+        return response.content
 
-    def _parse_list_page(self, html: str, current_url: str) -> Tuple[List[Dict[str, Any]], Optional[str]]:
-        soup = BeautifulSoup(html, "html.parser")
+    def _parse_list_page(self, html: bytes, current_url: str) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        soup = BeautifulSoup(html, "lxml")
         results: List[Dict[str, Any]] = []
         seen_urls: set = set()
 
@@ -136,64 +213,68 @@ class HvRealityScraper:
             results.append({"url": full_url, "title": title[:200] if title else ""})
 
         # Priorita 1: WordPress .hentry articles (hvreality.cz téma)
-        for article in soup.select("article.hentry, .hentry"):
-            title_el = article.select_one(".entry-title a, h1 a, h2 a, h3 a, h4 a, h5 a, h6 a")
+        for article in _ARTICLE_SEL.select(soup):
+            title_el = _ARTICLE_TITLE_LINK_SEL.select_one(article)
             if title_el and title_el.get("href"):
                 _add_item(title_el["href"], title_el.get_text(strip=True))
                 continue
             # Fallback – první non-trivial <a> v article
-            for a in article.select("a[href]"):
+            for a in _LINK_SEL.select(article):
                 href = a.get("href", "")
                 if len(href) > 30 and href.startswith("http"):
-                    title_txt = article.select_one("h1,h2,h3,h4,h5,h6")
+                    title_txt = _HEADING_SEL.select_one(article)
                     _add_item(href, title_txt.get_text(strip=True) if title_txt else a.get_text(strip=True))
                     break
 
         # Priorita 2: Elementor post grid (fallback pro jiná témata)
         if not results:
-            for link in soup.select(
-                "a[href*='/property/'], a[href*='/nemovitost/'], "
-                ".elementor-post__title a, .elementor-post a"
-            ):
+            for link in _LIST_LINK_SEL.select(soup):
                 href = link.get("href", "")
                 if not href or "#" in href:
                     continue
-                title_el = link.select_one("h1, h2, h3, h4, h5, h6")
+                title_el = _HEADING_SEL.select_one(link)
                 title = title_el.get_text(strip=True) if title_el else link.get_text(strip=True)
                 _add_item(href, title)
 
         # Find next page URL
         next_url = None
-        next_link = soup.select_one("a.next.page-numbers, a.elementor-pagination__next, .pagination a.next")
+        next_link = _NEXT_LINK_SEL.select_one(soup)
         if next_link and next_link.get("href"):
             next_url = urljoin(BASE_URL, next_link.get("href"))
         else:
-            for a in soup.find_all("a"):
+            # Jen odkazy s "page" v href – text se čte až u kandidátů, ne u všech <a>
+            for a in _PAGE_LINK_SEL.select(soup):
                 text = a.get_text(strip=True).lower()
                 if "další" in text or "next" in text or "»" in text:
-                    href = a.get("href")
-                    if href and "page" in href:
-                        next_url = urljoin(BASE_URL, href)
-                        break
+                    next_url = urljoin(BASE_URL, a["href"])
+                    break
 
         return results, next_url
 
-    def _parse_price(self, price_text: str) -> Optional[float]:
+    @staticmethod
+    def _parse_price(price_text: str) -> Optional[float]:
         if not price_text:
             return None
-        match = re.search(r'(\d[\d\s]+)', price_text)
+        match = _PRICE_DIGITS_RE.search(price_text)
         if match:
-            price_str = match.group(1).replace(' ', '').replace('\xa0', '')
-            try:
-                return float(price_str)
-            except ValueError:
-                return None
+            value = _to_int(match.group(1).strip())
+            return float(value) if value is not None else None
         return None
 
-    def _parse_detail_page(self, html: str, list_item: Dict[str, Any]) -> Dict[str, Any]:
-        soup = BeautifulSoup(html, "html.parser")
+    @staticmethod
+    def _detect_property_type(title_lower: str) -> str:
+        """Typ nemovitosti z názvu (lowercase) podle PROPERTY_TYPE_MAP."""
+        found = _PROPERTY_TYPE_RE.findall(title_lower)
+        if found:
+            return PROPERTY_TYPE_MAP[min(found, key=_PROPERTY_TYPE_RANK.__getitem__)]
+        return "Ostatní"
+
+    @staticmethod
+    def _parse_detail_page(html: bytes, list_item: Dict[str, Any]) -> Dict[str, Any]:
+        """Naparsuje HTML detailu inzerátu (čistá funkce – spouští se v process poolu)."""
+        soup = BeautifulSoup(html, "lxml")
         result: Dict[str, Any] = {
-            "source_code": self.SOURCE_CODE,
+            "source_code": HvRealityScraper.SOURCE_CODE,
             "url": list_item["url"],
         }
 
@@ -205,41 +286,42 @@ class HvRealityScraper:
             title_el.get_text(" ", strip=True)[:200] if title_el else list_item.get("title", "")
         )
 
+        # Textové uzly stránky – jeden průchod stromem pro cenu i fallback lokace
+        texts = soup.find_all(string=True)
+
         # Cena
         price_text = ""
-        for el in soup.find_all(string=lambda t: t and ("Kč" in t or "CZK" in t)):
+        for el in texts:
+            if "Kč" not in el and "CZK" not in el:
+                continue
             stripped = el.strip()
-            if re.search(r"\d", stripped) and len(stripped) < 50:
+            if _DIGIT_RE.search(stripped) and len(stripped) < 50:
                 price_text = stripped
                 break
-        result["price"] = self._parse_price(price_text)
+        result["price"] = HvRealityScraper._parse_price(price_text)
 
         # Typ nemovitosti z názvu
         title_lower = result["title"].lower()
-        result["property_type"] = "Ostatní"
-        for keyword, ptype in PROPERTY_TYPE_MAP.items():
-            if keyword in title_lower:
-                result["property_type"] = ptype
-                break
+        result["property_type"] = HvRealityScraper._detect_property_type(title_lower)
 
         # Offer type
         result["offer_type"] = "Pronájem" if "pronájem" in title_lower or "pronajm" in title_lower else "Prodej"
 
         # Popis
         desc_parts = []
-        for p in soup.select(".elementor-widget-text-editor p, .entry-content p, article p"):
+        for p in _DESCRIPTION_SEL.select(soup):
             text = p.get_text(" ", strip=True)
             if len(text) > 20:
                 desc_parts.append(text)
         result["description"] = "\n\n".join(desc_parts)[:5000]
 
         # Parametry
-        for row in soup.select("tr, li, .elementor-icon-list-item"):
+        for row in _PARAM_ROW_SEL.select(soup):
             text = row.get_text(" ", strip=True).lower()
             
             # Plocha
             if "plocha" in text and ("m2" in text or "m²" in text):
-                match = re.search(r'(\d+)\s*m[²2]', text)
+                match = _AREA_RE.search(text)
                 if match:
                     area_val = float(match.group(1))
                     if "pozem" in text or "parcel" in text:
@@ -249,46 +331,65 @@ class HvRealityScraper:
             
             # Lokace
             if "lokalita" in text or "adresa" in text or "obec" in text or "město" in text:
-                clean_text = re.sub(r'^(lokalita|adresa|obec|město):?\s*', '', text, flags=re.I)
+                clean_text = _LOC_PREFIX_RE.sub('', text)
                 if clean_text and len(clean_text) > 3:
                     result["location_text"] = clean_text.title()[:200]
 
         if "location_text" not in result or not result["location_text"]:
-            loc_candidates = soup.find_all(string=re.compile(r'Znojmo|okres Znojmo', re.I))
-            if loc_candidates:
-                result["location_text"] = loc_candidates[0].strip()[:200]
+            loc_candidate = next((t for t in texts if _ZNOJMO_RE.search(t)), None)
+            if loc_candidate:
+                result["location_text"] = loc_candidate.strip()[:200]
             else:
                 result["location_text"] = "Znojmo a okolí"
 
-        # Fotky
-        photo_urls = []
-        for img in soup.select(".gallery img, .elementor-gallery-item img, .swiper-slide img, img[data-src]"):
-            src = img.get("data-src") or img.get("data-large_image") or img.get("src")
-            if src and not src.endswith(".svg"):
-                full_url = urljoin(BASE_URL, src)
-                # Odstranění rozlišení z WordPress URL (např. -150x150.jpg -> .jpg)
-                full_url = re.sub(r'-\d+x\d+(\.[a-zA-Z]+)$', r'\1', full_url)
-                if full_url not in photo_urls:
-                    photo_urls.append(full_url)
-        
-        if not photo_urls:
-            for img in soup.find_all("img"):
-                src = img.get("src", "")
-                if ("foto" in src.lower() or "gallery" in src.lower() or "uploads" in src.lower()) and not src.endswith(".svg"):
-                    full_url = urljoin(BASE_URL, src)
-                    full_url = re.sub(r'-\d+x\d+(\.[a-zA-Z]+)$', r'\1', full_url)
-                    if full_url not in photo_urls:
+        # Fotky – jeden průchod přes <img>: galerie (primární) i heuristika podle src (fallback)
+        photo_urls: List[str] = []
+        fallback_urls: List[str] = []
+        seen: set = set()
+        fallback_seen: set = set()
+        for img in soup.find_all("img"):
+            if img.get("data-src") or img.find_parent(class_=_GALLERY_CLASSES):
+                src = img.get("data-src") or img.get("data-large_image") or img.get("src")
+                if src and not src.endswith(".svg"):
+                    full_url = _strip_wp_thumb(urljoin(BASE_URL, src))
+                    if full_url not in seen:
+                        seen.add(full_url)
                         photo_urls.append(full_url)
+                        if len(photo_urls) >= MAX_PHOTOS:
+                            break
+            elif not photo_urls:
+                src = img.get("src", "")
+                src_lower = src.lower()
+                if ("foto" in src_lower or "gallery" in src_lower or "uploads" in src_lower) and not src.endswith(".svg"):
+                    full_url = _strip_wp_thumb(urljoin(BASE_URL, src))
+                    if full_url not in fallback_seen and len(fallback_urls) < MAX_PHOTOS:
+                        fallback_seen.add(full_url)
+                        fallback_urls.append(full_url)
 
-        result["photos"] = photo_urls[:50]
+        result["photos"] = photo_urls or fallback_urls
 
         return result
 
-    async def _save_listing(self, listing: Dict[str, Any]) -> None:
+    async def _save_listings(self, listings: List[Dict[str, Any]], metrics: Any) -> None:
+        """Uloží listingy bulk upsertem; když dávka selže, zkusí je uložit po jednom."""
+        if not listings:
+            return
+        db = get_db_manager()
         try:
-            db = get_db_manager()
-            listing_id = await db.upsert_listing(listing)
-            logger.info(f"Saved listing {listing_id}: {listing.get('title', 'N/A')[:50]} | {listing.get('price', 'N/A')} Kč")
+            saved = await db.upsert_listings_bulk(listings)
         except Exception as exc:
-            logger.error(f"Failed to save listing: {exc}")
-            raise
+            logger.warning(f"Bulk save of {len(listings)} listings failed ({exc}), retrying one by one")
+            for listing in listings:
+                try:
+                    await db.upsert_listing(listing)
+                    self.scraped_count += 1
+                    metrics.increment_scraped()
+                except Exception as row_exc:
+                    logger.error(f"Failed to save listing {listing.get('url')}: {row_exc}")
+                    metrics.increment_failed()
+            return
+
+        self.scraped_count += len(listings)
+        for _ in listings:
+            metrics.increment_scraped()
+        logger.info(f"Saved {saved}/{len(listings)} listings (rest excluded by filters)")
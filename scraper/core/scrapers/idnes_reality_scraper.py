@@ -3,28 +3,130 @@ Idnes Reality scraper for Czech real estate listings.
 
 Strategy:
 - Sitemap-based discovery (https://reality.idnes.cz/sitemap.xml)
-- Detail pages only (SSR via httpx + BeautifulSoup)
+- Detail pages only (SSR via httpx + BeautifulSoup, lxml parser)
 - No Playwright needed (server-rendered HTML)
 """
 import asyncio
 import gzip
+import io
 import logging
 import re
-import time
 import xml.etree.ElementTree as ET
-from typing import Any, Dict, List, Optional
-from urllib.parse import urljoin
+from typing import Any, Dict, List, Optional, Tuple
 
 import httpx
+import soupsieve as sv
 from bs4 import BeautifulSoup
+from bs4.filter import ElementFilter
 
-from ..http_utils import http_retry
+from ..http_utils import RateLimiter, get_shared_transport, http_retry
 
-from ..utils import timer, scraper_metrics_context
+from ..utils import get_parse_pool, timer, scraper_metrics_context
 from ..database import get_db_manager
 
 logger = logging.getLogger(__name__)
 
+# Velikost dávky pro upsert_listings_bulk (kompromis round-tripy vs. velikost transakce)
+UPSERT_BATCH_SIZE = 50
+
+# Max. počet fotek na inzerát
+MAX_PHOTOS = 50
+
+# Pool ≥ detail_concurrency, aby semafor nečekal na volné spojení
+CLIENT_LIMITS = httpx.Limits(max_connections=20, max_keepalive_connections=20, keepalive_expiry=60)
+
+# Typ nemovitosti podle segmentu URL (část před první '-')
+_PROPERTY_TYPE_BY_SEGMENT = {
+    "byt": "Apartment",
+    "dum": "House",
+    "domy": "House",
+    "pozemek": "Land",
+    "chata": "Cottage",
+    "chalupa": "Cottage",
+    "komercni": "Commercial",
+    "komerci": "Commercial",
+    "garaz": "Garage",
+}
+# Pořadí, když URL obsahuje víc typových segmentů
+_PROPERTY_TYPE_PRIORITY = ("Apartment", "House", "Land", "Cottage", "Commercial", "Garage")
+
+# Předkompilované regexy (běží pro každý detail inzerátu)
+_TITLE_CLASS_RE = re.compile("title|heading|main-title")
+# Plausible Czech price: 4-9 digits optionally separated by spaces/dots
+_PRICE_RE = re.compile(r"\b(\d[\d\s.]{2,10}\d)\s*(Kč|CZK)")
+_NONDIGIT_RE = re.compile(r"[^\d]")
+_AREA_ROW_RE = re.compile(r"Plocha\D+?(\d+)\s*m", re.IGNORECASE)
+_AREA_TITLE_RE = re.compile(r"(\d+)\s*m[²2]")
+
+# Tagy, které _DetailElementFilter ponechá vždy
+_DETAIL_KEEP_TAGS = frozenset(("h1", "meta", "img", "p"))
+
+
+class _DetailElementFilter(ElementFilter):
+    """
+    parse_only filtr detailu – strom se staví jen z elementů, které extraktory čtou.
+
+    Ponechá h1/meta/img/p, elementy s itemprop a s třídami b-detail*/b-desc/cena
+    (i s celým podstromem, takže selektory přes předka typu ".b-detail__info
+    .icoi-location" fungují dál). Navigace, skripty a patička se vůbec nestaví.
+    """
+
+    def allow_tag_creation(self, nsprefix, name, attrs) -> bool:
+        if name in _DETAIL_KEEP_TAGS:
+            return True
+        if not attrs:
+            return False
+        if "itemprop" in attrs:
+            return True
+        classes = attrs.get("class") or ""
+        if not isinstance(classes, str):
+            classes = " ".join(classes)
+        return "b-detail" in classes or "b-desc" in classes or "cena" in classes
+
+    def allow_string_creation(self, string) -> bool:
+        # Volný text mimo ponechané elementy nikdo nečte
+        return False
+
+
+_DETAIL_FILTER = _DetailElementFilter()
+
+def _compile_fallbacks(*selectors: str) -> Tuple[Any, Tuple[Any, ...]]:
+    """Sloučený selektor (jeden průchod stromem) + jednotlivé selektory v pořadí priority."""
+    return sv.compile(", ".join(selectors)), tuple(sv.compile(sel) for sel in selectors)
+
+
+def _select_first(soup: BeautifulSoup, fallbacks: Tuple[Any, Tuple[Any, ...]]) -> Optional[Any]:
+    """
+    Vrátí element odpovídající selektoru s nejvyšší prioritou.
+
+    Sloučený selektor by sám vrátil první shodu v pořadí dokumentu, proto
+    kandidáty z jediného průchodu ještě seřadíme podle pořadí fallbacků.
+    """
+    group_sel, ordered_sels = fallbacks
+    candidates = group_sel.select(soup)
+    if not candidates:
+        return None
+    for sel in ordered_sels:
+        for elem in candidates:
+            if sel.match(elem):
+                return elem
+    return None
+
+
+# Předkompilované CSS selektory detailu (soupsieve) – fallback řetězy v pořadí priority
+_PRICE_SELS = _compile_fallbacks(".b-detail__price", ".cena", "[itemprop='price']")
+_LOCATION_SELS = _compile_fallbacks(
+    ".b-detail__info .icoi-location",
+    ".b-detail__info-item--location",
+    "[itemprop='addressLocality']",
+    ".b-detail__place",
+)
+_DESCRIPTION_SELS = _compile_fallbacks(
+    ".b-detail__desc", ".b-detail__text", ".b-desc", "[itemprop='description']",
+)
+_PARAGRAPH_SEL = sv.compile("p")
+_AREA_ROW_SEL = sv.compile(".b-detail__info-item, .b-detail__param")
+
 
 class IdnesRealityScraper:
     """Scraper for reality.idnes.cz (Czech News Agency real estate portal)."""
@@ -52,11 +154,21 @@ class IdnesRealityScraper:
         "dolni-kounice",
         "velke-nemcice",
     ]
+    # Slugy v jedné alternaci – jeden průchod URL bez .lower() kopie pro každý <loc>
+    _TARGET_SLUG_RE = re.compile("|".join(re.escape(slug) for slug in TARGET_URL_SLUGS), re.IGNORECASE)
     SOURCE_CODE = "IDNES"
 
-    def __init__(self):
-        """Initialize the scraper."""
+    def __init__(self, detail_concurrency: int = 8, max_requests_per_second: float = 4.0):
+        """
+        Initialize the scraper.
+
+        Args:
+            detail_concurrency: Max počet souběžně stahovaných detail stránek.
+            max_requests_per_second: Zdvořilostní limit requestů na reality.idnes.cz.
+        """
         self.scraped_count = 0
+        self.detail_concurrency = detail_concurrency
+        self._rate_limiter = RateLimiter(max_per_second=max_requests_per_second)
         self._http_client: Optional[httpx.AsyncClient] = None
 
     async def run(self, full_rescan: bool = False) -> int:
@@ -70,24 +182,33 @@ class IdnesRealityScraper:
             Number of successfully scraped listings
         """
         max_pages = 999 if full_rescan else 100
-        return await self.scrape(max_pages=max_pages)
+        return await self.scrape(max_pages=max_pages, full_rescan=full_rescan)
 
-    async def scrape(self, max_pages: int = 100) -> int:
+    async def scrape(self, max_pages: int = 100, full_rescan: bool = False) -> int:
         """
         Main scraping orchestrator.
 
         Args:
             max_pages: Maximum detail pages to process
+            full_rescan: False = detaily inzerátů, které už jsou v DB aktivní, se přeskočí;
+                True = známé detaily se stahují podmíněně (ETag / Last-Modified)
 
         Returns:
             Number of scraped listings
         """
         logger.info(f"Starting Idnes Reality scraper (max_pages={max_pages})")
+        saved_count = 0
+        skipped_ids: List[str] = []
 
         with scraper_metrics_context() as metrics:
+            # HTTP/2 – všechny detaily jdou na reality.idnes.cz, multiplexují se přes
+            # jedno spojení. Uvnitř scrape jobu platí sdílený transport jobu.
             async with httpx.AsyncClient(
-                timeout=30,
+                timeout=httpx.Timeout(30.0, connect=5.0),
                 follow_redirects=True,
+                http2=True,
+                limits=CLIENT_LIMITS,
+                transport=get_shared_transport(),
             ) as client:
                 self._http_client = client
 
@@ -102,28 +223,46 @@ class IdnesRealityScraper:
 
                     logger.info(f"Found {len(listing_urls)} listings in sitemap")
 
-                    # 🔥 Process detail pages
-                    count = 0
-                    for idx, listing_url in enumerate(listing_urls[:max_pages]):
-                        try:
-                            with timer(f"Fetch detail {idx + 1}/{min(len(listing_urls), max_pages)}"):
-                                detail_html = await self._fetch_page(listing_url)
-
-                            normalized = self._parse_detail_page(detail_html, listing_url)
-
-                            if normalized:
-                                await self._save_listing(normalized)
-                                count += 1
-                                metrics.increment_scraped()
-
-                        except Exception as exc:
-                            logger.error(f"Error processing listing {listing_url}: {exc}")
-                            metrics.increment_failed()
-
-                        # Throttling
-                        await asyncio.sleep(0.5)
-
-                    self.scraped_count = count
+                    # 🔥 Inkrementálně jen nové inzeráty – jeden DB dotaz místo N fetchů.
+                    # Filtr před max_pages, ať limit připadne na nové inzeráty.
+                    validators: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+                    if not full_rescan:
+                        listing_urls, skipped_ids = await self._skip_known_listings(listing_urls)
+                    else:
+                        validators = await self._load_http_validators()
+
+                    # 🔥 Process detail pages – paralelně, omezeno semaforem a rate limitem;
+                    # ukládá se průběžně po dávkách v pořadí dokončení
+                    detail_urls = listing_urls[:max_pages]
+                    sem = asyncio.Semaphore(self.detail_concurrency)
+                    batch: List[Dict[str, Any]] = []
+                    not_modified: List[str] = []
+                    for next_done in asyncio.as_completed([
+                        self._process_listing(
+                            listing_url, idx, len(detail_urls), sem, metrics, validators, not_modified
+                        )
+                        for idx, listing_url in enumerate(detail_urls)
+                    ]):
+                        normalized = await next_done
+                        if not normalized:
+                            continue
+                        batch.append(normalized)
+                        if len(batch) >= UPSERT_BATCH_SIZE:
+                            saved_count += await self._flush_batch(batch, metrics)
+                            batch.clear()
+                    if batch:
+                        saved_count += await self._flush_batch(batch, metrics)
+
+                    # 304 Not Modified a přeskočené známé inzeráty – data v DB platí,
+                    # jen posuneme last_seen_at (viděné, ne uložené)
+                    seen_count = 0
+                    if not_modified:
+                        seen_count += await self._touch_seen(not_modified, "Not modified")
+                    if skipped_ids:
+                        seen_count += await self._touch_seen(skipped_ids, "Known (skipped)")
+
+                    # Vrací viděné inzeráty (uložené + potvrzené v DB); 0 = alert rozbitého scraperu
+                    self.scraped_count = saved_count + seen_count
 
                 except Exception as exc:
                     logger.error(f"Scraping failed: {exc}")
@@ -132,7 +271,10 @@ class IdnesRealityScraper:
                 finally:
                     self._http_client = None
 
-        logger.info(f"Idnes Reality scraper finished. Scraped {self.scraped_count} listings")
+        logger.info(
+            f"Idnes Reality scraper finished. Saved {saved_count} listings, "
+            f"skipped {len(skipped_ids)} known"
+        )
         return self.scraped_count
 
     async def _fetch_all_listing_urls(self) -> List[str]:
@@ -149,50 +291,170 @@ class IdnesRealityScraper:
         if self._http_client is None:
             raise RuntimeError("HTTP client not initialized")
 
-        ns = self.SITEMAP_NS
+        # Sub-sitemapy jsou nezávislé – stahují se souběžně (čas = nejpomalejší, ne součet)
+        results = await asyncio.gather(
+            *(self._fetch_one_sitemap(name) for name in self.LISTING_SITEMAPS),
+            return_exceptions=True,
+        )
         urls: List[str] = []
-
-        for sitemap_name in self.LISTING_SITEMAPS:
-            sitemap_url = self.SITEMAP_BASE + sitemap_name
-            try:
-                logger.debug(f"Fetching gz sitemap: {sitemap_url}")
-                response = await self._http_client.get(sitemap_url)
-                response.raise_for_status()
-
-                # Decompress gzip content
-                xml_bytes = gzip.decompress(response.content)
-                root = ET.fromstring(xml_bytes)
-
-                batch_urls = [
-                    loc_elem.text
-                    for loc_elem in root.findall(f".//{{{ns}}}loc")
-                    if loc_elem.text
-                    and "/detail/" in loc_elem.text
-                    and any(slug in loc_elem.text.lower() for slug in self.TARGET_URL_SLUGS)
-                ]
-                urls.extend(batch_urls)
-                logger.info(f"Sitemap {sitemap_name}: {len(batch_urls)} target-area URLs")
-
-            except Exception as exc:
-                logger.error(f"Failed to process sitemap {sitemap_name}: {exc}")
+        for sitemap_name, result in zip(self.LISTING_SITEMAPS, results):
+            if isinstance(result, BaseException):
+                logger.error(f"Failed to process sitemap {sitemap_name}: {result}")
+                continue
+            urls.extend(result)
 
         logger.info(f"Total target-area detail URLs found: {len(urls)}")
         return urls
 
+    async def _skip_known_listings(self, listing_urls: List[str]) -> Tuple[List[str], List[str]]:
+        """Vyřadí URL inzerátů, které už jsou v DB aktivní; vrací (zbylé URL, external_id přeskočených)."""
+        try:
+            known_ids = await get_db_manager().get_known_external_ids(self.SOURCE_CODE)
+        except Exception as exc:
+            logger.warning(f"Could not load known IDNES listings, fetching all: {exc}")
+            return listing_urls, []
+
+        new_urls: List[str] = []
+        skipped_ids: List[str] = []
+        for url in listing_urls:
+            external_id = self._extract_external_id(url)
+            if external_id in known_ids:
+                skipped_ids.append(external_id)
+            else:
+                new_urls.append(url)
+        if skipped_ids:
+            logger.info(f"Skipping {len(skipped_ids)} already known listings")
+        return new_urls, skipped_ids
+
+    async def _load_http_validators(self) -> Dict[str, Tuple[Optional[str], Optional[str]]]:
+        """Načte uložené ETag / Last-Modified detailů; při chybě DB se stahuje bez podmínek."""
+        try:
+            return await get_db_manager().get_http_validators(self.SOURCE_CODE)
+        except Exception as exc:
+            logger.warning(f"Could not load IDNES HTTP validators, fetching unconditionally: {exc}")
+            return {}
+
+    async def _fetch_one_sitemap(self, sitemap_name: str) -> List[str]:
+        """Stáhne jednu gz sub-sitemapu a vrátí její detail URL z cílové oblasti."""
+        if self._http_client is None:
+            raise RuntimeError("HTTP client not initialized")
+
+        sitemap_url = self.SITEMAP_BASE + sitemap_name
+        logger.debug("Fetching gz sitemap: %s", sitemap_url)
+        response = await self._http_client.get(sitemap_url)
+        response.raise_for_status()
+
+        # Rozbalení + parsování je CPU práce – mimo event loop, ať běží fetch ostatních
+        batch_urls = await asyncio.to_thread(self._parse_sitemap, response.content)
+        logger.info("Sitemap %s: %d target-area URLs", sitemap_name, len(batch_urls))
+        return batch_urls
+
+    @classmethod
+    def _parse_sitemap(cls, gz_content: bytes) -> List[str]:
+        """
+        Vybere z gz sitemapy detail URL cílových lokalit.
+
+        Streamované rozbalení + iterparse – celý rozbalený XML ani DOM sitemapy
+        se nedrží v paměti, zpracované <url> se hned uvolní.
+        """
+        loc_tag = f"{{{cls.SITEMAP_NS}}}loc"
+        url_tag = f"{{{cls.SITEMAP_NS}}}url"
+        batch_urls: List[str] = []
+        with gzip.GzipFile(fileobj=io.BytesIO(gz_content)) as xml_stream:
+            for _event, elem in ET.iterparse(xml_stream, events=("end",)):
+                if elem.tag == loc_tag:
+                    loc = elem.text
+                    if loc and "/detail/" in loc and cls._TARGET_SLUG_RE.search(loc):
+                        batch_urls.append(loc)
+                elif elem.tag == url_tag:
+                    elem.clear()
+        return batch_urls
+
+    async def _process_listing(
+        self,
+        listing_url: str,
+        idx: int,
+        total: int,
+        sem: asyncio.Semaphore,
+        metrics: Any,
+        validators: Dict[str, Tuple[Optional[str], Optional[str]]],
+        not_modified: List[str],
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Stáhne a naparsuje jeden detail pod semaforem; chyby loguje a vrací None.
+
+        Nezměněný detail (304) se neparsuje – jeho external_id přibude do not_modified.
+        """
+        external_id = self._extract_external_id(listing_url)
+        async with sem:
+            try:
+                with timer(f"Fetch detail {idx + 1}/{total}"):
+                    fetched = await self._fetch_page(listing_url, *validators.get(external_id, (None, None)))
+                if fetched is None:
+                    not_modified.append(external_id)
+                    return None
+                detail_html, encoding, etag, last_modified = fetched
+                # Parsování je CPU-bound – běží v process poolu, fetch dalších detailů pokračuje
+                loop = asyncio.get_running_loop()
+                normalized = await loop.run_in_executor(
+                    get_parse_pool(),
+                    IdnesRealityScraper._parse_detail_page,
+                    detail_html,
+                    listing_url,
+                    encoding,
+                )
+                if normalized:
+                    normalized["etag"] = etag
+                    normalized["last_modified"] = last_modified
+                return normalized
+            except Exception as exc:
+                logger.error(f"Error processing listing {listing_url}: {exc}")
+                metrics.increment_failed()
+                return None
+
     @http_retry
-    async def _fetch_page(self, url: str) -> str:
-        """Fetch detail page via HTTP. Opakuje při 429/503."""
+    async def _fetch_page(
+        self, url: str, etag: Optional[str] = None, last_modified: Optional[str] = None
+    ) -> Optional[Tuple[bytes, Optional[str], Optional[str], Optional[str]]]:
+        """
+        Fetch detail page via HTTP. Opakuje při 429/503.
+
+        Se známým ETag / Last-Modified posílá podmíněný GET (If-None-Match /
+        If-Modified-Since).
+
+        Returns:
+            (surové bajty těla, kódování z hlaviček, ETag, Last-Modified) – bez
+            dekódování do str; None pokud server vrátil 304 Not Modified
+        """
         if self._http_client is None:
             raise RuntimeError("HTTP client not initialized")
 
-        logger.debug(f"Fetching: {url}")
-        response = await self._http_client.get(url)
+        headers: Dict[str, str] = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+        # Lazy %-formátování – řetězec se sestaví jen když je DEBUG zapnutý
+        logger.debug("Fetching: %s", url)
+        async with self._rate_limiter:
+            response = await self._http_client.get(url, headers=headers)
+        if response.status_code == httpx.codes.NOT_MODIFIED:
+            return None
         response.raise_for_status()
-        return response.text
+        return (
+            response.content,
+            response.encoding,
+            response.headers.get("ETag"),
+            response.headers.get("Last-Modified"),
+        )
 
-    def _parse_detail_page(self, html: str, url: str) -> Optional[Dict[str, Any]]:
+    @staticmethod
+    def _parse_detail_page(
+        html: bytes, url: str, encoding: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
         """
-        Parse detail page HTML.
+        Parse detail page HTML (čistá funkce – spouští se v process poolu).
 
         Extracts:
         - Title
@@ -204,50 +466,43 @@ class IdnesRealityScraper:
         - Description
         - Area (if available)
         """
-        soup = BeautifulSoup(html, "html.parser")
+        # lxml (C parser) místo html.parser; známé kódování přeskočí detekci;
+        # strom jen z elementů, které extraktory níže čtou
+        soup = BeautifulSoup(html, "lxml", from_encoding=encoding, parse_only=_DETAIL_FILTER)
 
         try:
             # Extract title
-            title_elem = soup.find("h1", class_=re.compile("title|heading|main-title"))
+            title_elem = soup.find("h1", class_=_TITLE_CLASS_RE)
             if not title_elem:
-                title_elem = soup.select_one("h1")
+                title_elem = soup.find("h1")
             title = title_elem.get_text(strip=True) if title_elem else "N/A"
 
             # Extract price - IDNES uses .b-detail__price
             price = None
-            for sel in [".b-detail__price", ".cena", "[itemprop='price']"]:
-                price_elem = soup.select_one(sel)
-                if price_elem:
-                    price_text = price_elem.get_text(strip=True)
-                    # IDNES wraps digits with ZWJ (\u200d) and NBSP (\u00a0) – strip them first
-                    price_text = price_text.replace("\u200d", "").replace("\u00a0", " ")
-                    # Match a plausible Czech price: 4-9 digits optionally separated by spaces/dots
-                    # e.g. "1 500 000 Kč" or "2.500.000 Kč" or "950000 Kč"
-                    price_match = re.search(r"\b(\d[\d\s.]{2,10}\d)\s*(Kč|CZK)", price_text)
-                    if price_match:
-                        digits = re.sub(r"[^\d]", "", price_match.group(1))
-                        try:
-                            val = int(digits)
-                            # Sanity check: 10 000 – 500 000 000 Kč
-                            if 10_000 <= val <= 500_000_000:
-                                price = val
-                        except ValueError:
-                            pass
-                    break
+            price_elem = _select_first(soup, _PRICE_SELS)
+            if price_elem:
+                price_text = price_elem.get_text(strip=True)
+                # IDNES wraps digits with ZWJ (\u200d) and NBSP (\u00a0) – strip them first
+                price_text = price_text.replace("\u200d", "").replace("\u00a0", " ")
+                # Match a plausible Czech price: 4-9 digits optionally separated by spaces/dots
+                # e.g. "1 500 000 Kč" or "2.500.000 Kč" or "950000 Kč"
+                price_match = _PRICE_RE.search(price_text)
+                if price_match:
+                    digits = _NONDIGIT_RE.sub("", price_match.group(1))
+                    try:
+                        val = int(digits)
+                        # Sanity check: 10 000 – 500 000 000 Kč
+                        if 10_000 <= val <= 500_000_000:
+                            price = val
+                    except ValueError:
+                        pass
 
             # Extract location - try HTML first, fallback to URL slug
             # IDNES uses .b-detail__info-item or address elements
             location = None
-            for sel in [
-                ".b-detail__info .icoi-location",
-                ".b-detail__info-item--location",
-                "[itemprop='addressLocality']",
-                ".b-detail__place",
-            ]:
-                elem = soup.select_one(sel)
-                if elem:
-                    location = elem.get_text(strip=True)
-                    break
+            elem = _select_first(soup, _LOCATION_SELS)
+            if elem:
+                location = elem.get_text(strip=True)
 
             # Fallback: extract location slug from URL path
             # URL format: /detail/{prodej|pronajem}/{type}/{location-slug}/{id}/
@@ -261,44 +516,41 @@ class IdnesRealityScraper:
 
             location = location or "Znojmo"
 
-            # Determine property type from URL (IDNES uses English slugs)
-            # URL segments: /dum/, /byt/, /pozemek/, /chata/, /komercni-nemovitost/, etc.
-            url_lower = url.lower()
-            property_type = "Other"
-            if "/byt/" in url_lower or "/byt-" in url_lower:
-                property_type = "Apartment"
-            elif "/dum/" in url_lower or "/dum-" in url_lower or "/domy/" in url_lower:
-                property_type = "House"
-            elif "/pozemek/" in url_lower or "/pozemek-" in url_lower:
-                property_type = "Land"
-            elif "/chata/" in url_lower or "/chalupa/" in url_lower or "/chata-" in url_lower:
-                property_type = "Cottage"
-            elif "/komercni" in url_lower or "/komerci" in url_lower:
-                property_type = "Commercial"
-            elif "/garaz/" in url_lower or "/garaz-" in url_lower:
-                property_type = "Garage"
+            # Determine property type from URL path segments (IDNES: /dum/, /byt-3kk/, /komercni-nemovitost/ …)
+            # Slovníkový lookup podle prefixu segmentu, priorita typů jako dřív
+            segments = url.lower().split("/")
+            found_types = {_PROPERTY_TYPE_BY_SEGMENT.get(seg.split("-", 1)[0]) for seg in segments}
+            property_type = next((t for t in _PROPERTY_TYPE_PRIORITY if t in found_types), "Other")
 
             # Offer type from URL
-            offer_type = "Rent" if "/pronajem/" in url_lower else "Sale"
+            offer_type = "Rent" if "pronajem" in segments else "Sale"
 
             # Extract photos - IDNES: plain <img> without class, src from sta-reality2.1gr.cz
-            photos = []
+            # Dedup přes set, sběr končí po MAX_PHOTOS unikátních fotkách
+            photos: List[str] = []
+            seen_photos: set = set()
             for img in soup.find_all("img"):
                 src = img.get("src") or img.get("data-src") or img.get("data-lazy") or ""
                 # Photos are served from sta-reality2.1gr.cz or iDnes CDN
-                if ("1gr.cz/sta/compile" in src or "gallery" in src.lower() or "photo" in src.lower()
-                        or ("idnes" in src.lower() and "/sta/" in src)):
+                src_lower = src.lower()
+                if ("1gr.cz/sta/compile" in src or "gallery" in src_lower or "photo" in src_lower
+                        or ("idnes" in src_lower and "/sta/" in src)):
                     if src.startswith("//"):
                         src = "https:" + src
-                    if src.startswith("http") and src not in photos:
+                    if src.startswith("http") and src not in seen_photos:
+                        seen_photos.add(src)
                         photos.append(src)
+                        if len(photos) >= MAX_PHOTOS:
+                            break
             # Fallback: og:image
             if not photos:
                 for og in soup.find_all("meta", property="og:image"):
                     content = og.get("content")
-                    if content:
+                    if content and content not in seen_photos:
+                        seen_photos.add(content)
                         photos.append(content)
-            photos = list(dict.fromkeys(photos))[:50]  # deduplicate, max 50
+                        if len(photos) >= MAX_PHOTOS:
+                            break
 
             # Extract description - IDNES uses different selectors per property type:
             # Residential: .b-detail__desc / .b-detail__text
@@ -306,11 +558,9 @@ class IdnesRealityScraper:
             # Fallback 1: og:description meta tag (reliable, always 150-300 chars)
             # Fallback 2: long <p> paragraph (last resort, skip SEO navigation text)
             description = ""
-            for sel in [".b-detail__desc", ".b-detail__text", ".b-desc", "[itemprop='description']"]:
-                elem = soup.select_one(sel)
-                if elem:
-                    description = elem.get_text(strip=True)
-                    break
+            elem = _select_first(soup, _DESCRIPTION_SELS)
+            if elem:
+                description = elem.get_text(strip=True)
             # Fallback 1: og:description / meta description (reliable summary)
             if not description:
                 meta = soup.find("meta", attrs={"property": "og:description"}) or \
@@ -321,7 +571,7 @@ class IdnesRealityScraper:
                         description = content
             # Fallback 2: long <p> paragraph – skip SEO navigation text (repetitive patterns)
             if not description:
-                for p in soup.select("p"):
+                for p in _PARAGRAPH_SEL.select(soup):
                     t = p.get_text(" ", strip=True)
                     # 100–2000 chars, not navigation/legal text
                     if (100 < len(t) < 2000
@@ -337,9 +587,9 @@ class IdnesRealityScraper:
             # Extract area - look in table params or title
             area = None
             # Try to find in spec table (IDNES uses .b-detail__info table)
-            for row in soup.select(".b-detail__info-item, .b-detail__param"):
+            for row in _AREA_ROW_SEL.select(soup):
                 text = row.get_text(" ", strip=True)
-                area_match = re.search(r"Plocha\D+?(\d+)\s*m", text, re.IGNORECASE)
+                area_match = _AREA_ROW_RE.search(text)
                 if area_match:
                     try:
                         area = int(area_match.group(1))
@@ -348,7 +598,7 @@ class IdnesRealityScraper:
                         pass
             # Fallback: extract area from title (e.g. "Prodej domu 120 m²")
             if not area:
-                title_area = re.search(r"(\d+)\s*m[²2]", title)
+                title_area = _AREA_TITLE_RE.search(title)
                 if title_area:
                     try:
                         area = int(title_area.group(1))
@@ -357,8 +607,8 @@ class IdnesRealityScraper:
 
             # Return normalized data
             return {
-                "source_code": self.SOURCE_CODE,
-                "external_id": self._extract_external_id(url),
+                "source_code": IdnesRealityScraper.SOURCE_CODE,
+                "external_id": IdnesRealityScraper._extract_external_id(url),
                 "url": url,
                 "title": title[:200],
                 "description": description[:5000],
@@ -366,7 +616,7 @@ class IdnesRealityScraper:
                 "offer_type": offer_type,
                 "price": price,
                 "location_text": location[:200] if location else "Znojmo",
-                "photos": photos[:50],
+                "photos": photos,
                 "area_built_up": area,
             }
 
@@ -385,13 +635,40 @@ class IdnesRealityScraper:
         # Strip trailing slash, take last path segment
         return url.rstrip("/").split("/")[-1]
 
-    async def _save_listing(self, listing: Dict[str, Any]) -> None:
-        """Save listing to database."""
+    async def _flush_batch(self, batch: List[Dict[str, Any]], metrics: Any) -> int:
+        """Uloží dávku listingů jedním bulk upsertem; když selže, ukládá po jednom.
+
+        Vrací počet uložených listingů (včetně vyloučených filtry) – stejně jako
+        dřív per-listing upsert; runner podle nuly rozhoduje o deaktivaci.
+        """
         db = get_db_manager()
-        listing_id = await db.upsert_listing(listing)
-        logger.info(
-            "Saved listing %s: %s | %s Kč",
-            listing_id,
-            listing.get("title", "N/A")[:50],
-            listing.get("price", "N/A"),
-        )
+        try:
+            saved = await db.upsert_listings_bulk(batch)
+        except Exception as exc:
+            logger.warning(f"Error saving batch of {len(batch)} listings ({exc}), retrying one by one")
+            count = 0
+            for listing in batch:
+                try:
+                    await db.upsert_listing(listing)
+                    count += 1
+                    metrics.increment_scraped()
+                except Exception as row_exc:
+                    logger.error(f"Error saving listing {listing.get('url')}: {row_exc}")
+                    metrics.increment_failed()
+            return count
+
+        logger.info("Saved batch: %d/%d listings", saved, len(batch))
+        for _ in batch:
+            metrics.increment_scraped()
+        return len(batch)
+
+    async def _touch_seen(self, external_ids: List[str], label: str) -> int:
+        """Označí inzeráty bez nového uložení (304, známé) jako viděné; vrací jejich počet."""
+        try:
+            touched = await get_db_manager().touch_listings_seen(self.SOURCE_CODE, external_ids)
+        except Exception as exc:
+            logger.error(f"Error touching {len(external_ids)} listings ({label}): {exc}")
+            return 0
+
+        logger.info(f"{label}: {touched}/{len(external_ids)} listings marked as seen")
+        return len(external_ids)
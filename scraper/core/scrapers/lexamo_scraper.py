@@ -3,21 +3,26 @@ Lexamo scraper – lexamo.cz
 Realitní kancelář Jihomoravský kraj / Znojemsko
 Webflow SSR – httpx + BeautifulSoup
 """
+import asyncio
 import logging
 import re
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 from urllib.parse import urljoin, urlencode
 
 import httpx
-from bs4 import BeautifulSoup
+import soupsieve as sv
+from bs4 import BeautifulSoup, Tag
 
 from ..database import get_db_manager
-from ..http_utils import http_retry
+from ..http_utils import RateLimiter, get_shared_transport, http_retry
 
 logger = logging.getLogger(__name__)
 
 BASE_URL = "https://www.lexamo.cz"
 LISTINGS_URL = f"{BASE_URL}/"
+UPSERT_BATCH_SIZE = 50
+# Pool ≥ detail_concurrency; HTTP/2 multiplexuje souběžné detaily přes jedno spojení
+CLIENT_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=16, keepalive_expiry=30)
 
 HEADERS = {
     "User-Agent": (
@@ -58,10 +63,38 @@ PROPERTY_TYPE_MAP = {
     "rekreace": "Cottage",
 }
 
+# Klíčová slova map v jedné alternaci – jeden průchod textem místo `in` pro každý klíč.
+# Při více shodách vyhrává klíč dřívější v mapě (pořadí dict = priorita, jako dřív smyčka).
+_OFFER_KEYWORD_RE = re.compile("|".join(re.escape(k) for k in OFFER_TYPE_MAP))
+_OFFER_KEYWORD_RANK = {k: i for i, k in enumerate(OFFER_TYPE_MAP)}
+_PROPERTY_KEYWORD_RE = re.compile("|".join(re.escape(k) for k in PROPERTY_TYPE_MAP))
+_PROPERTY_KEYWORD_RANK = {k: i for i, k in enumerate(PROPERTY_TYPE_MAP)}
+
+_ID_RE = re.compile(r"-(\d+)/?$")
+_HEADING_TAGS = ("h1", "h2", "h3", "h4")
+# Vše, co detail čte po elementech (nadpisy, odstavce, fotky) – jeden průchod stromem
+_DETAIL_TAGS = _HEADING_TAGS + ("p", "img")
+_DIGIT_RE = re.compile(r"\d")
+_NON_DIGIT_RE = re.compile(r"[^\d]")
+_OFFER_RE = re.compile(r"prodej|pronájem", re.I)
+_LOC_RE = re.compile(r"Znojmo|Morašice|Jaroslavice|Višňové|Hevlín|Přítluky", re.I)
+_SVG_RE = re.compile(r"\.(svg)$", re.I)
+# Parametry plochy – "Užitná plocha → 175 m²", "Celková plocha → 2.059 m²"; všechny labely v jedné alternaci
+_AREA_PARAM_KEYS = {"užitná plocha": "uzitna_plocha", "celková plocha": "celkova_plocha"}
+_AREA_PARAM_RE = re.compile(r"(Užitná plocha|Celková plocha)\s+([0-9][0-9\s,.]*)\s*m[²2]?", re.I)
+
+# CSS selektory předkompilované přes soupsieve (list + detail)
+_LISTING_LINK_SEL = sv.compile("a[href*='/realman-listing/']")
+
 
 class LexamoScraper:
     SOURCE_CODE = "LEXAMO"
 
+    def __init__(self, detail_concurrency: int = 8, max_requests_per_second: float = 4.0):
+        self.detail_concurrency = detail_concurrency
+        # Zdvořilostní limit na lexamo.cz při souběžném stahování detailů
+        self._rate_limiter = RateLimiter(max_per_second=max_requests_per_second)
+
     async def run(self, full_rescan: bool = False) -> int:
         """Run the scraper and return count of processed listings."""
         logger.info(f"[{self.SOURCE_CODE}] Starting scrape (full_rescan={full_rescan})")
@@ -73,21 +106,49 @@ class LexamoScraper:
 
     async def scrape(self) -> int:
         """Fetch listings from homepage (and further pages), then scrape details."""
-        async with httpx.AsyncClient(headers=HEADERS, follow_redirects=True, timeout=30) as client:
+        async with httpx.AsyncClient(
+            headers=HEADERS,
+            follow_redirects=True,
+            timeout=httpx.Timeout(30.0, connect=10.0),
+            http2=True,
+            limits=CLIENT_LIMITS,
+            transport=get_shared_transport(),
+        ) as client:
             detail_urls = await self._get_listing_urls(client)
             logger.info(f"[{self.SOURCE_CODE}] Found {len(detail_urls)} listings")
 
+            # Detaily se stahují souběžně (omezeno semaforem a rate limitem), ukládají se postupně;
+            # známé detaily podmíněným GETem – nezměněné (304) se neparsují
+            validators = await self._load_http_validators()
+            not_modified: List[str] = []
+            sem = asyncio.Semaphore(self.detail_concurrency)
+            async with asyncio.TaskGroup() as tg:
+                tasks = [
+                    tg.create_task(self._parse_detail_limited(client, url, sem, validators, not_modified))
+                    for url in detail_urls
+                ]
+
+            # Ukládání po dávkách – jeden bulk upsert místo round-tripu na každý listing
+            items = [t.result() for t in tasks if t.result()]
             count = 0
             db = get_db_manager()
-            for url in detail_urls:
+            for start in range(0, len(items), UPSERT_BATCH_SIZE):
+                batch = items[start:start + UPSERT_BATCH_SIZE]
+                try:
+                    saved = await db.upsert_listings_bulk(batch)
+                    count += len(batch)
+                    logger.debug(f"[{self.SOURCE_CODE}] Saved batch: {saved}/{len(batch)}")
+                except Exception as e:
+                    logger.warning(f"[{self.SOURCE_CODE}] Error saving batch of {len(batch)}: {e}")
+
+            # 304 Not Modified – data v DB platí, jen se posune last_seen_at
+            if not_modified:
                 try:
-                    item = await self._parse_detail(client, url)
-                    if item:
-                        await db.upsert_listing(item)
-                        count += 1
-                        logger.debug(f"[{self.SOURCE_CODE}] Saved: {item.get('title','?')}")
+                    touched = await db.touch_listings_seen(self.SOURCE_CODE, not_modified)
+                    count += len(not_modified)
+                    logger.info(f"[{self.SOURCE_CODE}] Not modified: {touched}/{len(not_modified)}")
                 except Exception as e:
-                    logger.warning(f"[{self.SOURCE_CODE}] Error parsing {url}: {e}")
+                    logger.warning(f"[{self.SOURCE_CODE}] Error touching {len(not_modified)} not-modified listings: {e}")
 
         logger.info(f"[{self.SOURCE_CODE}] Done – {count} listings saved")
         return count
@@ -96,10 +157,56 @@ class LexamoScraper:
     # Private helpers
     # ------------------------------------------------------------------
 
+    async def _load_http_validators(self) -> Dict[str, Tuple[Optional[str], Optional[str]]]:
+        """Uložené ETag / Last-Modified detailů (external_id → dvojice); bez DB prázdný dict."""
+        try:
+            return await get_db_manager().get_http_validators(self.SOURCE_CODE)
+        except Exception as e:
+            logger.warning(f"[{self.SOURCE_CODE}] Could not load HTTP validators, fetching unconditionally: {e}")
+            return {}
+
+    async def _parse_detail_limited(
+        self,
+        client: httpx.AsyncClient,
+        url: str,
+        sem: asyncio.Semaphore,
+        validators: Dict[str, Tuple[Optional[str], Optional[str]]],
+        not_modified: List[str],
+    ) -> Optional[Dict[str, Any]]:
+        """_parse_detail pod semaforem; chyby loguje a vrací None."""
+        async with sem:
+            try:
+                return await self._parse_detail(client, url, validators, not_modified)
+            except Exception as e:
+                logger.warning(f"[{self.SOURCE_CODE}] Error parsing {url}: {e}")
+                return None
+
+    @http_retry
+    async def _fetch_detail(
+        self,
+        client: httpx.AsyncClient,
+        url: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> Optional[Tuple[str, Optional[str], Optional[str]]]:
+        """Podmíněný GET detailu – (HTML, ETag, Last-Modified), nebo None při 304 Not Modified."""
+        headers: Dict[str, str] = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        async with self._rate_limiter:
+            resp = await client.get(url, headers=headers)
+        if resp.status_code == httpx.codes.NOT_MODIFIED:
+            return None
+        resp.raise_for_status()
+        return resp.text, resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+
     @http_retry
     async def _fetch(self, client: httpx.AsyncClient, url: str) -> str:
         """Stahne stránku, při 429/503 automaticky opakuje (max 3×)."""
-        resp = await client.get(url)
+        async with self._rate_limiter:
+            resp = await client.get(url)
         resp.raise_for_status()
         return resp.text
 
@@ -112,10 +219,10 @@ class LexamoScraper:
         while True:
             page_url = LISTINGS_URL if page == 1 else f"{LISTINGS_URL}?65cdb0cc_page={page}"
             html = await self._fetch(client, page_url)
-            soup = BeautifulSoup(html, "html.parser")
+            soup = BeautifulSoup(html, "lxml")
 
             new_found = False
-            for a in soup.select("a[href*='/realman-listing/']"):
+            for a in _LISTING_LINK_SEL.select(soup):
                 href = a.get("href", "").strip()
                 if not href:
                     continue
@@ -133,25 +240,44 @@ class LexamoScraper:
         return urls
 
     async def _parse_detail(
-        self, client: httpx.AsyncClient, url: str
+        self,
+        client: httpx.AsyncClient,
+        url: str,
+        validators: Dict[str, Tuple[Optional[str], Optional[str]]],
+        not_modified: List[str],
     ) -> Optional[Dict[str, Any]]:
-        """Fetch and parse a single property detail page."""
-        html = await self._fetch(client, url)
-        soup = BeautifulSoup(html, "html.parser")
-
+        """Fetch and parse a single property detail page (304 → external_id do not_modified, None)."""
         # External ID = numeric suffix at end of URL slug
-        id_match = re.search(r"-(\d+)/?$", url)
+        id_match = _ID_RE.search(url)
         external_id = id_match.group(1) if id_match else url
 
+        fetched = await self._fetch_detail(client, url, *validators.get(external_id, (None, None)))
+        if fetched is None:
+            not_modified.append(external_id)
+            return None
+        html, etag, last_modified = fetched
+        soup = BeautifulSoup(html, "lxml")
+
+        # Jeden průchod stromem, rozdělení podle tagu; texty nadpisů sdílí titulek, cena i lokalita
+        headings: List[str] = []
+        paragraphs: List[Tag] = []
+        images: List[Tag] = []
+        for tag in soup.find_all(_DETAIL_TAGS):
+            if tag.name == "p":
+                paragraphs.append(tag)
+            elif tag.name == "img":
+                images.append(tag)
+            else:
+                headings.append(tag.get_text(strip=True))
+
         # Title – find first substantial heading that is not a price and not a location stub
         title = ""
-        for tag in soup.find_all(re.compile(r"^h[1-4]$")):
-            txt = tag.get_text(strip=True)
+        for txt in headings:
             # Skip price headings (contain Kč) and very short texts
             if "Kč" in txt or len(txt) < 15:
                 continue
             # Skip headings that are pure numbers or start with a digit (e.g. area values)
-            if re.match(r"^\d", txt):
+            if _DIGIT_RE.match(txt):
                 continue
             title = txt
             break
@@ -167,20 +293,20 @@ class LexamoScraper:
         property_type = self._detect_property_type(title, url)
 
         # Price
-        price = self._extract_price(soup)
+        price = self._extract_price(headings)
 
         # Location text – heading after the title heading
-        location = self._extract_location(soup, title)
+        location = self._extract_location(soup, headings, title)
 
         # Parameters (Užitná plocha, Celková plocha, …)
         params = self._extract_params(soup)
         area = params.get("uzitna_plocha") or params.get("celkova_plocha")
 
         # Description
-        description = self._extract_description(soup)
+        description = self._extract_description(paragraphs)
 
         # Photos
-        photos = self._extract_photos(soup)
+        photos = self._extract_photos(images)
 
         return {
             "source_code": self.SOURCE_CODE,
@@ -194,6 +320,8 @@ class LexamoScraper:
             "area": area,
             "location_text": location,
             "photos": photos,
+            "etag": etag,
+            "last_modified": last_modified,
         }
 
     # ------------------------------------------------------------------
@@ -203,42 +331,40 @@ class LexamoScraper:
     def _detect_offer_type(self, title: str, url: str = "") -> str:
         # Check URL first (most reliable for LEXAMO)
         combined = (url + " " + title).lower()
-        for keyword, otype in OFFER_TYPE_MAP.items():
-            if keyword in combined:
-                return otype
+        found = _OFFER_KEYWORD_RE.findall(combined)
+        if found:
+            return OFFER_TYPE_MAP[min(found, key=_OFFER_KEYWORD_RANK.__getitem__)]
         return "Sale"
 
     def _detect_property_type(self, title: str, url: str) -> str:
         text = (title + " " + url).lower()
-        for keyword, ptype in PROPERTY_TYPE_MAP.items():
-            if keyword in text:
-                return ptype
+        found = _PROPERTY_KEYWORD_RE.findall(text)
+        if found:
+            return PROPERTY_TYPE_MAP[min(found, key=_PROPERTY_KEYWORD_RANK.__getitem__)]
         return "Other"
 
-    def _extract_price(self, soup: BeautifulSoup) -> Optional[float]:
-        """Extract price from heading or paragraph containing Kč."""
-        for tag in soup.find_all(re.compile(r"^h[1-4]$")):
-            txt = tag.get_text(strip=True)
-            if "Kč" in txt and re.search(r"\d", txt):
-                nums = re.sub(r"[^\d]", "", txt)
+    def _extract_price(self, headings: List[str]) -> Optional[float]:
+        """Extract price from the first heading containing Kč."""
+        for txt in headings:
+            if "Kč" in txt and _DIGIT_RE.search(txt):
+                nums = _NON_DIGIT_RE.sub("", txt)
                 if nums and int(nums) > 1000:
                     return float(int(nums))
         return None
 
-    def _extract_location(self, soup: BeautifulSoup, title: str) -> str:
+    def _extract_location(self, soup: BeautifulSoup, headings: List[str], title: str) -> str:
         """Find location – typically a sibling heading after the title heading."""
-        headings = soup.find_all(re.compile(r"^h[1-4]$"))
-        for i, tag in enumerate(headings):
-            if tag.get_text(strip=True) == title:
+        for i, txt in enumerate(headings):
+            if txt == title:
                 # Next heading sibling is usually the location
                 for j in range(i + 1, min(i + 4, len(headings))):
-                    loc = headings[j].get_text(strip=True)
+                    loc = headings[j]
                     # Location should be a short city/street name, not price or title
-                    if loc and "Kč" not in loc and len(loc) < 80 and not re.search(r"prodej|pronájem", loc, re.I):
+                    if loc and "Kč" not in loc and len(loc) < 80 and not _OFFER_RE.search(loc):
                         return loc
                 break
         # Fallback: find something that looks like a Czech city
-        for el in soup.find_all(string=re.compile(r"Znojmo|Morašice|Jaroslavice|Višňové|Hevlín|Přítluky", re.I)):
+        for el in soup.find_all(string=_LOC_RE):
             txt = el.strip()
             if 2 < len(txt) < 60:
                 return txt
@@ -248,42 +374,41 @@ class LexamoScraper:
         """Extract parameter table values (area etc.)."""
         params: Dict[str, Optional[float]] = {}
 
-        # Pattern: label text followed by value text
-        # "Užitná plocha → 175 m²" or "Celková plocha → 2.059 m²"
-        full_text = soup.get_text(" ", strip=False)
+        # Pattern: label text followed by value text – text stránky jednou, jeden průchod regexem
+        full_text = soup.get_text(" ", strip=True)
 
-        for label, key in [("Užitná plocha", "uzitna_plocha"), ("Celková plocha", "celkova_plocha")]:
-            m = re.search(rf"{label}\s*[\n\r\s]+([0-9][0-9\s,.]*)\s*m[²2]?", full_text, re.I)
-            if m:
-                raw = re.sub(r"[\s\xa0]", "", m.group(1)).replace(",", ".").replace(".", "", m.group(1).count(".") - 1 if "." in m.group(1) else 0)
-                try:
-                    # Clean number: remove spaces, handle Czech style "2.059" as 2059
-                    clean = re.sub(r"[^\d]", "", m.group(1))
-                    params[key] = float(clean) if clean else None
-                except ValueError:
-                    pass
+        for m in _AREA_PARAM_RE.finditer(full_text):
+            # Platí první výskyt labelu (jako dřív re.search per label)
+            key = _AREA_PARAM_KEYS[m.group(1).lower()]
+            if key not in params:
+                # Clean number: remove spaces, handle Czech style "2.059" as 2059
+                clean = _NON_DIGIT_RE.sub("", m.group(2))
+                params[key] = float(clean) if clean else None
 
         return params
 
-    def _extract_description(self, soup: BeautifulSoup) -> str:
+    def _extract_description(self, paragraphs: List[Tag]) -> str:
         """Get the main description paragraphs."""
-        paragraphs = []
-        for p in soup.select("p"):
+        texts = []
+        for p in paragraphs:
             txt = p.get_text(" ", strip=True)
             if len(txt) > 80:
-                paragraphs.append(txt)
-        return "\n\n".join(paragraphs[:8]) if paragraphs else ""
+                texts.append(txt)
+        return "\n\n".join(texts[:8]) if texts else ""
 
-    def _extract_photos(self, soup: BeautifulSoup) -> List[str]:
+    def _extract_photos(self, images: List[Tag]) -> List[str]:
         """Extract full-size Webflow CDN photo URLs."""
         photos = []
         seen: set = set()
-        for img in soup.select("img[src*='website-files.com']"):
-            src = img.get("src", "").strip()
-            if not src or src in seen:
+        for img in images:
+            src = img.get("src", "")
+            if "website-files.com" not in src:
+                continue
+            src = src.strip()
+            if src in seen:
                 continue
             # Skip icons and tiny thumbnails (SVG icons, logos)
-            if re.search(r"\.(svg)$", src, re.I):
+            if _SVG_RE.search(src):
                 continue
             # Skip very small or icon-like images by their path
             if "icon" in src.lower() or "logo" in src.lower():
@@ -17,11 +17,12 @@ from typing import Any, Dict, List, Optional, Tuple
 from urllib.parse import urljoin
 
 import httpx
+import soupsieve as sv
 from bs4 import BeautifulSoup
 
 from ..utils import timer, scraper_metrics_context
 from ..database import get_db_manager
-from ..http_utils import http_retry
+from ..http_utils import RateLimiter, get_shared_transport, http_retry
 
 logger = logging.getLogger(__name__)
 
@@ -61,6 +62,9 @@ DEFAULT_SEARCH_CONFIGS = [
     },
 ]
 
+# Pool ≥ detail_concurrency, aby semafor nečekal na volné spojení
+CLIENT_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=16, keepalive_expiry=30)
+
 DEFAULT_HEADERS = {
     "User-Agent": (
         "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
@@ -71,6 +75,39 @@ DEFAULT_HEADERS = {
     "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
 }
 
+_HREF_ID_RE = re.compile(r"/nemovitosti/(\d+)")
+_PRICE_TEXT_RE = re.compile(r"Kc|Kč")
+_KC_RE = re.compile("Kč")
+_PRICE_AMOUNT_RE = re.compile(r"\d[\d\s]*Kč")
+_DIGIT_RE = re.compile(r"\d")
+# Vše kromě desítkových číslic – na rozdíl od str.isdigit() maže i horní indexy ("m²")
+_NON_DIGIT_RE = re.compile(r"\D+")
+_PAGE_PARAM_RE = re.compile(r"page=(\d+)")
+# SSR JSON výpisu přímo z HTML – atribut :ssr / v-bind:ssr elementu <vue-property-list-grid>
+_SSR_ATTR_RE = re.compile(
+    r"<vue-property-list-grid\b[^>]*?\s(?::|v-bind:)ssr=(?:\"([^\"]*)\"|'([^']*)')", re.I
+)
+# Fotky: CDN medium2 (2024+), medium, legacy UUID soubory
+_PHOTO_MEDIUM2_RE = re.compile(r"https://cdn\.mmreality\.cz/medium2/offer/[^\s\"'<>]+\.jpe?g")
+_PHOTO_MEDIUM_RE = re.compile(r"https://cdn\.mmreality\.cz/medium/offer/[^\s\"'<>]+\.jpe?g")
+_UUID_JPG_RE = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\.jpe?g")
+# Souřadnice z Leaflet mapy
+_MARKER_RE = re.compile(r"L\.marker\(\[([0-9.]+),\s*([0-9.]+)\]\)")
+_SET_VIEW_RE = re.compile(r"setView\(\[([0-9.]+),\s*([0-9.]+)\]")
+
+# Předkompilované CSS selektory (soupsieve) – parsují se jednou při importu, ne pro každou stránku
+_SSR_GRID_SEL = sv.compile("vue-property-list-grid")
+_CARD_SEL = sv.compile("a[data-card-id]")
+_PAGINATION_LINK_SEL = sv.compile(
+    "nav[aria-label*='pagination'] a, [class*='pagination'] a, [class*='pager'] a"
+)
+_CURRENT_PAGE_SEL = sv.compile("[aria-current='page'], [class*='active']")
+_PAGE_LINK_SEL = sv.compile("a[href*='page=']")
+_PRICE_CONTAINER_SEL = sv.compile(".price, .offer-price, [class*='price']")
+_DESCRIPTION_SEL = sv.compile(".description p, article p, main p")
+_PARAM_PAIR_SEL = sv.compile("[data-label][data-value]")
+_BREADCRUMB_SEL = sv.compile("nav[aria-label='breadcrumb'] a, ol.breadcrumb a")
+
 
 class MmRealityScraper:
     """Scraper pro MM Reality (mmreality.cz)."""
@@ -78,11 +115,21 @@ class MmRealityScraper:
     BASE_URL = "https://www.mmreality.cz"
     SOURCE_CODE = "MMR"
 
-    def __init__(self, search_configs: Optional[List[Dict[str, Any]]] = None):
+    def __init__(
+        self,
+        search_configs: Optional[List[Dict[str, Any]]] = None,
+        detail_concurrency: int = 8,
+        max_requests_per_second: float = 4.0,
+    ):
         # 🔥 Use provided search_configs or fall back to defaults
         self.search_configs = search_configs or DEFAULT_SEARCH_CONFIGS
         self.scraped_count = 0
+        self.detail_concurrency = detail_concurrency
+        # Zdvořilostní limit na mmreality.cz – nahrazuje sleep mezi detaily
+        self._rate_limiter = RateLimiter(max_per_second=max_requests_per_second)
         self._http_client: Optional[httpx.AsyncClient] = None
+        # external_id → (ETag, Last-Modified) uložené v DB – podmíněný GET detailů
+        self._http_validators: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
 
     async def run(self, full_rescan: bool = False) -> int:
         """
@@ -101,12 +148,18 @@ class MmRealityScraper:
         logger.info("Starting MM Reality scraper (max_pages=%s)", max_pages)
 
         with scraper_metrics_context() as metrics:
+            # HTTP/2 – souběžné detaily přes jedno spojení; uvnitř scrape jobu
+            # platí sdílený transport jobu (http2/limits klienta se pak ignorují)
             async with httpx.AsyncClient(
-                timeout=30,
+                timeout=httpx.Timeout(30.0, connect=10.0),
                 follow_redirects=True,
                 headers=DEFAULT_HEADERS,
+                http2=True,
+                limits=CLIENT_LIMITS,
+                transport=get_shared_transport(),
             ) as client:
                 self._http_client = client
+                self._http_validators = await self._load_http_validators()
 
                 for config in self.search_configs:
                     try:
@@ -126,6 +179,7 @@ class MmRealityScraper:
         base_url = config["url"]
         scraped = 0
         page = 1
+        sem = asyncio.Semaphore(self.detail_concurrency)
 
         while page <= max_pages:
             url = f"{base_url}?page={page}" if page > 1 else base_url
@@ -147,18 +201,21 @@ class MmRealityScraper:
 
                 logger.info("Page %s: found %s listings", page, len(items))
 
-                for item in items:
-                    try:
-                        detail_url = item["detail_url"]
-                        detail_html = await self._fetch(detail_url)
-                        normalized = self._parse_detail_page(detail_html, item, config)
-                        await self._save_listing(normalized)
-                        scraped += 1
-                        metrics.increment_scraped()
-                        await asyncio.sleep(0.5)
-                    except Exception as exc:
-                        logger.error("Error processing %s: %s", item.get("detail_url"), exc)
-                        metrics.increment_failed()
+                # Detaily paralelně pod semaforem; _process_item chyby zachytává
+                not_modified: List[str] = []
+                async with asyncio.TaskGroup() as tg:
+                    tasks = [
+                        tg.create_task(self._process_item(item, config, sem, metrics, not_modified))
+                        for item in items
+                    ]
+
+                # Celá stránka výpisu jedním bulk upsertem
+                scraped += await self._save_listings(
+                    [t.result() for t in tasks if t.result() is not None], metrics
+                )
+                # 304 Not Modified – data v DB platí, jen se posune last_seen_at
+                if not_modified:
+                    scraped += await self._touch_not_modified(not_modified)
 
                 if not has_next:
                     logger.info("No next page after %s, stopping", page)
@@ -177,34 +234,102 @@ class MmRealityScraper:
 
         return scraped
 
+    async def _process_item(
+        self,
+        item: Dict[str, Any],
+        config: Dict[str, Any],
+        sem: asyncio.Semaphore,
+        metrics: Any,
+        not_modified: List[str],
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Stáhne a naparsuje detail jedné položky výpisu pod semaforem; chyby loguje a vrací None.
+
+        Nezměněný detail (304) se neparsuje – jeho external_id přibude do not_modified.
+        """
+        async with sem:
+            try:
+                etag, last_modified = self._http_validators.get(item["external_id"], (None, None))
+                fetched = await self._fetch_detail(item["detail_url"], etag, last_modified)
+                if fetched is None:
+                    not_modified.append(item["external_id"])
+                    return None
+                detail_html, etag, last_modified = fetched
+                normalized = self._parse_detail_page(detail_html, item, config)
+                normalized["etag"] = etag
+                normalized["last_modified"] = last_modified
+                return normalized
+            except Exception as exc:
+                logger.error("Error processing %s: %s", item.get("detail_url"), exc)
+                metrics.increment_failed()
+                return None
+
+    @http_retry
+    async def _fetch_detail(
+        self, url: str, etag: Optional[str] = None, last_modified: Optional[str] = None
+    ) -> Optional[Tuple[str, Optional[str], Optional[str]]]:
+        """
+        Stáhne detail podmíněným GETem (If-None-Match / If-Modified-Since). Opakuje při 429/503.
+
+        Returns:
+            (HTML, ETag, Last-Modified), nebo None pokud server vrátil 304 Not Modified
+        """
+        if self._http_client is None:
+            raise RuntimeError("HTTP client not initialized")
+        headers: Dict[str, str] = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        async with self._rate_limiter:
+            response = await self._http_client.get(url, headers=headers)
+        if response.status_code == httpx.codes.NOT_MODIFIED:
+            return None
+        response.raise_for_status()
+        return response.text, response.headers.get("ETag"), response.headers.get("Last-Modified")
+
     @http_retry
     async def _fetch(self, url: str) -> str:
         """Stáhne HTML stránky pomocí httpx. Opakuje při 429/503."""
         if self._http_client is None:
             raise RuntimeError("HTTP client not initialized")
-        response = await self._http_client.get(url)
+        async with self._rate_limiter:
+            response = await self._http_client.get(url)
         response.raise_for_status()
         return response.text
 
     def _parse_list_page(self, html: str) -> Tuple[List[Dict[str, Any]], bool]:
-        """Parsuje listing stranku."""
-        soup = BeautifulSoup(html, "html.parser")
-        results: List[Dict[str, Any]] = []
+        """
+        Parsuje listing stranku.
+
+        SSR JSON se čte regexem z HTML – DOM se staví jen pro fallback na karty,
+        pro detekci paginace když ji neurčí metadata SSR, nebo když regex atribut nenajde.
+        """
+        soup: Optional[BeautifulSoup] = None
+        # Deduplikace rovnou při parsování – první výskyt external_id vyhrává
+        by_id: Dict[str, Dict[str, Any]] = {}
 
         ssr_data = None
-        offers_grid = soup.select_one("vue-property-list-grid")
-        if offers_grid:
-            ssr_payload = offers_grid.get(":ssr") or offers_grid.get("v-bind:ssr")
-            if ssr_payload:
-                try:
-                    ssr_data = json.loads(html_lib.unescape(ssr_payload))
-                except json.JSONDecodeError as exc:
-                    logger.warning("Failed to parse SSR payload: %s", exc)
+        ssr_payload = None
+        match = _SSR_ATTR_RE.search(html)
+        if match:
+            # Stejně jako hodnota atributu z BeautifulSoup – entity dekódované
+            ssr_payload = html_lib.unescape(match.group(1) if match.group(1) is not None else match.group(2))
+        else:
+            soup = BeautifulSoup(html, "lxml")
+            offers_grid = _SSR_GRID_SEL.select_one(soup)
+            if offers_grid:
+                ssr_payload = offers_grid.get(":ssr") or offers_grid.get("v-bind:ssr")
+        if ssr_payload:
+            try:
+                ssr_data = json.loads(html_lib.unescape(ssr_payload))
+            except json.JSONDecodeError as exc:
+                logger.warning("Failed to parse SSR payload: %s", exc)
 
         if ssr_data and ssr_data.get("offers"):
             for offer in ssr_data.get("offers", []):
                 external_id = str(offer.get("id") or "").strip()
-                if not external_id.isdigit():
+                if not external_id.isdigit() or external_id in by_id:
                     continue
 
                 detail_url = urljoin(self.BASE_URL, f"/nemovitosti/{external_id}")
@@ -219,19 +344,19 @@ class MmRealityScraper:
                 # Vždy zahrneme okres, aby prošel FilterManager (kontroluje "Znojmo" v location_text)
                 location = f"{municipality}, okres {district}" if district and district.lower() not in municipality.lower() else municipality
 
-                results.append(
-                    {
-                        "source_code": self.SOURCE_CODE,
-                        "external_id": external_id,
-                        "detail_url": detail_url,
-                        "title": title[:200],
-                        "price_text": "",
-                        "img_alt": location,
-                    }
-                )
+                by_id[external_id] = {
+                    "source_code": self.SOURCE_CODE,
+                    "external_id": external_id,
+                    "detail_url": detail_url,
+                    "title": title[:200],
+                    "price_text": "",
+                    "img_alt": location,
+                }
         else:
             # Fallback: website no longer uses #offers-list – scrape anchor tags with data-card-id
-            cards = soup.select("a[data-card-id]")
+            if soup is None:
+                soup = BeautifulSoup(html, "lxml")
+            cards = _CARD_SEL.select(soup)
             if not cards:
                 logger.warning("No property cards (a[data-card-id]) found on page")
                 return [], False
@@ -240,11 +365,13 @@ class MmRealityScraper:
                 href = card.get("href", "")
                 external_id = card.get("data-card-id", "").strip()
                 if not external_id.isdigit():
-                    match = re.search(r"/nemovitosti/(\d+)", href)
+                    match = _HREF_ID_RE.search(href)
                     if match:
                         external_id = match.group(1)
                     else:
                         continue
+                if external_id in by_id:
+                    continue
 
                 detail_url = urljoin(self.BASE_URL, f"/nemovitosti/{external_id}/")
 
@@ -252,28 +379,27 @@ class MmRealityScraper:
                 title = title_el.get_text(strip=True) if title_el else ""
 
                 price_text = ""
-                for el in card.find_all(string=re.compile(r"Kc|Kč")):
+                for el in card.find_all(string=_PRICE_TEXT_RE):
                     stripped = el.strip()
-                    if re.search(r"\d", stripped) and len(stripped) < 40:
+                    if _DIGIT_RE.search(stripped) and len(stripped) < 40:
                         price_text = stripped
                         break
 
                 first_img = card.find("img")
                 img_alt = first_img.get("alt", "") if first_img else ""
 
-                results.append(
-                    {
-                        "source_code": self.SOURCE_CODE,
-                        "external_id": external_id,
-                        "detail_url": detail_url,
-                        "title": title[:200],
-                        "price_text": price_text,
-                        "img_alt": img_alt,
-                    }
-                )
-
-        has_next = self._detect_next_page(soup)
-        if not has_next and ssr_data:
+                by_id[external_id] = {
+                    "source_code": self.SOURCE_CODE,
+                    "external_id": external_id,
+                    "detail_url": detail_url,
+                    "title": title[:200],
+                    "price_text": price_text,
+                    "img_alt": img_alt,
+                }
+
+        # Nejdřív levná kontrola z metadat SSR, paginace v DOM až když ta nestačí
+        has_next = False
+        if ssr_data:
             total = ssr_data.get("metadata", {}).get("count")
             page = ssr_data.get("page") or 1
             try:
@@ -283,22 +409,19 @@ class MmRealityScraper:
             page_size = len(ssr_data.get("offers", []))
             if isinstance(total, int) and page_size and total > page * page_size:
                 has_next = True
+        if not has_next:
+            if soup is None:
+                soup = BeautifulSoup(html, "lxml")
+            has_next = self._detect_next_page(soup)
 
-        seen: set = set()
-        unique = []
-        for item in results:
-            if item["external_id"] not in seen:
-                seen.add(item["external_id"])
-                unique.append(item)
+        unique = list(by_id.values())
 
         logger.debug("Parsed %s unique listings from page", len(unique))
         return unique, has_next
 
     def _detect_next_page(self, soup: BeautifulSoup) -> bool:
         """Detekuje pritomnost dalsi stranky paginace."""
-        pagination_links = soup.select(
-            "nav[aria-label*='pagination'] a, [class*='pagination'] a, [class*='pager'] a"
-        )
+        pagination_links = _PAGINATION_LINK_SEL.select(soup)
         for link in pagination_links:
             text = link.get_text(strip=True)
             href = link.get("href", "")
@@ -307,7 +430,7 @@ class MmRealityScraper:
                     return True
 
         page_numbers = []
-        for el in soup.select("[aria-current='page'], [class*='active']"):
+        for el in _CURRENT_PAGE_SEL.select(soup):
             try:
                 page_numbers.append(int(el.get_text(strip=True)))
             except ValueError:
@@ -315,8 +438,8 @@ class MmRealityScraper:
 
         if page_numbers:
             current = max(page_numbers)
-            for el in soup.select("a[href*='page=']"):
-                match = re.search(r"page=(\d+)", el.get("href", ""))
+            for el in _PAGE_LINK_SEL.select(soup):
+                match = _PAGE_PARAM_RE.search(el.get("href", ""))
                 if match and int(match.group(1)) > current:
                     return True
 
@@ -324,7 +447,7 @@ class MmRealityScraper:
 
     def _parse_detail_page(self, html: str, list_item: Dict[str, Any], config: Dict[str, Any]) -> Dict[str, Any]:
         """Parsuje detail stranku inzeratu."""
-        soup = BeautifulSoup(html, "html.parser")
+        soup = BeautifulSoup(html, "lxml")
 
         result: Dict[str, Any] = {
             "source_code": self.SOURCE_CODE,
@@ -351,15 +474,9 @@ class MmRealityScraper:
         if "pronajem" in title_lower or "pronájem" in title_lower:
             result["offer_type"] = "Pronájem"
 
-        price_text = ""
-        for el in soup.find_all(string=lambda t: t and "Kč" in t):
-            stripped = el.strip()
-            if re.search(r"\d", stripped) and len(stripped) < 40:
-                price_text = stripped
-                break
-        result["price"] = self._parse_price(price_text)
+        result["price"] = self._parse_price(self._extract_price_text(soup))
 
-        desc_el = soup.select_one(".description p, article p, main p")
+        desc_el = _DESCRIPTION_SEL.select_one(soup)
         result["description"] = desc_el.get_text(" ", strip=True) if desc_el else ""
 
         params = self._parse_params_section(soup)
@@ -379,6 +496,20 @@ class MmRealityScraper:
 
         return result
 
+    def _extract_price_text(self, soup: BeautifulSoup) -> str:
+        """Text ceny – nejdřív jen v cenovém kontejneru, celý dokument až jako fallback."""
+        container = _PRICE_CONTAINER_SEL.select_one(soup)
+        if container:
+            match = _PRICE_AMOUNT_RE.search(container.get_text(" ", strip=True))
+            if match:
+                return match.group(0)
+
+        for el in soup.find_all(string=_KC_RE):
+            stripped = el.strip()
+            if _DIGIT_RE.search(stripped) and len(stripped) < 40:
+                return stripped
+        return ""
+
     def _parse_params_section(self, soup: BeautifulSoup) -> Dict[str, str]:
         params: Dict[str, str] = {}
         for heading in soup.find_all(["h3", "h4"]):
@@ -401,7 +532,7 @@ class MmRealityScraper:
 
     def _parse_params_fallback(self, soup: BeautifulSoup) -> Dict[str, str]:
         params: Dict[str, str] = {}
-        pairs = soup.select("[data-label][data-value]")
+        pairs = _PARAM_PAIR_SEL.select(soup)
         for pair in pairs:
             key = pair.get("data-label", "").strip()
             val = pair.get("data-value", "").strip()
@@ -410,7 +541,7 @@ class MmRealityScraper:
         return params
 
     def _extract_location(self, soup: BeautifulSoup) -> str:
-        breadcrumb = soup.select("nav[aria-label='breadcrumb'] a, ol.breadcrumb a")
+        breadcrumb = _BREADCRUMB_SEL.select(soup)
         if breadcrumb:
             # Vrátíme celý path – "Jihomoravský > Znojmo > Bítov" → obsahuje "Znojmo"
             return " › ".join(a.get_text(strip=True) for a in breadcrumb if a.get_text(strip=True))
@@ -419,62 +550,90 @@ class MmRealityScraper:
     def _extract_photos(self, soup: BeautifulSoup, html: str) -> List[str]:
         # Nový CDN formát (2024+): https://cdn.mmreality.cz/medium2/offer/XX/YY/hash.jpg
         # Preferujeme medium2 (vyšší rozlišení), fallback na medium
-        urls: List[str] = re.findall(
-            r"https://cdn\.mmreality\.cz/medium2/offer/[^\s\"'<>]+\.jpe?g", html
-        )
+        urls: List[str] = _PHOTO_MEDIUM2_RE.findall(html)
         if not urls:
             # Fallback: starší formát nebo medium
-            urls = re.findall(
-                r"https://cdn\.mmreality\.cz/medium/offer/[^\s\"'<>]+\.jpe?g", html
-            )
+            urls = _PHOTO_MEDIUM_RE.findall(html)
         if not urls:
             # Legacy: UUID soubory z HTML (velmi starý formát)
-            pattern = r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\.jpe?g"
-            filenames = list(dict.fromkeys(re.findall(pattern, html)))
+            # Názvy souborů z celého HTML (i ze skriptů / JSON galerie), ne jen z <img>
+            filenames = list(dict.fromkeys(_UUID_JPG_RE.findall(html)))
             cdn_base = "https://www.mmreality.cz/media/"
-            img_tags = soup.find_all("img", src=True)
             if filenames:
-                for img in img_tags:
-                    src = img.get("src", "")
-                    if filenames[0] in src:
-                        idx = src.find(filenames[0])
-                        if idx > 0:
-                            cdn_base = src[:idx]
-                        break
+                # CDN prefix z prvního <img> s prvním souborem – find() končí u první shody
+                first = filenames[0]
+                img = soup.find("img", src=lambda src: src is not None and first in src)
+                if img:
+                    idx = img["src"].find(first)
+                    if idx > 0:
+                        cdn_base = img["src"][:idx]
             return [cdn_base + f for f in filenames]
 
         # Deduplikace při zachování pořadí
         return list(dict.fromkeys(urls))
 
     def _extract_coordinates(self, html: str) -> Tuple[Optional[float], Optional[float]]:
-        match = re.search(r"L\.marker\(\[([0-9.]+),\s*([0-9.]+)\]\)", html)
+        match = _MARKER_RE.search(html)
         if match:
             return float(match.group(1)), float(match.group(2))
-        match = re.search(r"setView\(\[([0-9.]+),\s*([0-9.]+)\]", html)
+        match = _SET_VIEW_RE.search(html)
         if match:
             return float(match.group(1)), float(match.group(2))
         return None, None
 
     @staticmethod
     def _parse_price(text: str) -> Optional[int]:
-        digits = "".join(c for c in text if c.isdigit())
+        digits = _NON_DIGIT_RE.sub("", text)
         return int(digits) if digits else None
 
     @staticmethod
     def _parse_area(text: str) -> Optional[int]:
-        digits = "".join(c for c in text if c.isdigit())
+        digits = _NON_DIGIT_RE.sub("", text)
         return int(digits) if digits else None
 
-    async def _save_listing(self, listing: Dict[str, Any]) -> None:
+    async def _load_http_validators(self) -> Dict[str, Tuple[Optional[str], Optional[str]]]:
+        """Načte uložené ETag / Last-Modified detailů; bez DB se stahuje nepodmíněně."""
+        try:
+            return await get_db_manager().get_http_validators(self.SOURCE_CODE)
+        except Exception as exc:
+            logger.warning("Could not load HTTP validators, fetching unconditionally: %s", exc)
+            return {}
+
+    async def _touch_not_modified(self, external_ids: List[str]) -> int:
+        """Označí nezměněné (304) inzeráty jako viděné; vrací jejich počet (0 při chybě)."""
         try:
-            db = get_db_manager()
-            listing_id = await db.upsert_listing(listing)
-            logger.info(
-                "Saved listing %s: %s | %s Kč",
-                listing_id,
-                listing.get("title", "N/A")[:50],
-                listing.get("price", "N/A"),
-            )
+            touched = await get_db_manager().touch_listings_seen(self.SOURCE_CODE, external_ids)
         except Exception as exc:
-            logger.error("Failed to save listing: %s", exc)
-            raise
+            logger.error("Failed to touch %s not-modified listings: %s", len(external_ids), exc)
+            return 0
+        logger.info("Not modified: %s/%s listings", touched, len(external_ids))
+        return len(external_ids)
+
+    async def _save_listings(self, listings: List[Dict[str, Any]], metrics: Any) -> int:
+        """Uloží listingy stránky jedním bulk upsertem; vrací počet zpracovaných.
+
+        Když bulk upsert selže, ukládá listingy po jednom – vadný listing tak
+        nestrhne zbytek stránky.
+        """
+        if not listings:
+            return 0
+        db = get_db_manager()
+        try:
+            saved = await db.upsert_listings_bulk(listings)
+        except Exception as exc:
+            logger.warning("Bulk save of %s listings failed (%s), retrying one by one", len(listings), exc)
+            count = 0
+            for listing in listings:
+                try:
+                    await db.upsert_listing(listing)
+                    count += 1
+                    metrics.increment_scraped()
+                except Exception as row_exc:
+                    logger.error("Failed to save listing %s: %s", listing.get("url"), row_exc)
+                    metrics.increment_failed()
+            return count
+
+        logger.info("Saved %s/%s listings (rest excluded by filters)", saved, len(listings))
+        for _ in listings:
+            metrics.increment_scraped()
+        return len(listings)
@@ -15,7 +15,7 @@ from bs4 import BeautifulSoup
 
 from ..utils import timer, scraper_metrics_context
 from ..database import get_db_manager
-from ..http_utils import http_retry
+from ..http_utils import get_shared_transport, http_retry
 
 logger = logging.getLogger(__name__)
 
@@ -63,6 +63,7 @@ class NemovitostiZnojmoScraper:
                 timeout=30,
                 follow_redirects=True,
                 headers=DEFAULT_HEADERS,
+                transport=get_shared_transport(),
             ) as client:
                 self._http_client = client
                 page = 1
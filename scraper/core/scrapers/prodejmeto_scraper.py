@@ -18,6 +18,7 @@ import httpx
 
 from ..utils import timer, scraper_metrics_context
 from ..database import get_db_manager
+from ..http_utils import get_shared_transport
 
 logger = logging.getLogger(__name__)
 
@@ -74,6 +75,7 @@ class ProdejmeToScraper:
                 timeout=90,
                 follow_redirects=True,
                 headers=DEFAULT_HEADERS,
+                transport=get_shared_transport(),
             ) as client:
                 self._http_client = client
 
@@ -29,7 +29,7 @@ import json as json_module
 import httpx
 from bs4 import BeautifulSoup
 
-from ..http_utils import http_retry
+from ..http_utils import get_shared_transport, http_retry
 from ..utils import timer, scraper_metrics_context
 from ..database import get_db_manager
 
@@ -118,6 +118,7 @@ class ReasScraper:
                 timeout=30,
                 follow_redirects=True,
                 headers=DEFAULT_HEADERS,
+                transport=get_shared_transport(),
             ) as client:
                 self._http_client = client
 
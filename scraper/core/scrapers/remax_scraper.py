@@ -18,7 +18,7 @@ from bs4 import BeautifulSoup
 from ..browser import get_browser_manager
 from ..utils import timer, scraper_metrics_context
 from ..database import get_db_manager
-from ..http_utils import http_retry
+from ..http_utils import get_shared_transport, http_retry
 
 logger = logging.getLogger(__name__)
 
@@ -113,7 +113,7 @@ class RemaxScraper:
         
         with scraper_metrics_context() as metrics:
             # Reuse HTTP client pro všechny requesty
-            async with httpx.AsyncClient(timeout=30, follow_redirects=True) as client:
+            async with httpx.AsyncClient(timeout=30, follow_redirects=True, transport=get_shared_transport()) as client:
                 self._http_client = client
                 
                 page = 1
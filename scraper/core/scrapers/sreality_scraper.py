@@ -17,7 +17,7 @@ import httpx
 
 from ..utils import timer, scraper_metrics_context
 from ..database import get_db_manager
-from ..http_utils import http_retry
+from ..http_utils import get_shared_transport, http_retry
 
 logger = logging.getLogger(__name__)
 
@@ -126,6 +126,7 @@ class SrealityScraper:
                 timeout=30,
                 follow_redirects=True,
                 headers=DEFAULT_HEADERS,
+                transport=get_shared_transport(),
             ) as client:
                 self._http_client = client
                 page = 1
@@ -1,14 +1,61 @@
 """
 Utility funkce pro profiling, timing a monitoring scraperů.
 """
+import multiprocessing
+import os
 import time
 import logging
-from typing import Callable, Any
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Any, Optional
 from functools import wraps
 from contextlib import contextmanager
 
 logger = logging.getLogger(__name__)
 
+# Počet procesů pro CPU-bound parsování HTML (default = počet jader)
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(os.cpu_count() or 1)))
+
+# Sdílený process pool pro parsování – vzniká lazy při prvním použití
+_parse_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _init_parse_worker(level: int, fmt: Optional[str]) -> None:
+    """Initializer workeru – spawn proces nedědí konfiguraci logování rodiče."""
+    logging.basicConfig(level=level, format=fmt or logging.BASIC_FORMAT)
+
+
+def get_parse_pool() -> ProcessPoolExecutor:
+    """
+    Vrátí sdílený ProcessPoolExecutor pro CPU-bound parsování HTML mimo event loop.
+
+    Používá "spawn" – fork procesu s běžícím event loopem / DB poolem není bezpečný.
+
+    Usage:
+        loop = asyncio.get_running_loop()
+        item = await loop.run_in_executor(get_parse_pool(), parse_fn, body, url)
+    """
+    global _parse_pool
+    if _parse_pool is None:
+        # Workery logují se stejnou úrovní a formátem jako root logger API procesu
+        root = logging.getLogger()
+        fmt = next((h.formatter._fmt for h in root.handlers if h.formatter), None)
+        _parse_pool = ProcessPoolExecutor(
+            max_workers=PARSE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_parse_worker,
+            initargs=(root.level, fmt),
+        )
+        logger.info(f"Parse process pool started ({PARSE_WORKERS} workers)")
+    return _parse_pool
+
+
+def shutdown_parse_pool() -> None:
+    """Ukončí sdílený parse pool (volá se při shutdownu aplikace)."""
+    global _parse_pool
+    if _parse_pool is not None:
+        _parse_pool.shutdown(wait=False, cancel_futures=True)
+        _parse_pool = None
+
 
 @contextmanager
 def timer(name: str, log_level: int = logging.INFO):
@@ -94,6 +94,10 @@ CREATE TABLE re_realestate.listings (
     geocoded_at timestamptz,                -- Kdy bylo geokódováno
     geocode_source text,                    -- 'scraper' | 'nominatim' | 'manual'
     
+    -- HTTP validátory poslední stažené verze detailu (podmíněné GET, 304)
+    etag text,                              -- ETag → If-None-Match
+    last_modified text,                     -- Last-Modified → If-Modified-Since
+    
     -- �🔥 PGVECTOR: Embedding popisu pro semantické vyhledávání
     description_embedding vector(1536),     -- OpenAI text-embedding-3-small
     
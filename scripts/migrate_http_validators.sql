@@ -0,0 +1,8 @@
+-- Migration: HTTP validátory detailů (podmíněné GET)
+-- Run: docker exec -i realestate-db psql -U postgres -d realestate_dev < scripts/migrate_http_validators.sql
+
+-- ETag / Last-Modified poslední stažené verze detailu – scraper je posílá
+-- jako If-None-Match / If-Modified-Since a při 304 detail znovu neparsuje
+ALTER TABLE re_realestate.listings
+    ADD COLUMN IF NOT EXISTS etag           TEXT,
+    ADD COLUMN IF NOT EXISTS last_modified  TEXT;